@@ -1,12 +1,57 @@
 from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db import connections
+from django.http import Http404
+from django.template.response import TemplateResponse
+from django.urls import path, reverse
+from django.utils.functional import cached_property
+from django.utils.html import format_html
+
+from .bulk_delete import get_progress, start_chunked_delete
 from .models import ChatMessage
 
 
+class EstimatedCountPaginator(Paginator):
+    """
+    Пагинатор, который на PostgreSQL берёт количество строк из оценки планировщика (EXPLAIN)
+    вместо COUNT(*), если оценка превышает порог.
+
+    На больших таблицах COUNT(*) читает всю таблицу, а оценка берётся из статистики мгновенно;
+    для небольших выборок количество считается точно.
+    """
+    exact_count_threshold = 10000
+
+    @cached_property
+    def count(self):
+        estimate = self.estimated_count()
+        if estimate is not None and estimate > self.exact_count_threshold:
+            return estimate
+        return super().count
+
+    def estimated_count(self):
+        """
+        Возвращает оценку количества строк выборки или None, если оценка недоступна.
+        """
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if connection.vendor != 'postgresql':
+            return None
+        sql, params = queryset.order_by().query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            plan = cursor.fetchone()[0]
+        return int(plan[0]['Plan']['Plan Rows'])
+
+
 @admin.register(ChatMessage)
 class ChatMessageAdmin(admin.ModelAdmin):
     """
     Админ-интерфейс для модели ChatMessage.
 
+    Рассчитан на десятки миллионов сообщений: пользователи загружаются тем же запросом
+    (list_select_related), количество строк оценивается без COUNT(*), фильтр по дате
+    использует индекс created_at, а удаление выполняется порциями в фоне.
+
     Поля:
         - list_display: Указывает, какие поля модели будут отображаться в списке.
         - search_fields: Определяет поля для поиска.
@@ -14,21 +59,60 @@ class ChatMessageAdmin(admin.ModelAdmin):
         - actions: Определяет список доступных кастомных действий для выбранных записей.
     """
     list_display = ('user', 'message', 'created_at')
+    list_select_related = ('user',)
     search_fields = ('user__username', 'message')
     list_filter = ('created_at',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     actions = ['delete_selected_messages']
+    # Размер порции и пауза между порциями при фоновом удалении
+    delete_chunk_size = 1000
+    delete_chunk_pause = 0.05
+
+    def get_actions(self, request):
+        actions = super().get_actions(request)
+        # Стандартное удаление загружает все объекты в память и удаляет их одной транзакцией
+        actions.pop('delete_selected', None)
+        return actions
 
-    @admin.action(description='Удалить выбранные сообщения')
+    def get_urls(self):
+        return [
+            path('delete-progress/<str:job_id>/', self.admin_site.admin_view(self.delete_progress_view),
+                 name='weather_chatmessage_delete_progress'),
+        ] + super().get_urls()
+
+    @admin.action(description='Удалить выбранные сообщения', permissions=['delete'])
     def delete_selected_messages(self, request, queryset):
         """
         Кастомное действие для удаления выбранных сообщений.
 
+        Удаление запускается в фоновом потоке порциями по delete_chunk_size записей,
+        а пользователь получает ссылку на страницу прогресса.
+
         Параметры:
             request (HttpRequest): Запрос от пользователя.
             queryset (QuerySet): Выбранные записи для удаления.
+        """
+        job_id = start_chunked_delete(queryset, chunk_size=self.delete_chunk_size, pause=self.delete_chunk_pause)
+        url = reverse('admin:weather_chatmessage_delete_progress', args=[job_id])
+        self.message_user(request, format_html('Удаление сообщений запущено в фоне. <a href="{}">Прогресс</a>', url))
 
-        После выполнения действия выводится сообщение о количестве удалённых записей.
+    def delete_progress_view(self, request, job_id):
+        """
+        Страница прогресса фонового удаления; обновляется автоматически до завершения.
         """
-        count = queryset.count()
-        queryset.delete()
-        self.message_user(request, f"Удалено {count} сообщений.")
+        progress = get_progress(job_id)
+        if progress is None:
+            raise Http404('Задача удаления не найдена.')
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': 'Удаление сообщений',
+            'progress': progress,
+            'percent': int(100 * progress['deleted'] / progress['total']) if progress['total'] else None,
+        }
+        return TemplateResponse(request, 'admin/weather/chatmessage/delete_progress.html', context)
+
+
+# Главная страница админки со ссылкой на профили медленных запросов (weather.profiling)
+admin.site.index_template = 'admin/weather/index.html'
@@ -0,0 +1,106 @@
+from django.db.models import F
+from django.utils.cache import get_conditional_response, set_response_etag
+from rest_framework.exceptions import ValidationError
+
+
+def pick_fields(data, fields):
+    """
+    Оставляет в ответе только запрошенные поля.
+
+    Поддерживаются вложенные пути через точку ('current.temp_c'). Списки обрабатываются поэлементно.
+
+    Параметры:
+        data (dict | list): Данные ответа.
+        fields (list): Запрошенные поля.
+
+    Возвращает:
+        dict | list: Данные только с запрошенными полями.
+    """
+    if isinstance(data, list):
+        return [pick_fields(item, fields) for item in data]
+    if not isinstance(data, dict):
+        return data
+
+    tree = {}
+    for field in fields:
+        head, _, rest = field.partition('.')
+        tree.setdefault(head, []).append(rest)
+
+    result = {}
+    for head, rests in tree.items():
+        if head not in data:
+            continue
+        value = data[head]
+        nested = [rest for rest in rests if rest]
+        # Если поле запрошено целиком ('current'), вложенные пути не ограничивают его
+        result[head] = pick_fields(value, nested) if nested and len(nested) == len(rests) else value
+    return result
+
+
+class SparseFieldsMixin:
+    """
+    Поддержка параметра '?fields=a,b.c' — клиент получает только нужные поля.
+    """
+    fields_query_param = 'fields'
+
+    def get_requested_fields(self):
+        """
+        Возвращает список запрошенных полей или None, если параметр не передан.
+        """
+        raw = self.request.query_params.get(self.fields_query_param, '')
+        fields = [field.strip() for field in raw.split(',') if field.strip()]
+        return fields or None
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        fields = self.get_requested_fields() if response.status_code == 200 else None
+        if fields and not getattr(self, 'fields_applied', False) and getattr(response, 'data', None) is not None:
+            response.data = pick_fields(response.data, fields)
+        return response
+
+
+class ETagMixin:
+    """
+    Добавляет ETag к успешным GET-ответам и отвечает 304, если данные не изменились.
+    """
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if request.method in ('GET', 'HEAD') and response.status_code == 200:
+            response.render()
+            set_response_etag(response)
+            return get_conditional_response(request, etag=response['ETag'], response=response)
+        return response
+
+
+class ValuesListMixin:
+    """
+    Быстрый список без сериализатора DRF: строки читаются через QuerySet.values().
+
+    Атрибуты:
+        values_fields (dict): Отображение имени поля ответа на путь в модели.
+        cursor_ordering (tuple): Порядок сортировки для курсорной пагинации.
+    """
+    values_fields = {}
+    cursor_ordering = ('-id',)
+
+    def list_values(self):
+        """
+        Возвращает страницу списка с учётом '?fields=' и курсорной пагинации.
+        """
+        fields = self.get_requested_fields() or list(self.values_fields)
+        unknown = [field for field in fields if field not in self.values_fields]
+        if unknown:
+            raise ValidationError({self.fields_query_param: f"Неизвестные поля: {', '.join(unknown)}."})
+
+        # Поле сортировки нужно пагинатору для построения курсора, даже если клиент его не запросил
+        order_field = self.cursor_ordering[0].lstrip('-')
+        selected = dict.fromkeys(fields + [order_field])
+        plain = [name for name in selected if self.values_fields[name] == name]
+        expressions = {name: F(self.values_fields[name]) for name in selected if self.values_fields[name] != name}
+
+        rows = self.paginate_queryset(self.get_queryset().values(*plain, **expressions))
+        if order_field not in fields:
+            rows = [{name: row[name] for name in fields} for row in rows]
+        self.fields_applied = True
+        return self.get_paginated_response(rows)
@@ -0,0 +1,15 @@
+from rest_framework.pagination import CursorPagination
+
+
+class ViewCursorPagination(CursorPagination):
+    """
+    Курсорная пагинация, порядок сортировки для которой задаётся атрибутом представления 'cursor_ordering'.
+
+    Работает как с объектами моделей, так и со словарями из QuerySet.values().
+    """
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+    def get_ordering(self, request, queryset, view):
+        return getattr(view, 'cursor_ordering', None) or super().get_ordering(request, queryset, view)
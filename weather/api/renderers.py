@@ -0,0 +1,39 @@
+import json
+from decimal import Decimal
+
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils import encoders
+
+try:
+    import orjson
+except ImportError:  # orjson не установлен — используем стандартный json
+    orjson = None
+
+
+def _default(obj):
+    """
+    Сериализует типы, которые orjson не поддерживает напрямую (Decimal, ленивые строки и т.п.).
+    """
+    if isinstance(obj, Decimal):
+        return float(obj)
+    return encoders.JSONEncoder().default(obj)
+
+
+class FastJSONRenderer(BaseRenderer):
+    """
+    JSON-рендерер API на базе orjson.
+
+    Если orjson недоступен, используется стандартный json с компактными разделителями.
+    """
+    media_type = 'application/json'
+    format = 'json'
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if orjson is not None:
+            return orjson.dumps(data, default=_default, option=orjson.OPT_NON_STR_KEYS)
+        return json.dumps(
+            data, cls=encoders.JSONEncoder, ensure_ascii=False, separators=(',', ':')
+        ).encode('utf-8')
@@ -0,0 +1,45 @@
+from rest_framework import serializers
+
+from weather.models import ChatMessage, FavoriteCity, SearchStatistic
+
+
+class FavoriteCitySerializer(serializers.ModelSerializer):
+    """
+    Сериализатор избранного города для создания, чтения и изменения через API.
+    """
+
+    class Meta:
+        model = FavoriteCity
+        fields = ['id', 'city_name']
+
+    def validate_city_name(self, value):
+        """
+        Проверяет, что название города не пустое после удаления пробелов.
+        """
+        value = value.strip()
+        if not value:
+            raise serializers.ValidationError("Некорректное имя города.")
+        return value
+
+
+class ChatMessageSerializer(serializers.ModelSerializer):
+    """
+    Описание сообщения чата для схемы API.
+
+    Сам список строится через QuerySet.values() без сериализатора (см. ValuesListMixin).
+    """
+    username = serializers.CharField(source='user.username', read_only=True)
+
+    class Meta:
+        model = ChatMessage
+        fields = ['id', 'username', 'message', 'created_at']
+
+
+class SearchStatisticSerializer(serializers.ModelSerializer):
+    """
+    Описание статистики поиска по городу для схемы API.
+    """
+
+    class Meta:
+        model = SearchStatistic
+        fields = ['city_name', 'search_count']
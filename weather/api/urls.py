@@ -0,0 +1,31 @@
+from django.urls import path
+
+from weather.lazy import LazyView
+
+"""
+Маршруты REST API версии 1 (подключаются с префиксом 'api/v1/').
+
+- 'weather/' и 'forecast/' возвращают текущую погоду и прогноз для города.
+- 'forecast/hourly/' возвращает почасовой ряд прогноза для графика, прореженный до заданного числа точек.
+- 'favorites/' и 'favorites/<id>/' позволяют управлять избранными городами.
+- 'chat/' возвращает историю сообщений чата.
+- 'stats/' и 'stats/cities/' возвращают статистику поисковых запросов.
+- 'cities/autocomplete/' и 'cities/canonical/' работают по встроенному индексу городов.
+
+Все списки используют курсорную пагинацию, все ответы поддерживают '?fields=' и ETag.
+DRF и представления импортируются при первом обращении к API, а не при старте воркера.
+"""
+app_name = 'api'
+
+urlpatterns = [
+    path('weather/', LazyView('weather.api.views.CurrentWeatherView'), name='weather'),
+    path('forecast/', LazyView('weather.api.views.ForecastView'), name='forecast'),
+    path('forecast/hourly/', LazyView('weather.api.views.HourlyChartView'), name='forecast-hourly'),
+    path('favorites/', LazyView('weather.api.views.FavoriteCityListView'), name='favorites'),
+    path('favorites/<int:pk>/', LazyView('weather.api.views.FavoriteCityDetailView'), name='favorite-detail'),
+    path('chat/', LazyView('weather.api.views.ChatHistoryView'), name='chat'),
+    path('stats/', LazyView('weather.api.views.StatisticsView'), name='stats'),
+    path('stats/cities/', LazyView('weather.api.views.CityStatisticsListView'), name='stats-cities'),
+    path('cities/autocomplete/', LazyView('weather.api.views.CityAutocompleteView'), name='city-autocomplete'),
+    path('cities/canonical/', LazyView('weather.api.views.CanonicalCityView'), name='city-canonical'),
+]
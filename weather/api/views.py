@@ -0,0 +1,255 @@
+from rest_framework import generics, status
+from rest_framework.exceptions import APIException, NotFound, ValidationError
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from weather import charts, services
+from weather.cities import get_city_index
+from weather.geo import parse_coordinates
+from weather.models import ChatMessage, FavoriteCity, SearchStatistic
+
+from .mixins import ETagMixin, SparseFieldsMixin, ValuesListMixin
+from .pagination import ViewCursorPagination
+from .serializers import ChatMessageSerializer, FavoriteCitySerializer, SearchStatisticSerializer
+
+
+class UpstreamUnavailable(APIException):
+    """
+    Внешний погодный API недоступен или вернул ошибку.
+    """
+    status_code = status.HTTP_502_BAD_GATEWAY
+    default_detail = 'Не удалось получить данные о погоде. Пожалуйста, попробуйте снова.'
+    default_code = 'upstream_unavailable'
+
+
+def get_city_param(request):
+    """
+    Возвращает обязательный параметр 'city' из строки запроса.
+    """
+    city = request.query_params.get('city', '').strip()
+    if not city:
+        raise ValidationError({'city': 'Обязательный параметр.'})
+    return city
+
+
+class CurrentWeatherView(ETagMixin, SparseFieldsMixin, APIView):
+    """
+    Текущая погода для города или для точки.
+
+    Параметры запроса:
+        city (str): Название города.
+        lat, lon (float): Координаты вместо города: отдаются данные ближайшего города с погодой
+            в кэше в радиусе NEARBY_RADIUS_KM, а блок 'nearest' ответа называет этот город.
+        fields (str): Необязательный список полей через запятую, например 'location.name,current.temp_c'.
+    """
+
+    def get(self, request):
+        if 'lat' in request.query_params or 'lon' in request.query_params:
+            return self.get_near(request)
+        city = get_city_param(request)
+        try:
+            data, canonical = services.get_current_weather(city)
+        except services.InvalidLocationError:
+            raise NotFound('Город не найден.')
+        except services.WeatherServiceError:
+            raise UpstreamUnavailable()
+        services.record_search(canonical.name)
+        return Response(data)
+
+    def get_near(self, request):
+        try:
+            lat, lon = parse_coordinates(request.query_params.get('lat'), request.query_params.get('lon'))
+        except (TypeError, ValueError):
+            raise ValidationError({'lat': 'Ожидаются lat от -90 до 90 и lon от -180 до 180.'})
+        try:
+            data, canonical, distance = services.get_weather_near(lat, lon)
+        except services.WeatherServiceError:
+            raise UpstreamUnavailable()
+        nearest = {'id': canonical.id, 'name': canonical.name, 'distance_km': round(distance, 1)}
+        return Response(dict(data, nearest=nearest))  # Ответ из кэша общий: не изменяем его
+
+
+class ForecastView(ETagMixin, SparseFieldsMixin, APIView):
+    """
+    Прогноз погоды для города.
+
+    Параметры запроса:
+        city (str): Название города.
+        days (int): Количество дней прогноза от 1 до 7, по умолчанию 7.
+        fields (str): Необязательный список полей через запятую.
+    """
+
+    def get(self, request):
+        city = get_city_param(request)
+        try:
+            days = int(request.query_params.get('days', 7))
+        except ValueError:
+            days = 0
+        if not 1 <= days <= 7:
+            raise ValidationError({'days': 'Ожидается целое число от 1 до 7.'})
+
+        try:
+            data, canonical = services.get_forecast(city, days=days)
+        except services.InvalidLocationError:
+            raise NotFound('Город не найден.')
+        except services.WeatherServiceError:
+            raise UpstreamUnavailable()
+        return Response(data)
+
+
+class HourlyChartView(ETagMixin, SparseFieldsMixin, APIView):
+    """
+    Почасовой ряд семидневного прогноза для графика: столбцы массивов, прореженные на сервере.
+
+    Параметры запроса:
+        city (str): Название города.
+        points (int): Количество точек от 3 до 168, по умолчанию 48.
+        method (str): 'lttb' (форма кривой, по умолчанию) или 'minmax' (экстремумы).
+        by (str): Столбец, по которому выбираются точки: 'temp_c' (по умолчанию), 'precip_mm' или 'wind_kph'.
+        fields (str): Необязательный список полей через запятую, например 't,temp_c'.
+    """
+
+    def get(self, request):
+        city = get_city_param(request)
+        try:
+            points = int(request.query_params.get('points', 48))
+        except ValueError:
+            points = 0
+        if not 3 <= points <= 168:
+            raise ValidationError({'points': 'Ожидается целое число от 3 до 168.'})
+        method = request.query_params.get('method', 'lttb')
+        if method not in charts.DOWNSAMPLE_METHODS:
+            raise ValidationError({'method': f"Ожидается одно из: {', '.join(charts.DOWNSAMPLE_METHODS)}."})
+        by = request.query_params.get('by', 'temp_c')
+        if by not in charts.HOURLY_COLUMNS:
+            raise ValidationError({'by': f"Ожидается одно из: {', '.join(charts.HOURLY_COLUMNS)}."})
+
+        try:
+            chart, canonical = services.get_hourly_chart(city, points, method, by)
+        except services.InvalidLocationError:
+            raise NotFound('Город не найден.')
+        except services.WeatherServiceError:
+            raise UpstreamUnavailable()
+        return Response({'city': {'id': canonical.id, 'name': canonical.name}, **chart})
+
+
+class FavoriteCityListView(ETagMixin, SparseFieldsMixin, ValuesListMixin, generics.ListCreateAPIView):
+    """
+    Список избранных городов текущего пользователя и добавление нового города.
+
+    POST с уже существующим городом возвращает его с кодом 200 вместо создания дубликата.
+    """
+    serializer_class = FavoriteCitySerializer
+    pagination_class = ViewCursorPagination
+    values_fields = {'id': 'id', 'city_name': 'city_name'}
+    cursor_ordering = ('-id',)
+
+    def get_queryset(self):
+        if getattr(self, 'swagger_fake_view', False):  # Построение схемы drf_yasg без пользователя
+            return FavoriteCity.objects.none()
+        return FavoriteCity.objects.filter(user=self.request.user)
+
+    def list(self, request, *args, **kwargs):
+        return self.list_values()
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        favorite_city, created = FavoriteCity.objects.get_or_create(
+            user=request.user, city_name=serializer.validated_data['city_name']
+        )
+        return Response(
+            self.get_serializer(favorite_city).data,
+            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK,
+        )
+
+
+class FavoriteCityDetailView(ETagMixin, SparseFieldsMixin, generics.RetrieveUpdateDestroyAPIView):
+    """
+    Просмотр, переименование и удаление избранного города текущего пользователя.
+    """
+    serializer_class = FavoriteCitySerializer
+
+    def get_queryset(self):
+        if getattr(self, 'swagger_fake_view', False):  # Построение схемы drf_yasg без пользователя
+            return FavoriteCity.objects.none()
+        return FavoriteCity.objects.filter(user=self.request.user)
+
+
+class ChatHistoryView(ETagMixin, SparseFieldsMixin, ValuesListMixin, generics.ListAPIView):
+    """
+    История сообщений чата, от новых к старым.
+    """
+    serializer_class = ChatMessageSerializer
+    pagination_class = ViewCursorPagination
+    values_fields = {'id': 'id', 'username': 'user__username', 'message': 'message', 'created_at': 'created_at'}
+    cursor_ordering = ('-created_at',)
+    queryset = ChatMessage.objects.all()
+
+    def list(self, request, *args, **kwargs):
+        return self.list_values()
+
+
+class StatisticsView(ETagMixin, SparseFieldsMixin, APIView):
+    """
+    Сводная статистика: 5 самых популярных городов и количество активных пользователей за сутки.
+    """
+
+    def get(self, request):
+        return Response({
+            'popular_cities': list(
+                SearchStatistic.objects.order_by('-search_count').values('city_name', 'search_count')[:5]
+            ),
+            'active_users_count': services.active_users_count(),
+        })
+
+
+class CityStatisticsListView(ETagMixin, SparseFieldsMixin, ValuesListMixin, generics.ListAPIView):
+    """
+    Полный список городов с количеством поисковых запросов в алфавитном порядке.
+
+    Курсор строится по уникальному и неизменяемому city_name: счётчики растут
+    во время обхода, и курсор по search_count пропускал бы или повторял строки.
+    Самые популярные города отдаёт /api/v1/stats/.
+    """
+    serializer_class = SearchStatisticSerializer
+    pagination_class = ViewCursorPagination
+    values_fields = {'city_name': 'city_name', 'search_count': 'search_count'}
+    cursor_ordering = ('city_name',)
+    queryset = SearchStatistic.objects.all()
+
+    def list(self, request, *args, **kwargs):
+        return self.list_values()
+
+
+class CityAutocompleteView(ETagMixin, APIView):
+    """
+    Подсказки городов по началу названия из встроенного индекса (без обращения к внешнему API).
+
+    Параметры запроса:
+        q (str): Начало названия в любом написании ('ки', 'Kra').
+        limit (int): Количество подсказок, по умолчанию 10, максимум 50.
+    """
+
+    def get(self, request):
+        try:
+            limit = min(max(int(request.query_params.get('limit', 10)), 1), 50)
+        except ValueError:
+            limit = 10
+        cities = get_city_index().search(request.query_params.get('q', ''), limit=limit)
+        return Response([{'id': city.id, 'name': city.name, 'country': city.country} for city in cities])
+
+
+class CanonicalCityView(ETagMixin, APIView):
+    """
+    Каноническое название и стабильный идентификатор города для произвольного ввода.
+
+    Параметры запроса:
+        q (str): Название города, возможно с опечаткой или в другом написании.
+    """
+
+    def get(self, request):
+        city = get_city_index().canonicalize(request.query_params.get('q', ''))
+        if city is None:
+            raise NotFound('Город не найден.')
+        return Response({'id': city.id, 'name': city.name, 'country': city.country})
@@ -8,6 +8,12 @@ class WeatherConfig(AppConfig):
     Атрибуты:
         default_auto_field (str): Определяет тип автоинкрементного поля для моделей.
         name (str): Имя приложения.
+
+    Методы:
+        ready: Подключает обработчики сигналов.
     """
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'weather'
+
+    def ready(self):
+        from . import signals  # noqa: F401 (подключение обработчиков сигналов)
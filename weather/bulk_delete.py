@@ -0,0 +1,144 @@
+import atexit
+import threading
+import time
+import uuid
+
+from django.core.cache import cache
+from django.db import connections
+
+# Сколько хранится прогресс завершённого удаления
+PROGRESS_TIMEOUT = 24 * 60 * 60
+# Задача, прогресс которой не обновлялся дольше этого (с), считается прерванной (воркер убит)
+HEARTBEAT_TIMEOUT = 120
+INTERRUPTED = 'воркер остановлен'
+
+# Задачи, которые выполняются в этом процессе: job_id -> прогресс
+_running = {}
+_running_lock = threading.Lock()
+_stopping = threading.Event()
+
+
+def progress_key(job_id):
+    return f'bulk-delete:{job_id}'
+
+
+def _new_progress():
+    started = time.time()
+    return {'total': None, 'deleted': 0, 'done': False, 'error': None,
+            'started_at': started, 'updated_at': started, 'finished_at': None}
+
+
+def _save(job_id, progress):
+    progress['updated_at'] = time.time()
+    cache.set(progress_key(job_id), progress, PROGRESS_TIMEOUT)
+
+
+def get_progress(job_id):
+    """
+    Возвращает прогресс фонового удаления или None, если задача неизвестна.
+
+    Прогресс хранится в общем кэше (settings.CACHES) и виден из всех воркеров. Незавершённая
+    задача без обновлений дольше HEARTBEAT_TIMEOUT секунд возвращается как прерванная:
+    её поток погиб вместе с воркером, не успев записать итог.
+
+    Возвращает:
+        dict | None: Ключи total, deleted, done, error, started_at, updated_at, finished_at.
+    """
+    progress = cache.get(progress_key(job_id))
+    if progress and not progress['done'] and time.time() - progress['updated_at'] > HEARTBEAT_TIMEOUT:
+        progress = {**progress, 'done': True, 'error': INTERRUPTED}
+    return progress
+
+
+@atexit.register
+def _interrupt_running():
+    """
+    При остановке воркера помечает его незавершённые задачи прерванными.
+    """
+    _stopping.set()
+    with _running_lock:
+        running = list(_running.items())
+    for job_id, progress in running:
+        _save(job_id, {**progress, 'done': True, 'error': INTERRUPTED, 'finished_at': time.time()})
+
+
+def delete_in_chunks(queryset, job_id, chunk_size=1000, pause=0.0):
+    """
+    Удаляет записи выборки порциями по первичному ключу, обновляя прогресс после каждой порции.
+
+    Каждая порция — отдельный короткий DELETE ... WHERE id IN (...) в своей транзакции,
+    поэтому таблица не блокируется надолго, а прерванное удаление (в том числе остановкой
+    воркера) можно просто повторить.
+
+    Параметры:
+        queryset (QuerySet): Записи для удаления.
+        job_id (str): Идентификатор задачи для отчёта о прогрессе.
+        chunk_size (int): Количество записей в одной порции.
+        pause (float): Пауза между порциями в секундах, чтобы не мешать рабочей нагрузке.
+
+    Возвращает:
+        int: Количество удалённых записей.
+    """
+    progress = _new_progress()
+    with _running_lock:
+        _running[job_id] = progress
+    _save(job_id, progress)
+    model = queryset.model
+    try:
+        progress['total'] = queryset.count()
+        _save(job_id, progress)
+
+        last_pk = None
+        while not _stopping.is_set():
+            chunk = queryset.order_by('pk')
+            if last_pk is not None:
+                chunk = chunk.filter(pk__gt=last_pk)
+            pks = list(chunk.values_list('pk', flat=True)[:chunk_size])
+            if not pks:
+                break
+            model._base_manager.using(queryset.db).filter(pk__in=pks).delete()
+            last_pk = pks[-1]
+            progress['deleted'] += len(pks)
+            _save(job_id, progress)
+            if pause:
+                time.sleep(pause)
+        else:  # Цикл остановлен завершением воркера
+            progress['error'] = INTERRUPTED
+    except Exception as e:
+        progress['error'] = repr(e)
+        raise
+    finally:
+        with _running_lock:
+            _running.pop(job_id, None)
+        progress['done'] = True
+        progress['finished_at'] = time.time()
+        _save(job_id, progress)
+    return progress['deleted']
+
+
+def start_chunked_delete(queryset, chunk_size=1000, pause=0.0):
+    """
+    Запускает удаление выборки порциями в фоновом потоке, не задерживая запрос.
+
+    Параметры:
+        queryset (QuerySet): Записи для удаления.
+        chunk_size (int): Количество записей в одной порции.
+        pause (float): Пауза между порциями в секундах.
+
+    Возвращает:
+        str: Идентификатор задачи для get_progress.
+    """
+    job_id = uuid.uuid4().hex
+    # Прогресс доступен сразу, ещё до старта потока
+    _save(job_id, _new_progress())
+
+    def run():
+        try:
+            delete_in_chunks(queryset, job_id, chunk_size=chunk_size, pause=pause)
+        except Exception:
+            pass  # Ошибка уже записана в прогресс
+        finally:
+            connections.close_all()  # Поток открыл собственные соединения с базой
+
+    threading.Thread(target=run, name=f'bulk-delete-{job_id[:8]}', daemon=True).start()
+    return job_id
@@ -0,0 +1,326 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+
+from django.conf import settings
+
+from .lazy import lazy_import
+
+redis = lazy_import('redis')
+
+_MISSING = object()
+
+
+class LocalLRUCache:
+    """
+    Потокобезопасный LRU-кэш в памяти процесса с временем жизни записей.
+
+    Ключи — пары (namespace, key), поэтому можно удалить как одну запись, так и всё пространство имён.
+
+    Параметры:
+        maxsize (int): Максимальное количество записей.
+        ttl (float | None): Время жизни записи по умолчанию в секундах (None — без ограничения).
+    """
+
+    def __init__(self, maxsize=10000, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, namespace, key, default=None):
+        with self._lock:
+            entry = self._data.get((namespace, key))
+            if entry is None:
+                return default
+            value, expires = entry
+            if expires is not None and expires <= time.monotonic():
+                del self._data[(namespace, key)]
+                return default
+            self._data.move_to_end((namespace, key))
+            return value
+
+    def set(self, namespace, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        expires = None if ttl is None else time.monotonic() + ttl
+        with self._lock:
+            self._data[(namespace, key)] = (value, expires)
+            self._data.move_to_end((namespace, key))
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, namespace, key):
+        with self._lock:
+            self._data.pop((namespace, key), None)
+
+    def delete_namespace(self, namespace):
+        with self._lock:
+            for cache_key in [cache_key for cache_key in self._data if cache_key[0] == namespace]:
+                del self._data[cache_key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class InMemoryBus:
+    """
+    Шина инвалидаций внутри одного процесса: для тестов и локальной разработки без Redis.
+
+    Несколько NearCache на одной шине ведут себя как воркеры на общем Redis.
+    Флаг drop_messages имитирует потерю сообщений (версии при этом растут).
+    """
+
+    def __init__(self):
+        self.drop_messages = False
+        self._versions = {}
+        self._listeners = []
+        self._lock = threading.Lock()
+
+    def publish(self, namespace, key=None):
+        with self._lock:
+            version = self._versions[namespace] = self._versions.get(namespace, 0) + 1
+            listeners = list(self._listeners)
+        if not self.drop_messages:
+            message = {'ns': namespace, 'key': key, 'v': version}
+            for listener in listeners:
+                listener(message)
+        return version
+
+    def versions(self, namespaces):
+        with self._lock:
+            return {namespace: self._versions.get(namespace, 0) for namespace in namespaces}
+
+    def listen(self, on_message, on_reconnect=None):
+        with self._lock:
+            self._listeners.append(on_message)
+
+
+class RedisBus:
+    """
+    Шина инвалидаций через Redis pub/sub (тот же Redis, что и у CHANNEL_LAYERS).
+
+    Версия каждого пространства имён хранится в Redis (INCR), сообщение о инвалидации
+    несёт новую версию. Подписка работает в фоновом потоке и переподключается при обрыве.
+
+    Параметры:
+        url (str): Адрес Redis ('redis://127.0.0.1:6379').
+        channel (str): Канал pub/sub.
+    """
+    version_prefix = 'cache-bus:version:'
+
+    def __init__(self, url, channel='cache-bus'):
+        self.url = url
+        self.channel = channel
+        self.client = redis.Redis.from_url(url, socket_connect_timeout=0.5, socket_timeout=2)
+
+    def publish(self, namespace, key=None):
+        version = self.client.incr(self.version_prefix + namespace)
+        self.client.publish(self.channel, json.dumps({'ns': namespace, 'key': key, 'v': version}))
+        return version
+
+    def versions(self, namespaces):
+        namespaces = list(namespaces)
+        if not namespaces:
+            return {}
+        values = self.client.mget([self.version_prefix + namespace for namespace in namespaces])
+        return {namespace: int(value or 0) for namespace, value in zip(namespaces, values)}
+
+    def listen(self, on_message, on_reconnect=None):
+        threading.Thread(target=self._listen, args=(on_message, on_reconnect),
+                         name='cache-bus', daemon=True).start()
+
+    def _listen(self, on_message, on_reconnect):
+        delay = 0.5
+        while True:
+            try:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.channel)
+                if on_reconnect is not None:
+                    on_reconnect()  # Сообщения, отправленные пока подписки не было, потеряны
+                delay = 0.5
+                for message in pubsub.listen():
+                    if message.get('type') == 'message':
+                        on_message(json.loads(message['data']))
+            except (redis.RedisError, OSError, ValueError):
+                time.sleep(delay)
+                delay = min(delay * 2, 30)
+
+
+class NearCache:
+    """
+    Кэш в памяти воркера, согласованный между воркерами через шину инвалидаций.
+
+    Инвалидация ключа или всего пространства имён применяется локально и рассылается
+    остальным воркерам вместе с новой версией пространства имён. Если воркер видит
+    пропуск в версиях или при периодической сверке с шиной обнаруживает более новую
+    версию, он сбрасывает всё пространство имён — пропущенное сообщение не приводит
+    к устаревшим данным дольше, чем на check_interval.
+
+    Параметры:
+        bus (InMemoryBus | RedisBus): Шина инвалидаций.
+        maxsize (int): Максимальное количество записей.
+        ttl (float | None): Время жизни записи по умолчанию в секундах.
+        check_interval (float): Период сверки версий с шиной в секундах.
+    """
+
+    def __init__(self, bus, maxsize=10000, ttl=None, check_interval=5.0):
+        self.bus = bus
+        self.local = LocalLRUCache(maxsize=maxsize, ttl=ttl)
+        self.check_interval = check_interval
+        self.stats = {'hits': 0, 'misses': 0, 'invalidations': 0, 'resyncs': 0}
+        self._versions = {}
+        # Локальный счётчик применённых инвалидаций: защищает от записи значения, устаревшего во время вычисления
+        self._generations = {}
+        self._lock = threading.Lock()
+        self._next_check = time.monotonic() + check_interval
+        bus.listen(self._on_message, self._on_reconnect)
+
+    def get(self, namespace, key, default=None):
+        self._maybe_check_versions()
+        value = self.local.get(namespace, key, _MISSING)
+        if value is _MISSING:
+            self._count('misses')
+            return default
+        self._count('hits')
+        return value
+
+    def set(self, namespace, key, value, ttl=None):
+        self._watch(namespace)
+        self.local.set(namespace, key, value, ttl)
+
+    def get_or_set(self, namespace, key, factory, ttl=None):
+        """
+        Возвращает значение из кэша или вычисляет его через factory() и сохраняет.
+
+        Если во время вычисления пришла инвалидация этого пространства имён, значение
+        возвращается, но не кэшируется.
+        """
+        value = self.get(namespace, key, _MISSING)
+        if value is not _MISSING:
+            return value
+        generation = self._watch(namespace)
+        value = factory()
+        with self._lock:
+            if self._generations[namespace] == generation:
+                self.local.set(namespace, key, value, ttl)
+        return value
+
+    def invalidate(self, namespace, key=None):
+        """
+        Удаляет ключ (или всё пространство имён, если key не указан) во всех воркерах.
+
+        Если шина недоступна, инвалидация применяется только локально, а остальные
+        воркеры избавятся от устаревших данных по истечении ttl.
+
+        Возвращает:
+            bool: True, если инвалидация разослана другим воркерам.
+        """
+        self._watch(namespace)
+        self._apply(namespace, key)
+        try:
+            version = self.bus.publish(namespace, key)
+        except (redis.RedisError, OSError):
+            return False
+        with self._lock:
+            self._versions[namespace] = max(self._versions[namespace], version)
+        return True
+
+    def clear(self):
+        """
+        Очищает локальные записи этого воркера.
+        """
+        with self._lock:
+            for namespace in self._generations:
+                self._generations[namespace] += 1
+        self.local.clear()
+
+    def check_versions(self):
+        """
+        Сверяет версии пространств имён с шиной и сбрасывает те, для которых пропущены сообщения.
+        """
+        with self._lock:
+            namespaces = list(self._versions)
+        try:
+            remote = self.bus.versions(namespaces)
+        except (redis.RedisError, OSError):
+            return
+        for namespace, version in remote.items():
+            with self._lock:
+                stale = version > self._versions[namespace]
+                if stale:
+                    self._versions[namespace] = version
+            if stale:
+                self._count('resyncs')
+                self._apply(namespace, None)
+
+    def _watch(self, namespace):
+        if namespace not in self._versions:
+            try:
+                version = self.bus.versions([namespace])[namespace]
+            except (redis.RedisError, OSError):
+                version = 0
+            with self._lock:
+                self._versions.setdefault(namespace, version)
+        with self._lock:
+            return self._generations.setdefault(namespace, 0)
+
+    def _count(self, name):
+        with self._lock:  # Счётчики меняют потоки запросов и поток слушателя шины
+            self.stats[name] += 1
+
+    def _apply(self, namespace, key):
+        with self._lock:
+            self._generations[namespace] = self._generations.get(namespace, 0) + 1
+        self._count('invalidations')
+        if key is None:
+            self.local.delete_namespace(namespace)
+        else:
+            self.local.delete(namespace, key)
+
+    def _on_message(self, message):
+        namespace, key, version = message['ns'], message.get('key'), message['v']
+        with self._lock:
+            if namespace not in self._versions:
+                return  # Этот воркер ничего не кэширует в данном пространстве имён
+            known = self._versions[namespace]
+            if version <= known:
+                return  # Собственная или уже применённая инвалидация
+            self._versions[namespace] = version
+        if version > known + 1:
+            # Пропущены предыдущие сообщения: неизвестно, какие ключи устарели
+            self._count('resyncs')
+            key = None
+        self._apply(namespace, key)
+
+    def _on_reconnect(self):
+        self._next_check = 0
+
+    def _maybe_check_versions(self):
+        now = time.monotonic()
+        if now >= self._next_check:
+            self._next_check = now + self.check_interval
+            self.check_versions()
+
+
+def make_bus(url):
+    """
+    Создаёт шину по адресу: 'memory://' — в памяти процесса, иначе Redis.
+    """
+    if url.startswith('memory://'):
+        return InMemoryBus()
+    return RedisBus(url)
+
+
+@lru_cache(maxsize=None)
+def get_near_cache():
+    """
+    Возвращает near-cache процесса, подключённый к шине settings.CACHE_BUS_URL.
+    """
+    return NearCache(make_bus(settings.CACHE_BUS_URL), maxsize=settings.NEAR_CACHE_MAXSIZE,
+                     check_interval=settings.NEAR_CACHE_CHECK_INTERVAL)
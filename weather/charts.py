@@ -0,0 +1,129 @@
+import math
+
+from .lazy import lazy_import
+
+np = lazy_import('numpy')
+
+# Столбцы почасового ряда: поле часа прогноза -> имя столбца в ответе
+HOURLY_COLUMNS = ('temp_c', 'precip_mm', 'wind_kph')
+DOWNSAMPLE_METHODS = ('lttb', 'minmax')
+
+
+def hourly_columns(data):
+    """
+    Собирает почасовой ряд прогноза в столбцы numpy.
+
+    Параметры:
+        data (dict): Нормализованный ответ провайдера с блоком 'forecast.forecastday[].hour'.
+
+    Возвращает:
+        tuple: (массив времени в секундах epoch, {столбец: массив float с NaN вместо пропусков}).
+    """
+    hours = [hour for day in (data.get('forecast') or {}).get('forecastday', [])
+             for hour in day.get('hour', []) if hour.get('time_epoch') is not None]
+    epochs = np.fromiter((hour['time_epoch'] for hour in hours), dtype=np.int64, count=len(hours))
+    columns = {
+        name: np.array([hour.get(name) for hour in hours], dtype=np.float64)  # None -> NaN
+        for name in HOURLY_COLUMNS
+    }
+    order = np.argsort(epochs, kind='stable')
+    return epochs[order], {name: values[order] for name, values in columns.items()}
+
+
+def lttb(x, y, points):
+    """
+    Выбирает точки ряда алгоритмом Largest-Triangle-Three-Buckets.
+
+    Первая и последняя точки сохраняются, остальные делятся на points - 2 корзины; из каждой
+    берётся точка, образующая наибольший треугольник с выбранной точкой предыдущей корзины
+    и средним следующей. Границы корзин и средние считаются векторно, цикл идёт только по корзинам.
+
+    Параметры:
+        x (ndarray): Координаты по оси времени (возрастают).
+        y (ndarray): Значения; NaN не выбираются, если в корзине есть другие точки.
+        points (int): Сколько точек оставить.
+
+    Возвращает:
+        ndarray: Возрастающие индексы выбранных точек.
+    """
+    size = len(x)
+    if points >= size or points < 3:
+        return np.arange(size)
+
+    x = x.astype(np.float64)
+    edges = np.arange(points - 1) * (size - 2) // (points - 2) + 1  # Целочисленно: без ошибок округления
+    starts, ends = edges[:-1], edges[1:]
+
+    # Среднее следующей корзины; для последней — последняя точка ряда
+    filled = np.where(np.isnan(y), np.nanmean(y) if not np.isnan(y).all() else 0.0, y)
+    counts = np.diff(edges)
+    avg_x = np.append(np.add.reduceat(x[:-1], starts)[1:] / counts[1:], x[-1])
+    avg_y = np.append(np.add.reduceat(filled[:-1], starts)[1:] / counts[1:], filled[-1])
+
+    selected = np.empty(points, dtype=np.int64)
+    selected[0], selected[-1] = 0, size - 1
+    previous = 0
+    for i in range(points - 2):
+        bx, by = x[starts[i]:ends[i]], y[starts[i]:ends[i]]
+        ax, ay = x[previous], filled[previous]
+        area = np.abs((ax - avg_x[i]) * (by - ay) - (ax - bx) * (avg_y[i] - ay))
+        previous = starts[i] + int(np.argmax(np.nan_to_num(area, nan=-1.0)))
+        selected[i + 1] = previous
+    return selected
+
+
+def minmax(x, y, points):
+    """
+    Оставляет в каждой из points // 2 корзин минимум и максимум — пики ряда не теряются.
+
+    Полностью векторный вариант: точки сортируются по (корзина, значение), первая и последняя
+    точки каждой корзины — её минимум и максимум.
+
+    Возвращает:
+        ndarray: Возрастающие индексы выбранных точек (не больше points).
+    """
+    size = len(x)
+    buckets = points // 2
+    if points >= size or buckets < 1:
+        return np.arange(size)
+
+    bucket = np.arange(size) * buckets // size
+    nan = np.isnan(y)
+    by_min = np.lexsort((np.where(nan, np.inf, y), bucket))
+    by_max = np.lexsort((np.where(nan, np.inf, -y), bucket))
+    firsts = np.flatnonzero(np.diff(bucket, prepend=-1))
+    return np.unique(np.concatenate((by_min[firsts], by_max[firsts])))
+
+
+def _packed(values):
+    return [None if math.isnan(value) else value for value in np.round(values, 1).tolist()]
+
+
+def hourly_chart(data, points, method='lttb', by='temp_c'):
+    """
+    Готовит почасовой ряд прогноза для графика: столбцы массивов, прореженные до points точек.
+
+    Точки выбираются по столбцу by и одинаковы для всех столбцов, чтобы они делили общую ось времени.
+
+    Параметры:
+        data (dict): Нормализованный ответ провайдера с почасовым прогнозом.
+        points (int): Желаемое количество точек.
+        method (str): 'lttb' (форма кривой) или 'minmax' (экстремумы в каждой корзине).
+        by (str): Столбец, по которому выбираются точки.
+
+    Возвращает:
+        dict: {'method', 'source_points', 'points', 't': [epoch, ...], 'temp_c': [...], 'precip_mm': [...],
+               'wind_kph': [...]}; значения округлены до 0.1, пропуски — None.
+    """
+    epochs, columns = hourly_columns(data)
+    select = lttb if method == 'lttb' else minmax
+    indices = select(epochs, columns[by], points)
+    chart = {
+        'method': method,
+        'source_points': len(epochs),
+        'points': len(indices),
+        't': epochs[indices].tolist(),
+    }
+    for name, values in columns.items():
+        chart[name] = _packed(values[indices])
+    return chart
@@ -0,0 +1,287 @@
+import asyncio
+import logging
+import time
+import uuid
+from collections import Counter
+
+from channels.layers import get_channel_layer
+from django.conf import settings
+
+from . import wire
+
+logger = logging.getLogger(__name__)
+
+
+class RoomHub:
+    """
+    Рассылка событий комнаты чата подключённым к этому процессу сокетам пакетами по тикам.
+
+    Вместо того чтобы каждый сокет подписывался на группу channel layer и получал каждое
+    сообщение отдельным кадром, на группу подписан один хаб процесса. События за тик
+    (сообщения, «печатает…», список онлайн) накапливаются и отправляются всем локальным
+    сокетам одним кадром, закодированным в JSON один раз.
+
+    Список онлайн объединяет пользователей всех процессов: каждый хаб объявляет своих
+    пользователей в группу не чаще раза за тик и повторяет объявление раз в heartbeat секунд;
+    объявления хабов, молчащих три heartbeat, отбрасываются.
+
+    При CHAT_WIRE_FORMAT = 'msgpack' события передаются через channel layer компактной
+    записью (wire.pack_event); принимаются оба формата. Сокеты с бинарным подпротоколом
+    получают кадр msgpack, остальные — JSON; каждый вариант кодируется один раз за тик.
+
+    Параметры:
+        group (str): Имя группы channel layer.
+        channel_layer: Channel layer (по умолчанию из настроек).
+        tick (float): Длительность тика в секундах.
+        typing_debounce (float): Минимальный интервал между событиями «печатает…» одного пользователя.
+        heartbeat (float): Период повторного объявления присутствия в секундах.
+    """
+
+    def __init__(self, group, channel_layer=None, tick=None, typing_debounce=None, heartbeat=None):
+        self.group = group
+        self.channel_layer = channel_layer or get_channel_layer()
+        self.tick = settings.CHAT_BATCH_TICK if tick is None else tick
+        self.typing_debounce = settings.CHAT_TYPING_DEBOUNCE if typing_debounce is None else typing_debounce
+        self.heartbeat = settings.CHAT_PRESENCE_HEARTBEAT if heartbeat is None else heartbeat
+        self.packed = settings.CHAT_WIRE_FORMAT == 'msgpack'
+        self.compress_threshold = settings.CHAT_COMPRESS_THRESHOLD
+        self.loop = asyncio.get_running_loop()
+        self.id = uuid.uuid4().hex
+        self.channel = None
+        self.sockets = set()
+        self.stats = Counter()
+        self._local_users = Counter()
+        self._remote_users = {}
+        self._messages = []
+        self._typing = set()
+        self._typing_sent = {}
+        self._greet = set()
+        self._last_presence = None
+        self._announce = False
+        self._flush_handle = None
+        self._tasks = []
+        self.closed = False
+        self._start_lock = asyncio.Lock()  # Подписку создаёт один сокет, даже если первые подключились разом
+
+    async def join(self, socket):
+        """
+        Подключает сокет к рассылке; первый сокет подписывает хаб на группу.
+
+        Хаб, который успел закрыться после ухода последнего сокета (пока новый ждал accept),
+        передаёт сокет живому хабу комнаты (get_room_hub создаст его при необходимости).
+
+        Возвращает:
+            RoomHub: Хаб, к которому подключён сокет.
+        """
+        if self.closed:
+            return await get_room_hub(self.group).join(socket)
+        self.sockets.add(socket)
+        self._greet.add(socket)
+        self._local_users[socket.username] += 1
+        async with self._start_lock:
+            if not self._tasks:
+                self.channel = await self.channel_layer.new_channel()
+                await self.channel_layer.group_add(self.group, self.channel)
+                self._tasks = [self.loop.create_task(self._receive_loop()),
+                               self.loop.create_task(self._heartbeat_loop())]
+                await self._send_presence(request=True)
+        self._announce = True
+        self._schedule()
+        return self
+
+    async def leave(self, socket):
+        """
+        Отключает сокет; после ухода последнего хаб отписывается от группы.
+        """
+        if socket not in self.sockets:
+            return
+        self.sockets.discard(socket)
+        self._greet.discard(socket)
+        self._local_users[socket.username] -= 1
+        if self._local_users[socket.username] <= 0:
+            del self._local_users[socket.username]
+        if self.sockets:
+            self._announce = True
+            self._schedule()
+            return
+
+        self.closed = True
+        if _hubs.get(self.group) is self:
+            del _hubs[self.group]
+        for task in self._tasks:
+            task.cancel()
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        await self._send_presence()
+        await self.channel_layer.group_discard(self.group, self.channel)
+
+    async def send_message(self, username, message):
+        """
+        Отправляет сообщение чата всем процессам комнаты.
+        """
+        await self._publish({'type': 'chat.message', 'username': username, 'message': message})
+
+    async def send_typing(self, username):
+        """
+        Сообщает, что пользователь печатает; повторы чаще typing_debounce отбрасываются.
+        """
+        now = time.monotonic()
+        if now - self._typing_sent.get(username, float('-inf')) < self.typing_debounce:
+            self.stats['typing_dropped'] += 1
+            return
+        self._typing_sent[username] = now
+        await self._publish({'type': 'chat.typing', 'username': username})
+
+    def deliver(self, event):
+        """
+        Принимает событие группы и откладывает его до ближайшего тика.
+        """
+        if event.get('type') == wire.PACKED_EVENT:
+            try:
+                event = wire.unpack_event(event)
+            except ValueError:
+                # Запись другого узла не распаковать (например, zstd без пакета zstandard): пропускаем
+                self.stats['undecodable_events'] += 1
+                return
+        kind = event.get('type')
+        if kind == 'chat.message':
+            if not isinstance(event.get('message'), str):
+                self.stats['bad_events'] += 1  # Узел старой версии переслал сообщение без проверки
+                return
+            self._messages.append({'username': event['username'], 'message': event['message']})
+            self._typing.discard(event['username'])
+        elif kind == 'chat.typing':
+            self._typing.add(event['username'])
+        elif kind == 'chat.presence':
+            if event['hub'] == self.id:
+                return
+            if event['users']:
+                self._remote_users[event['hub']] = (frozenset(event['users']), time.monotonic())
+            else:
+                self._remote_users.pop(event['hub'], None)
+            if event.get('request'):
+                self._announce = True  # Новый хаб ещё не знает наших пользователей
+        else:
+            return
+        self._schedule()
+
+    def presence(self):
+        """
+        Возвращает отсортированный список пользователей онлайн во всех процессах.
+        """
+        users = set(self._local_users)
+        for remote, _ in self._remote_users.values():
+            users |= remote
+        return sorted(users)
+
+    async def flush(self):
+        """
+        Отправляет накопленные за тик события одним кадром всем локальным сокетам.
+        """
+        self._flush_handle = None
+        if self._announce:
+            self._announce = False
+            await self._send_presence()
+
+        frame = {'type': 'batch'}
+        if self._messages:
+            frame['messages'], self._messages = self._messages, []
+        if self._typing:
+            frame['typing'] = sorted(self._typing)
+            self._typing = set()
+        presence = self.presence()
+        if presence != self._last_presence:
+            frame['presence'] = self._last_presence = presence
+            self._greet.clear()
+
+        if len(frame) > 1:
+            await self._broadcast(self.sockets, frame)
+        if self._greet:
+            greet, self._greet = self._greet, set()
+            await self._broadcast(greet, {'type': 'batch', 'presence': presence})
+
+    def _schedule(self):
+        if self._flush_handle is None:
+            self._flush_handle = self.loop.call_later(self.tick, lambda: self.loop.create_task(self.flush()))
+
+    async def _broadcast(self, sockets, frame):
+        text = binary = None
+        for socket in list(sockets):
+            try:
+                if getattr(socket, 'binary', False):
+                    if binary is None:
+                        binary = self._encode(wire.encode_binary_frame, frame, self.compress_threshold)
+                    await socket.send(bytes_data=binary)
+                else:
+                    if text is None:
+                        text = self._encode(wire.encode_text_frame, frame)
+                    await socket.send(text_data=text)
+            except Exception:
+                # Сбой одного соединения не должен лишать пакета остальных
+                self.stats['send_errors'] += 1
+                logger.exception('Не удалось отправить пакет чата сокету %s', getattr(socket, 'username', '?'))
+        self.stats['messages'] += len(frame.get('messages', ())) * len(sockets)
+        self.stats['frames'] += len(sockets)
+
+    def _encode(self, encode, frame, *args):
+        """
+        Кодирует кадр; если какое-то сообщение не кодируется, кадр кодируется без него.
+        """
+        self.stats['encodes'] += 1
+        try:
+            return encode(frame, *args)
+        except (TypeError, ValueError):
+            messages = []
+            for message in frame.get('messages', ()):
+                try:
+                    encode({'type': 'batch', 'messages': [message]}, *args)
+                except (TypeError, ValueError):
+                    self.stats['bad_events'] += 1
+                    logger.warning('Сообщение чата от %s не кодируется и отброшено', message.get('username'))
+                else:
+                    messages.append(message)
+            frame['messages'] = messages
+            return encode(frame, *args)
+
+    async def _publish(self, event):
+        if self.packed:
+            event = wire.pack_event(event, self.compress_threshold)
+        await self.channel_layer.group_send(self.group, event)
+
+    async def _send_presence(self, request=False):
+        users = sorted(self._local_users) if self.sockets else []
+        await self._publish({'type': 'chat.presence', 'hub': self.id, 'users': users, 'request': request})
+
+    async def _receive_loop(self):
+        while True:
+            event = await self.channel_layer.receive(self.channel)
+            try:
+                self.deliver(event)
+            except Exception:
+                # Одно некорректное событие не должно останавливать доставку всей комнате
+                self.stats['bad_events'] += 1
+                logger.exception('Событие чата %r отброшено', event.get('type'))
+
+    async def _heartbeat_loop(self):
+        while True:
+            await asyncio.sleep(self.heartbeat)
+            expired = time.monotonic() - 3 * self.heartbeat
+            for hub, (_, seen_at) in list(self._remote_users.items()):
+                if seen_at < expired:
+                    del self._remote_users[hub]
+            self._announce = True
+            self._schedule()
+
+
+_hubs = {}
+
+
+def get_room_hub(group):
+    """
+    Возвращает хаб комнаты для текущего процесса и цикла событий, создавая его при первом подключении.
+    """
+    hub = _hubs.get(group)
+    if hub is None or hub.loop is not asyncio.get_running_loop():
+        hub = _hubs[group] = RoomHub(group)
+    return hub
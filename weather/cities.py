@@ -0,0 +1,348 @@
+import csv
+import threading
+import unicodedata
+import zlib
+from array import array
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+from difflib import get_close_matches
+from functools import lru_cache
+
+from django.conf import settings
+
+from .geo import haversine_km
+from .lazy import lazy_import
+
+np = lazy_import('numpy')
+
+City = namedtuple('City', ['id', 'name', 'country', 'lat', 'lon'])
+
+# Разделители, которые не должны влиять на сравнение названий ("Ivano-Frankivsk" == "ivano frankivsk")
+_SEPARATORS = str.maketrans({'-': ' ', '.': ' ', ',': ' ', '_': ' ', "'": '', '’': '', '`': ''})
+
+# Идентификаторы городов, выученных из ответов API, не пересекаются с идентификаторами из встроенного списка
+LEARNED_ID_BASE = 1 << 32
+
+
+def normalize_city_name(text):
+    """
+    Приводит название города к ключу поиска: без регистра, диакритики и лишних разделителей.
+
+    Параметры:
+        text (str): Название в произвольном написании ('  Kraków', 'КИЕВ', 'Ivano-Frankivsk').
+
+    Возвращает:
+        str: Нормализованный ключ ('krakow', 'киев', 'ivano frankivsk').
+    """
+    text = unicodedata.normalize('NFKD', text)
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    text = text.casefold().replace('ё', 'е').translate(_SEPARATORS)
+    return ' '.join(text.split())
+
+
+def stable_city_id(name, country=''):
+    """
+    Возвращает стабильный между процессами идентификатор для города, которого нет во встроенном списке.
+
+    Зависит от названия и страны, поэтому одноимённые города разных стран получают разные
+    идентификаторы (а с ними разные записи кэша и историю наблюдений).
+    """
+    return LEARNED_ID_BASE + zlib.crc32(f"{normalize_city_name(name)}|{normalize_city_name(country)}".encode())
+
+
+class CityIndex:
+    """
+    Компактный префиксный индекс городов: отсортированный список ключей и бинарный поиск (bisect).
+
+    Ключи (название и альтернативные написания) хранятся в одном отсортированном списке строк,
+    рядом — массив номеров строк. Данные городов хранятся по столбцам (array для координат),
+    поэтому индекс на ~200 тыс. городов занимает десятки мегабайт, а поиск работает за микросекунды.
+
+    Методы:
+        search: Автодополнение по префиксу.
+        canonicalize: Сопоставление пользовательского ввода с городом (точно или с опечаткой).
+        nearest: Ближайший к точке город с координатами.
+        add / learn / restore: Пополнение индекса новыми городами.
+    """
+    # Сколько ключей с общим префиксом просматривается для ранжирования подсказок
+    scan_limit = 200
+    # Максимум кандидатов для нечёткого поиска
+    fuzzy_limit = 5000
+
+    def __init__(self):
+        self._keys = []
+        self._rows = array('I')
+        self._ids = array('q')
+        self._names = []
+        self._countries = []
+        self._lat = array('d')
+        self._lon = array('d')
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._ids)
+
+    def load(self, records):
+        """
+        Заполняет индекс пакетно, с одной сортировкой ключей.
+
+        Параметры:
+            records (iterable): Кортежи (id, name, country, lat, lon, aliases).
+        """
+        with self._lock:
+            pairs = list(zip(self._keys, self._rows))
+            for city_id, name, country, lat, lon, aliases in records:
+                row = self._append_row(city_id, name, country, lat, lon)
+                for key in {normalize_city_name(alias) for alias in (name, *aliases)}:
+                    if key:
+                        pairs.append((key, row))
+            pairs.sort()
+            self._keys = [key for key, _ in pairs]
+            self._rows = array('I', (row for _, row in pairs))
+
+    def load_csv(self, path):
+        """
+        Загружает встроенный список городов из CSV (id, name, country, lat, lon, aliases через '|').
+        """
+        with open(path, encoding='utf-8', newline='') as f:
+            self.load(
+                (int(row['id']), row['name'], row['country'], float(row['lat']), float(row['lon']),
+                 [alias for alias in row['aliases'].split('|') if alias])
+                for row in csv.DictReader(f)
+            )
+
+    def add(self, name, country='', lat=float('nan'), lon=float('nan'), aliases=()):
+        """
+        Добавляет город (или новые написания уже известного города) в индекс.
+
+        Параметры:
+            name (str): Каноническое название.
+            country (str): Страна.
+            lat (float), lon (float): Координаты, если известны.
+            aliases (iterable): Дополнительные написания, которые должны вести на этот город.
+
+        Возвращает:
+            City: Добавленный или уже существующий город.
+        """
+        key = normalize_city_name(name)
+        city_id = stable_city_id(name, country)
+        with self._lock:
+            row = self._find_row_by_id(key, city_id)
+            if row is not None and not self._countries[row]:
+                # Город, восстановленный из истории без страны, узнан: дополняем его данные
+                self._countries[row], self._lat[row], self._lon[row] = country, lat, lon
+            if row is None:
+                row = self._find_row(key, country)
+            if row is None:
+                row = self._append_row(city_id, name, country, lat, lon)
+                self._insert_key(key, row)
+            for alias in aliases:
+                alias_key = normalize_city_name(alias)
+                if alias_key and self._find_row(alias_key) is None:
+                    self._insert_key(alias_key, row)
+            return self._city(row)
+
+    def restore(self, city_id, name):
+        """
+        Восстанавливает выученный город из истории наблюдений под прежним идентификатором.
+
+        Страна и координаты в истории не хранятся; они дополняются, когда город снова
+        придёт в ответе API (см. add).
+        """
+        key = normalize_city_name(name)
+        with self._lock:
+            if self._find_row_by_id(key, city_id) is None:
+                self._insert_key(key, self._append_row(city_id, name, '', float('nan'), float('nan')))
+
+    def learn(self, location, alias=None):
+        """
+        Запоминает город из ответа погодного API (блок 'location').
+
+        Параметры:
+            location (dict): Блок 'location' ответа API с ключами name, country, lat, lon.
+            alias (str): Исходный ввод пользователя, который привёл к этому городу.
+
+        Возвращает:
+            City: Канонический город.
+        """
+        return self.add(
+            location['name'], location.get('country', ''),
+            location.get('lat', float('nan')), location.get('lon', float('nan')),
+            aliases=[alias] if alias else (),
+        )
+
+    def lookup(self, text):
+        """
+        Возвращает город с точно совпадающим (после нормализации) названием или None.
+        """
+        key = normalize_city_name(text)
+        with self._lock:
+            row = self._find_row(key)
+            return None if row is None else self._city(row)
+
+    def search(self, prefix, limit=10):
+        """
+        Возвращает подсказки для автодополнения.
+
+        Точное совпадение идёт первым, затем более короткие названия.
+
+        Параметры:
+            prefix (str): Начало названия города.
+            limit (int): Максимальное количество подсказок.
+
+        Возвращает:
+            list: Список City.
+        """
+        key = normalize_city_name(prefix)
+        if not key:
+            return []
+        with self._lock:
+            lo, hi = self._prefix_range(key)
+            best = {}
+            for i in range(lo, min(hi, lo + self.scan_limit)):
+                row = self._rows[i]
+                rank = (self._keys[i] != key, len(self._keys[i]), row)
+                if row not in best or rank < best[row]:
+                    best[row] = rank
+            rows = sorted(best, key=best.get)[:limit]
+            return [self._city(row) for row in rows]
+
+    def canonicalize(self, text):
+        """
+        Сопоставляет пользовательский ввод с городом из индекса.
+
+        Сначала ищется точное совпадение (включая альтернативные написания), затем ближайшее
+        название с опечаткой. Ввод с уточнением через запятую ('Lviv, Ukraine') сопоставляется,
+        только если уточнение совпадает со страной города: 'Paris, Texas' не должен стать Парижем
+        во Франции и уходит во внешний API как есть (а его ответ запоминается как написание).
+
+        Параметры:
+            text (str): Ввод пользователя.
+
+        Возвращает:
+            City | None: Найденный город или None.
+        """
+        city = self.lookup(text)
+        if city is not None:
+            return city
+        if ',' not in text:
+            return self._fuzzy_lookup(normalize_city_name(text))
+
+        name, qualifier = text.split(',', 1)
+        country = normalize_city_name(qualifier)
+        key = normalize_city_name(name)
+        with self._lock:
+            row = self._find_row_in_country(key, country)
+        if row is None:
+            match = self._fuzzy_key(key)
+            with self._lock:
+                row = None if match is None else self._find_row_in_country(match, country)
+        return None if row is None else self._city(row)
+
+    def nearest(self, lat, lon, radius_km):
+        """
+        Возвращает ближайший к точке город с известными координатами в радиусе radius_km.
+
+        Просматривает все города одной векторной операцией; вызывается только при промахе
+        пространственного индекса, перед запросом к внешнему API.
+
+        Возвращает:
+            tuple | None: (City, расстояние в км) или None, если в радиусе городов нет.
+        """
+        with self._lock:
+            if not self._ids:
+                return None
+            distances = haversine_km(lat, lon, np.array(self._lat), np.array(self._lon))
+            row = int(np.nanargmin(distances)) if not np.isnan(distances).all() else None
+            if row is None or distances[row] > radius_km:
+                return None
+            return self._city(row), float(distances[row])
+
+    def _find_row_in_country(self, key, country):
+        i = bisect_left(self._keys, key)
+        while i < len(self._keys) and self._keys[i] == key:
+            row = self._rows[i]
+            if country and normalize_city_name(self._countries[row]) == country:
+                return row
+            i += 1
+        return None
+
+    def _fuzzy_lookup(self, key):
+        match = self._fuzzy_key(key)
+        return None if match is None else self.lookup(match)
+
+    def _fuzzy_key(self, key):
+        if len(key) < 3:
+            return None
+        with self._lock:
+            lo, hi = self._prefix_range(key[:2])
+            candidates = [
+                candidate for candidate in self._keys[lo:min(hi, lo + self.fuzzy_limit)]
+                if abs(len(candidate) - len(key)) <= 2
+            ]
+        matches = get_close_matches(key, candidates, n=1, cutoff=0.8)
+        return matches[0] if matches else None
+
+    def _prefix_range(self, prefix):
+        lo = bisect_left(self._keys, prefix)
+        hi = bisect_left(self._keys, prefix + '\uffff', lo)
+        return lo, hi
+
+    def _find_row(self, key, country=None):
+        i = bisect_left(self._keys, key)
+        while i < len(self._keys) and self._keys[i] == key:
+            row = self._rows[i]
+            if not country or self._countries[row] == country:
+                return row
+            # Город без страны подходит любой стране, только если добавлен по одному названию
+            # (из избранного); восстановленный из истории принадлежит своей стране
+            if not self._countries[row] and self._ids[row] == stable_city_id(key):
+                return row
+            i += 1
+        return None
+
+    def _find_row_by_id(self, key, city_id):
+        i = bisect_left(self._keys, key)
+        while i < len(self._keys) and self._keys[i] == key:
+            if self._ids[self._rows[i]] == city_id:
+                return self._rows[i]
+            i += 1
+        return None
+
+    def _insert_key(self, key, row):
+        i = bisect_right(self._keys, key)  # Одноимённый город, известный раньше, остаётся первым для lookup
+        self._keys.insert(i, key)
+        self._rows.insert(i, row)
+
+    def _append_row(self, city_id, name, country, lat, lon):
+        self._ids.append(city_id)
+        self._names.append(name)
+        self._countries.append(country)
+        self._lat.append(lat)
+        self._lon.append(lon)
+        return len(self._ids) - 1
+
+    def _city(self, row):
+        return City(self._ids[row], self._names[row], self._countries[row], self._lat[row], self._lon[row])
+
+
+@lru_cache(maxsize=None)
+def get_city_index():
+    """
+    Возвращает индекс городов процесса, построенный при первом обращении.
+
+    Индекс содержит встроенный список (settings.CITY_LIST_PATH), выученные города из истории
+    наблюдений (с прежними идентификаторами) и уже встречавшиеся канонические названия
+    из избранных городов пользователей.
+    """
+    from .models import FavoriteCity, WeatherObservation
+
+    index = CityIndex()
+    index.load_csv(settings.CITY_LIST_PATH)
+    learned = (WeatherObservation.objects.filter(city_id__gte=LEARNED_ID_BASE).order_by()
+               .values_list('city_id', 'city_name').distinct())
+    for city_id, name in learned:
+        index.restore(city_id, name)
+    for name in FavoriteCity.objects.values_list('city_name', flat=True).distinct():
+        index.add(name)
+    return index
@@ -0,0 +1,238 @@
+import threading
+import time
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import HttpResponse, JsonResponse
+
+from . import services
+from .cache_bus import LocalLRUCache
+
+# Параметры запроса, от которых зависит ответ API, кроме города (остальные в ключ ответа не входят)
+STALE_KEY_PARAMS = ('days', 'points', 'method', 'by', 'fields')
+# Статусы, которые считаются признаком перегрузки наравне с превышением целевой задержки
+OVERLOAD_STATUSES = (502, 503, 504)
+
+
+class AIMDLimiter:
+    """
+    Адаптивный лимит одновременных запросов класса маршрутов (AIMD, как в управлении перегрузкой TCP).
+
+    Ответ быстрее целевой задержки при загруженном лимите увеличивает его на 1 / limit, то есть
+    примерно на единицу за «окно» из limit запросов; медленный ответ или ответ 502–504 умножает
+    лимит на backoff, но не чаще раза за target секунд, чтобы одна волна медленных ответов
+    считалась одним сигналом. Запрос сверх лимита не ждёт в очереди, а сразу отклоняется.
+
+    Параметры:
+        name (str): Имя класса маршрутов.
+        initial, min_limit, max_limit (int): Начальный лимит и его границы.
+        target (float): Целевая задержка ответа в секундах.
+        backoff (float): Множитель уменьшения лимита.
+    """
+
+    def __init__(self, name, initial, min_limit, max_limit, target, backoff=0.7):
+        self.name = name
+        self.limit = float(initial)
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.target = target
+        self.backoff = backoff
+        self.inflight = 0
+        self.shed = 0
+        self.latency = 0.0  # Экспоненциальное среднее задержки, для страницы администратора
+        self._decreased_at = -float('inf')
+        self._lock = threading.Lock()
+
+    def try_acquire(self):
+        """
+        Занимает место, если число запросов в работе меньше лимита. Возвращает False при отказе.
+        """
+        with self._lock:
+            if self.inflight >= int(self.limit):
+                self.shed += 1
+                return False
+            self.inflight += 1
+            return True
+
+    def release(self, latency, overloaded=False):
+        """
+        Освобождает место и подстраивает лимит по задержке ответа в секундах.
+        """
+        with self._lock:
+            busy = 2 * self.inflight >= self.limit  # Без нагрузки быстрые ответы ничего не говорят о запасе
+            self.inflight -= 1
+            self.latency += 0.2 * (latency - self.latency)
+            now = time.monotonic()
+            if overloaded or latency > self.target:
+                if now - self._decreased_at >= self.target:
+                    self.limit = max(float(self.min_limit), self.limit * self.backoff)
+                    self._decreased_at = now
+            elif busy:
+                self.limit = min(float(self.max_limit), self.limit + 1 / self.limit)
+
+    def snapshot(self):
+        """
+        Возвращает состояние для страницы администратора и тестов.
+        """
+        with self._lock:
+            return {
+                'name': self.name,
+                'limit': round(self.limit, 1),
+                'inflight': self.inflight,
+                'shed': self.shed,
+                'latency_ms': round(self.latency * 1000, 1),
+                'target_ms': round(self.target * 1000),
+            }
+
+
+@lru_cache(maxsize=None)
+def get_stale_store():
+    """
+    Возвращает хранилище последних удачных ответов API процесса.
+
+    Отдельный LRU на CONCURRENCY_STALE_MAXSIZE записей: запросы с мусорными параметрами
+    не вытесняют погоду из near-cache.
+    """
+    return LocalLRUCache(maxsize=settings.CONCURRENCY_STALE_MAXSIZE, ttl=settings.CONCURRENCY_STALE_TTL)
+
+
+@lru_cache(maxsize=None)
+def get_limiter(route_class):
+    """
+    Возвращает лимитер класса маршрутов этого процесса (параметры из CONCURRENCY_CLASSES).
+    """
+    options = settings.CONCURRENCY_CLASSES[route_class]
+    return AIMDLimiter(route_class, options['initial'], options['min'], options['max'], options['target'])
+
+
+def limiters_snapshot():
+    """
+    Возвращает состояние всех лимитеров из CONCURRENCY_CLASSES.
+    """
+    return [get_limiter(route_class).snapshot() for route_class in settings.CONCURRENCY_CLASSES]
+
+
+class ConcurrencyLimitMiddleware:
+    """
+    Адаптивное ограничение параллельных запросов по классам маршрутов и сброс лишней нагрузки.
+
+    Маршруты из CONCURRENCY_ROUTES делятся на классы (например, 'upstream' — страницы и API,
+    которые ходят во внешний погодный API, 'db' — тяжёлые запросы к базе); у каждого класса свой
+    AIMDLimiter, поэтому медленный upstream не занимает потоки дешёвых страниц, которые не
+    ограничиваются совсем. Запрос погоды города, уже лежащей в near-cache, тоже не ограничивается:
+    он обслуживается без внешнего API.
+
+    Запрос сверх лимита получает 503 с Retry-After без ожидания в очереди, а маршруты из
+    CONCURRENCY_STALE_ROUTES (ответы API, не зависящие от пользователя) — последний удачный
+    JSON-ответ для того же города и параметров из STALE_KEY_PARAMS не старше
+    CONCURRENCY_STALE_TTL с заголовком Warning: 110, если пользователь вошёл в систему.
+    Город в обоих случаях ищется только по точному написанию, без нечёткого поиска.
+
+    Состояние лимитеров принадлежит процессу: ограничение работает, когда воркер обслуживает
+    несколько запросов одновременно (gunicorn --threads, ASGI).
+    """
+
+    def __init__(self, get_response):
+        if not settings.CONCURRENCY_LIMIT_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.routes = settings.CONCURRENCY_ROUTES
+        self.stale_routes = frozenset(settings.CONCURRENCY_STALE_ROUTES)
+
+    def __call__(self, request):
+        try:
+            response = self.get_response(request)
+        except BaseException:
+            self._release(request, None)
+            raise
+        self._release(request, response)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        route = request.resolver_match.view_name
+        if route not in self.routes:
+            return None
+        route_class, cache_key = self.routes[route]
+        if not self._needs_backend(request, cache_key):
+            return None
+        limiter = get_limiter(route_class)
+        if limiter.try_acquire():
+            request._concurrency_slot = (limiter, route, time.perf_counter())
+            return None
+        return self._shed(request, route)
+
+    def _needs_backend(self, request, cache_key):
+        """
+        Нужен ли запросу внешний API: для города с погодой в near-cache или формы без города — нет.
+        """
+        if cache_key is None:
+            return True
+        params = request.POST if request.method == 'POST' else request.GET
+        if 'lat' in params:
+            return True
+        city = params.get('city', '').strip()
+        if not city:
+            return False  # Пустая форма или ошибка валидации: внешний API не вызывается
+        if cache_key == 'forecast':
+            cache_key = f"forecast:{params.get('days', 7)}"
+        return not services.is_weather_cached(city, cache_key)
+
+    def _release(self, request, response):
+        slot = request.__dict__.pop('_concurrency_slot', None)
+        if slot is None:
+            return
+        limiter, route, started = slot
+        status = response.status_code if response is not None else 500
+        limiter.release(time.perf_counter() - started, overloaded=status in OVERLOAD_STATUSES)
+        if status == 200 and route in self.stale_routes and not response.streaming \
+                and response.get('Content-Type', '').startswith('application/json'):
+            key = self._stale_key(request)
+            if key is not None:
+                get_stale_store().set(route, key, (response.content, response['Content-Type']))
+
+    def _shed(self, request, route):
+        # process_view работает до аутентификации DRF: сохранённый ответ получают только вошедшие
+        # пользователи (API аутентифицирует по той же сессии), остальные — 503 как обычно
+        allowed = route in self.stale_routes and request.user.is_authenticated
+        key = self._stale_key(request) if allowed else None
+        if key is not None:
+            stale = get_stale_store().get(route, key)
+            if stale is not None:
+                content, content_type = stale
+                response = HttpResponse(content, content_type=content_type)
+                response['Warning'] = '110 - "Response is Stale"'
+                response['X-Load-Shed'] = 'stale'
+                return response
+        detail = 'Сервер перегружен. Пожалуйста, повторите запрос через несколько секунд.'
+        if route.startswith('v1:'):
+            response = JsonResponse({'detail': detail}, status=503)
+        else:
+            response = HttpResponse(detail, status=503, content_type='text/plain; charset=utf-8')
+        response['Retry-After'] = str(settings.CONCURRENCY_RETRY_AFTER)
+        response['X-Load-Shed'] = 'rejected'
+        return response
+
+    @staticmethod
+    def _stale_key(request):
+        """
+        Ключ ответа: канонический город и нормализованные параметры; None — ответ не сохраняется.
+
+        Запросы по координатам, незнакомые города и браузерный HTML-интерфейс API не кэшируются.
+        """
+        params = request.GET
+        if 'lat' in params or params.get('format', 'json') != 'json' or \
+                ('format' not in params and 'text/html' in request.META.get('HTTP_ACCEPT', '')):
+            return None
+        canonical = services.lookup_city(params.get('city', '').strip())
+        if canonical is None:
+            return None
+        parts = [str(canonical.id)]
+        for name in STALE_KEY_PARAMS:
+            value = params.get(name, '').strip()
+            if name == 'fields':
+                value = ','.join(sorted({field.strip() for field in value.split(',') if field.strip()}))
+            elif value.isdigit():
+                value = str(int(value))
+            parts.append(value)
+        return '|'.join(parts)
@@ -1,79 +1,73 @@
-import json
 from channels.generic.websocket import AsyncWebsocketConsumer
 
+from . import wire
+from .chat_hub import get_room_hub
+
 
 class ChatConsumer(AsyncWebsocketConsumer):
     """
     WebSocket-потребитель для чата, использующий Django Channels.
 
+    Сообщения, индикатор «печатает…» и список онлайн доставляются клиенту пакетами:
+    хаб комнаты (chat_hub.RoomHub) собирает события за тик и отправляет их одним кадром
+    вида {"type": "batch", "messages": [...], "typing": [...], "presence": [...]}.
+
+    Клиент может запросить бинарный подпротокол 'chat.msgpack' (кадры msgpack, большие — сжатые,
+    см. wire.encode_binary_frame); без него используется текстовый JSON.
+
     Методы:
-        connect: Подключает пользователя к группе сообщений.
-        disconnect: Отключает пользователя от группы сообщений.
-        receive: Обрабатывает входящие сообщения от клиента.
-        chat_message: Отправляет сообщение клиенту после получения из группы.
+        connect: Подключает пользователя к хабу комнаты.
+        disconnect: Отключает пользователя от хаба комнаты.
+        receive: Обрабатывает входящие сообщения и события «печатает…» от клиента.
     """
 
     async def connect(self):
         """
         Обрабатывает установление WebSocket-соединения.
 
-        Подключает пользователя к группе сообщений на основе имени комнаты.
+        Подключает пользователя к хабу комнаты на основе имени комнаты.
         """
         self.room_name = 'chat_room'
         self.room_group_name = f'chat_{self.room_name}'
-
-        await self.channel_layer.group_add(
-            self.room_group_name,
-            self.channel_name
-        )
-        await self.accept()
+        self.username = self.scope['user'].username
+
+        subprotocols = self.scope.get('subprotocols', [])
+        self.binary = wire.BINARY_SUBPROTOCOL in subprotocols
+        if self.binary:
+            await self.accept(subprotocol=wire.BINARY_SUBPROTOCOL)
+        elif wire.TEXT_SUBPROTOCOL in subprotocols:
+            await self.accept(subprotocol=wire.TEXT_SUBPROTOCOL)
+        else:
+            await self.accept()
+        # Хаб ищется после accept: за время ожидания прежний хаб комнаты мог закрыться
+        self.hub = await get_room_hub(self.room_group_name).join(self)
 
     async def disconnect(self, close_code):
         """
         Обрабатывает отключение WebSocket-соединения.
 
-        Отключает пользователя от группы сообщений.
+        Отключает пользователя от хаба комнаты.
         """
-        await self.channel_layer.group_discard(
-            self.room_group_name,
-            self.channel_name
-        )
+        await self.hub.leave(self)
 
-    async def receive(self, text_data):
+    async def receive(self, text_data=None, bytes_data=None):
         """
         Обрабатывает получение сообщения от клиента WebSocket.
 
-        Десериализует сообщение и отправляет его в группу.
+        Десериализует сообщение и отправляет его в группу. Сообщение вида {"typing": true}
+        означает, что пользователь набирает текст.
 
         Параметры:
             text_data (str): Сообщение в формате JSON, полученное от клиента.
+            bytes_data (bytes): Сообщение в формате msgpack (бинарный подпротокол).
         """
-        data = json.loads(text_data)
-        message = data['message']
-        username = self.scope['user'].username
-
-        await self.channel_layer.group_send(
-            self.room_group_name,
-            {
-                'type': 'chat_message',
-                'message': message,
-                'username': username,
-            }
-        )
-
-    async def chat_message(self, event):
-        """
-        Отправляет сообщение обратно клиенту WebSocket.
-
-        Получает сообщение из группы и отправляет его обратно на WebSocket.
-
-        Параметры:
-            event (dict): Сообщение из группы, содержащие данные 'message' и 'username'.
-        """
-        message = event['message']
-        username = event['username']
-
-        await self.send(text_data=json.dumps({
-            'message': message,
-            'username': username,
-        }))
+        try:
+            data = wire.decode_client_message(text_data, bytes_data)
+        except ValueError:
+            await self.close(code=1003)  # Сжатый, повреждённый или чужой по формату кадр: клиент нарушает протокол
+            return
+        if 'typing' in data:
+            await self.hub.send_typing(self.username)
+            return
+
+        await self.hub.send_message(self.username, data['message'])
@@ -1,6 +1,22 @@
 from django import forms
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib.auth.models import User
+from django.db.models import F, Lookup, Q
+from django.db.models.functions import Lower
+
+
+class NotEqual(Lookup):
+    """
+    Условие lhs <> rhs в виде, который планировщик сопоставляет с условием частичного индекса
+    (~Q(email='') даёт NOT (email = ''), и SQLite такой индекс не использует).
+    """
+
+    lookup_name = 'ne'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f'{lhs} <> {rhs}', (*lhs_params, *rhs_params)
 
 
 class UserRegistrationForm(UserCreationForm):
@@ -35,23 +51,50 @@ class UserRegistrationForm(UserCreationForm):
 
     def clean_username(self):
         """
-        Проверка уникальности имени пользователя.
-        Если имя пользователя уже существует в базе данных, выбрасывается ошибка валидации.
+        Возвращает имя пользователя без отдельного запроса к базе:
+        уникальность проверяется вместе с электронной почтой в clean().
         """
-        username = self.cleaned_data.get('username')
-        if User.objects.filter(username=username).exists():
-            raise forms.ValidationError("Это имя пользователя уже занято.")
-        return username
+        return self.cleaned_data.get('username')
+
+    def clean(self):
+        """
+        Проверка уникальности имени пользователя и электронной почты одним запросом.
+
+        Имя пользователя сравнивается точно (уникальный индекс auth_user.username),
+        адрес электронной почты — без учёта регистра по выражению LOWER(email),
+        для которого миграция 0006 создаёт уникальный индекс. Если одно из полей
+        уже не прошло проверку, в запросе участвует только второе.
+        """
+        cleaned_data = super().clean()
+        username = cleaned_data.get('username')
+        email = cleaned_data.get('email')
+
+        condition = Q()
+        if username:
+            condition |= Q(username=username)
+        if email:
+            # Условие email <> '' позволяет базе использовать частичный индекс
+            condition |= Q(email_lower=email.lower()) & Q(NotEqual(F('email'), ''))
+        if not condition:
+            return cleaned_data
+
+        taken = (
+            User.objects.annotate(email_lower=Lower('email'))
+            .filter(condition)
+            .values_list('username', 'email_lower')[:2]
+        )
+        for taken_username, taken_email in taken:
+            if username and taken_username == username and 'username' not in self.errors:
+                self.add_error('username', "Это имя пользователя уже занято.")
+            if email and taken_email == email.lower() and 'email' not in self.errors:
+                self.add_error('email', "Этот адрес электронной почты уже используется.")
+        return cleaned_data
 
-    def clean_email(self):
+    def validate_unique(self):
         """
-        Проверка уникальности электронной почты.
-        Если адрес электронной почты уже используется другим пользователем, выбрасывается ошибка валидации.
+        Пропускает повторную проверку уникальности модели: её уже выполнил clean(),
+        а от гонки между проверкой и вставкой защищают уникальные индексы базы.
         """
-        email = self.cleaned_data.get('email')
-        if User.objects.filter(email=email).exists():
-            raise forms.ValidationError("Этот адрес электронной почты уже используется.")
-        return email
 
     def clean_password1(self):
         """
@@ -0,0 +1,186 @@
+import math
+import threading
+import time
+from collections import defaultdict
+from functools import lru_cache
+
+from django.conf import settings
+
+from .lazy import lazy_import
+
+np = lazy_import('numpy')
+
+EARTH_RADIUS_KM = 6371.0088
+# Длина градуса широты (и долготы на экваторе) в километрах
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """
+    Расстояние по большому кругу в километрах; аргументы — числа или массивы numpy в градусах.
+    """
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+def parse_coordinates(lat, lon):
+    """
+    Разбирает широту и долготу из строк запроса.
+
+    Возвращает:
+        tuple: (lat, lon) как float.
+
+    Исключения:
+        ValueError: Если значения не числа или вне диапазонов [-90, 90] и [-180, 180].
+    """
+    lat, lon = float(lat), float(lon)
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):  # Заодно отсекает NaN
+        raise ValueError('координаты вне допустимого диапазона')
+    return lat, lon
+
+
+class GridIndex:
+    """
+    Пространственный индекс городов со свежими данными: равномерная сетка по широте и долготе.
+
+    Координаты и сроки годности хранятся в массивах numpy (растут удвоением), ячейка сетки
+    хранит номера строк. Поиск просматривает только ячейки, пересекающие круг
+    радиуса, и считает расстояния до кандидатов одной векторной операцией. Город добавляется
+    или обновляется за O(1), поэтому индекс пополняется по мере заполнения кэша погоды.
+    Строки удалённых и истёкших записей используются повторно, так что размер массивов
+    ограничен числом городов, одновременно лежащих в кэше.
+
+    Параметры:
+        cell_deg (float): Размер ячейки в градусах.
+        capacity (int): Начальный размер массивов.
+    """
+
+    def __init__(self, cell_deg=0.5, capacity=1024):
+        self.cell_deg = cell_deg
+        self._columns = int(round(360 / cell_deg))
+        self._lat = np.empty(capacity)
+        self._lon = np.empty(capacity)
+        self._expires = np.empty(capacity)
+        self._size = 0
+        self._cities = []
+        self._rows = {}
+        self._free = []
+        self._cells = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        with self._lock:
+            return int((self._expires[:self._size] > time.monotonic()).sum())
+
+    def add(self, city, lat, lon, ttl):
+        """
+        Добавляет город с координатами точки данных или продлевает срок его записи на ttl секунд.
+        """
+        expires = time.monotonic() + ttl
+        cell = self._cell(lat, lon)
+        with self._lock:
+            row = self._rows.get(city.id)
+            if row is None:
+                row = self._append()
+                self._rows[city.id] = row
+                if row == len(self._cities):
+                    self._cities.append(city)
+                else:
+                    self._cities[row] = city
+                self._cells[cell].append(row)
+            else:
+                self._cities[row] = city
+                old_cell = self._cell(self._lat[row], self._lon[row])
+                if old_cell != cell:
+                    self._unlink(old_cell, row)
+                    self._cells[cell].append(row)
+            self._lat[row], self._lon[row], self._expires[row] = lat, lon, expires
+
+    def discard(self, city_id):
+        """
+        Удаляет запись города (например, после инвалидации кэша погоды); её строка освобождается.
+        """
+        with self._lock:
+            row = self._rows.get(city_id)
+            if row is not None:
+                self._free_row(city_id, row)
+
+    def nearest(self, lat, lon, radius_km, limit=5):
+        """
+        Возвращает до limit ближайших свежих городов в радиусе radius_km, от ближнего к дальнему.
+
+        Возвращает:
+            list: Пары (City, расстояние в км).
+        """
+        with self._lock:
+            rows = [row for cell in self._cells_within(lat, lon, radius_km) for row in self._cells.get(cell, ())]
+            if not rows:
+                return []
+            rows = np.array(rows)
+            fresh = rows[self._expires[rows] > time.monotonic()]
+            distances = haversine_km(lat, lon, self._lat[fresh], self._lon[fresh])
+            inside = distances <= radius_km
+            fresh, distances = fresh[inside], distances[inside]
+            order = np.argsort(distances)[:limit]
+            return [(self._cities[row], float(distances[i])) for i, row in zip(order, fresh[order])]
+
+    def _append(self):
+        if not self._free and self._size == len(self._lat):
+            # Прежде чем расти, освобождаем строки истёкших записей
+            now = time.monotonic()
+            for city_id, row in list(self._rows.items()):
+                if self._expires[row] <= now:
+                    self._free_row(city_id, row)
+        if self._free:
+            return self._free.pop()
+        if self._size == len(self._lat):
+            capacity = 2 * len(self._lat)
+            self._lat = np.resize(self._lat, capacity)
+            self._lon = np.resize(self._lon, capacity)
+            self._expires = np.resize(self._expires, capacity)
+        self._size += 1
+        return self._size - 1
+
+    def _free_row(self, city_id, row):
+        del self._rows[city_id]
+        self._unlink(self._cell(self._lat[row], self._lon[row]), row)
+        self._cities[row] = None
+        self._expires[row] = -math.inf
+        self._free.append(row)
+
+    def _unlink(self, cell, row):
+        rows = self._cells[cell]
+        rows.remove(row)
+        if not rows:
+            del self._cells[cell]
+
+    def _cell(self, lat, lon):
+        return int(math.floor(lat / self.cell_deg)), int(math.floor(lon / self.cell_deg)) % self._columns
+
+    def _cells_within(self, lat, lon, radius_km):
+        """
+        Ячейки, пересекающие квадрат вокруг круга поиска (с переходом через 180-й меридиан).
+        """
+        dlat = radius_km / KM_PER_DEGREE
+        south, north = max(lat - dlat, -90.0), min(lat + dlat, 90.0)
+        widest = max(abs(south), abs(north))
+        cos_lat = math.cos(math.radians(widest))
+        if cos_lat * 180 * KM_PER_DEGREE <= radius_km:
+            columns = range(self._columns)  # Круг у полюса охватывает все долготы
+        else:
+            dlon = radius_km / (KM_PER_DEGREE * cos_lat)
+            first = int(math.floor((lon - dlon) / self.cell_deg))
+            last = int(math.floor((lon + dlon) / self.cell_deg))
+            columns = [column % self._columns for column in range(first, min(last, first + self._columns - 1) + 1)]
+        first_row = int(math.floor(south / self.cell_deg))
+        last_row = int(math.floor(north / self.cell_deg))
+        return [(row, column) for row in range(first_row, last_row + 1) for column in columns]
+
+
+@lru_cache(maxsize=None)
+def get_geo_index():
+    """
+    Возвращает пространственный индекс процесса для городов с погодой в near-cache.
+    """
+    return GridIndex(cell_deg=settings.NEARBY_GRID_DEG)
@@ -0,0 +1,204 @@
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from functools import lru_cache
+
+from django.conf import settings
+
+from . import profiling
+from .lazy import lazy_import
+from .providers import WeatherServiceError
+
+requests = lazy_import('requests')
+
+# Иконки погоды weatherapi.com: размер/время суток/код.png, например '64x64/day/113.png'
+ICON_PATH_RE = re.compile(r'^(?:64x64|128x128)/(?:day|night)/\d{3}\.png$')
+# Спрайт адресуется по хешу содержимого, поэтому может кэшироваться браузером навсегда
+SPRITE_PATH_RE = re.compile(r'^sprite-(?P<digest>[0-9a-f]{64})\.png$')
+ICON_CDN_PREFIX = '//cdn.weatherapi.com/weather/'
+
+# Как часто проверяется, не появился ли спрайт, если его не было (секунды)
+SPRITE_RECHECK_INTERVAL = 60
+
+# Полный набор кодов иконок weatherapi.com
+ICON_CODES = (
+    113, 116, 119, 122, 143, 176, 179, 182, 185, 200, 227, 230, 248, 260, 263, 266,
+    281, 284, 293, 296, 299, 302, 305, 308, 311, 314, 317, 320, 323, 326, 329, 332,
+    335, 338, 350, 353, 356, 359, 362, 365, 368, 371, 374, 377, 386, 389, 392, 395,
+)
+
+
+def icon_path(url):
+    """
+    Возвращает относительный путь иконки для URL с CDN провайдера.
+
+    Параметры:
+        url (str): Адрес иконки из ответа API ('//cdn.weatherapi.com/weather/64x64/day/113.png').
+
+    Возвращает:
+        str | None: Путь ('64x64/day/113.png') или None, если это не иконка провайдера.
+    """
+    if not url:
+        return None
+    url = url.split(':', 1)[1] if url.startswith(('http:', 'https:')) else url
+    if not url.startswith(ICON_CDN_PREFIX):
+        return None
+    path = url[len(ICON_CDN_PREFIX):]
+    return path if ICON_PATH_RE.match(path) else None
+
+
+class IconCache:
+    """
+    Дисковый кэш иконок с адресацией по содержимому.
+
+    Файлы хранятся как objects/<sha256[:2]>/<sha256>.png, а refs/<путь> содержит хеш файла.
+    Одинаковые иконки (например, дневная и ночная версии одного кода) хранятся один раз,
+    а запись через временный файл и os.replace безопасна для нескольких воркеров.
+
+    Параметры:
+        root (str): Каталог кэша.
+        upstream_base (str): Базовый URL CDN, откуда скачиваются отсутствующие иконки.
+        timeout (float): Таймаут запроса к CDN в секундах.
+    """
+
+    def __init__(self, root, upstream_base, timeout=5):
+        self.root = root
+        self.upstream_base = upstream_base.rstrip('/') + '/'
+        self.timeout = timeout
+        self._digests = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+        self._sprite = None
+        self._sprite_missing_until = 0.0
+
+    def get(self, path):
+        """
+        Возвращает иконку из кэша, при промахе скачивая её с CDN (один запрос на путь даже при гонке).
+
+        Параметры:
+            path (str): Относительный путь иконки.
+
+        Возвращает:
+            tuple: (хеш содержимого, путь к файлу на диске).
+
+        Исключения:
+            WeatherServiceError: CDN недоступен или вернул ошибку.
+        """
+        digest = self._digest(path)
+        if digest is None:
+            with self._path_lock(path):
+                digest = self._digest(path)
+                if digest is None:
+                    digest = self.store(path, self._download(path))
+        return digest, self.object_file(digest)
+
+    def store(self, path, content):
+        """
+        Сохраняет содержимое в кэш и привязывает к нему путь.
+
+        Возвращает:
+            str: Хеш содержимого (sha256).
+        """
+        digest = hashlib.sha256(content).hexdigest()
+        object_file = self.object_file(digest)
+        if not os.path.exists(object_file):
+            self._write(object_file, content)
+        self._write(self._ref_file(path), digest.encode())
+        self._digests[path] = digest
+        return digest
+
+    def object_file(self, digest):
+        return os.path.join(self.root, 'objects', digest[:2], f'{digest}.png')
+
+    def sprite(self):
+        """
+        Возвращает карту спрайта {путь иконки: (x, y, ширина, высота)} и хеш файла спрайта
+        или None, если спрайт не собран (см. команду build_icon_sprite).
+
+        Отсутствие спрайта тоже запоминается: файл перепроверяется не чаще раза
+        в SPRITE_RECHECK_INTERVAL секунд, а не при выводе каждой иконки.
+        """
+        if self._sprite is None:
+            if time.monotonic() < self._sprite_missing_until:
+                return None
+            try:
+                with open(os.path.join(self.root, 'sprite.json'), encoding='utf-8') as f:
+                    manifest = json.load(f)
+            except FileNotFoundError:
+                self._sprite_missing_until = time.monotonic() + SPRITE_RECHECK_INTERVAL
+                return None
+            self._sprite = manifest['digest'], {path: tuple(box) for path, box in manifest['icons'].items()}
+        return self._sprite
+
+    def save_sprite(self, content, boxes):
+        """
+        Сохраняет собранный спрайт и его карту.
+
+        Параметры:
+            content (bytes): PNG-файл спрайта.
+            boxes (dict): {путь иконки: (x, y, ширина, высота)}.
+
+        Возвращает:
+            str: Хеш файла спрайта.
+        """
+        digest = self.store('sprite.png', content)
+        manifest = {'digest': digest, 'icons': boxes}
+        self._write(os.path.join(self.root, 'sprite.json'), json.dumps(manifest).encode())
+        self._sprite = None
+        self._sprite_missing_until = 0.0
+        return digest
+
+    def _digest(self, path):
+        digest = self._digests.get(path)
+        if digest is None:
+            try:
+                with open(self._ref_file(path), encoding='ascii') as f:
+                    digest = f.read().strip()
+            except FileNotFoundError:
+                return None
+            if not os.path.exists(self.object_file(digest)):
+                return None
+            self._digests[path] = digest
+        return digest
+
+    def _download(self, path):
+        try:
+            with profiling.phase('upstream'):
+                response = requests.get(self.upstream_base + path, timeout=self.timeout)
+            response.raise_for_status()
+        except requests.exceptions.RequestException as e:
+            raise WeatherServiceError(f"Не удалось загрузить иконку {path}: {e}") from e
+        if not response.content.startswith(b'\x89PNG'):
+            raise WeatherServiceError(f"CDN вернул не PNG для иконки {path}")
+        return response.content
+
+    def _path_lock(self, path):
+        with self._lock:
+            return self._locks.setdefault(path, threading.Lock())
+
+    def _ref_file(self, path):
+        return os.path.join(self.root, 'refs', *path.split('/'))
+
+    @staticmethod
+    def _write(file_path, content):
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(file_path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(content)
+            os.replace(tmp_path, file_path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+
+@lru_cache(maxsize=None)
+def get_icon_cache():
+    """
+    Возвращает кэш иконок процесса (settings.ICON_CACHE_DIR, settings.ICON_UPSTREAM_BASE).
+    """
+    return IconCache(settings.ICON_CACHE_DIR, settings.ICON_UPSTREAM_BASE, timeout=settings.WEATHER_UPSTREAM_TIMEOUT)
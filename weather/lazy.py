@@ -0,0 +1,85 @@
+import importlib
+import importlib.util
+import sys
+import threading
+import types
+
+
+class _LazyModule(types.ModuleType):
+    """
+    Заглушка модуля: при первом обращении к атрибуту импортирует настоящий модуль и копирует его атрибуты.
+
+    Импорт выполняется обычным importlib.import_module под блокировкой заглушки, а не через
+    importlib.util.LazyLoader: до Python 3.12.3 тот не потокобезопасен (gh-114763), и при
+    одновременном первом обращении из потоков gthread-воркера второй поток видел
+    недозагруженный модуль и получал AttributeError.
+    """
+
+    def __init__(self, name):
+        super().__init__(name)
+        self._lazy_lock = threading.Lock()
+
+    def __getattr__(self, attr):
+        with self._lazy_lock:
+            module = importlib.import_module(self.__name__)
+            for key, value in vars(module).items():
+                self.__dict__.setdefault(key, value)  # Подменённые тестами атрибуты не перезаписываются
+        return getattr(module, attr)
+
+
+def lazy_import(name):
+    """
+    Возвращает модуль, реальная загрузка которого откладывается до первого обращения к атрибуту.
+
+    Используется для тяжёлых зависимостей (HTTP-клиент, генераторы документации),
+    которые не нужны при старте воркера и импортируются только на первом запросе.
+    Первое обращение из нескольких потоков одновременно безопасно.
+
+    Параметры:
+        name (str): Полное имя модуля, например 'requests'.
+
+    Возвращает:
+        module: Уже загруженный модуль из sys.modules или ленивый модуль-заглушку.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+
+    if importlib.util.find_spec(name) is None:
+        raise ModuleNotFoundError(f"No module named '{name}'", name=name)
+    return _LazyModule(name)
+
+
+class LazyView:
+    """
+    Class-based представление DRF, импортируемое при первом запросе, а не при загрузке URLConf.
+
+    Атрибуты 'cls' и 'initkwargs' проксируются к настоящему представлению, поэтому
+    генератор схемы drf_yasg видит эндпоинты (и импортирует их только при построении схемы).
+    Представления DRF сами проверяют CSRF в SessionAuthentication, поэтому обёртка помечена csrf_exempt.
+
+    Параметры:
+        dotted_path (str): Путь к классу представления, например 'weather.api.views.ForecastView'.
+        **initkwargs: Аргументы для as_view().
+    """
+    csrf_exempt = True
+
+    def __init__(self, dotted_path, **initkwargs):
+        self.dotted_path = dotted_path
+        self.initkwargs = initkwargs
+        self.__module__, self.__name__ = dotted_path.rsplit('.', 1)
+        self.__qualname__ = self.__name__
+        self._view = None
+
+    @property
+    def view(self):
+        if self._view is None:
+            from django.utils.module_loading import import_string
+            self._view = import_string(self.dotted_path).as_view(**self.initkwargs)
+        return self._view
+
+    @property
+    def cls(self):
+        return self.view.cls
+
+    def __call__(self, request, *args, **kwargs):
+        return self.view(request, *args, **kwargs)
@@ -0,0 +1,93 @@
+import hashlib
+import logging
+
+import redis
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+# Ошибки недоступного кэша: ограничение попыток отключается, а вход продолжает работать
+CACHE_ERRORS = (redis.RedisError, OSError)
+
+
+def client_address(request):
+    """
+    Возвращает IP-адрес клиента.
+
+    За LOGIN_THROTTLE_PROXY_COUNT доверенными прокси адрес берётся из X-Forwarded-For
+    (запись, добавленная самым дальним из них): иначе все клиенты делили бы адрес прокси.
+    """
+    proxies = settings.LOGIN_THROTTLE_PROXY_COUNT
+    if proxies:
+        forwarded = [part.strip() for part in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',') if part.strip()]
+        if len(forwarded) >= proxies:
+            return forwarded[-proxies]
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def _keys(request, username):
+    """
+    Ключи счётчиков неудачных попыток: по имени пользователя с IP-адреса клиента и по IP-адресу.
+
+    Счётчик имени учитывает адрес: иначе любой мог бы заблокировать вход чужому пользователю,
+    намеренно ошибаясь в пароле. Имя хешируется: оно приходит из формы и может содержать
+    символы, недопустимые в ключах кэша.
+    """
+    address = client_address(request)
+    user = hashlib.sha256(f'{(username or "").lower()}|{address}'.encode()).hexdigest()
+    return (
+        (f'login-fail:user:{user}', settings.LOGIN_THROTTLE_ATTEMPTS),
+        (f'login-fail:ip:{address}', settings.LOGIN_THROTTLE_IP_ATTEMPTS),
+    )
+
+
+def is_throttled(request, username):
+    """
+    Проверяет, исчерпан ли лимит неудачных попыток входа для имени пользователя или IP-адреса.
+
+    Проверка выполняется до authenticate(), поэтому перебор паролей после превышения
+    лимита не тратит CPU на вычисление хеша пароля. Счётчики хранятся в общем кэше
+    (settings.CACHES), поэтому лимит действует на все воркеры вместе.
+
+    Параметры:
+        request (HttpRequest): Запрос на вход.
+        username (str): Введённое имя пользователя.
+
+    Возвращает:
+        bool: True, если попытку нужно отклонить до окончания окна LOGIN_THROTTLE_WINDOW.
+    """
+    keys = _keys(request, username)
+    try:
+        counts = cache.get_many([key for key, _ in keys])
+    except CACHE_ERRORS:
+        logger.warning('Кэш недоступен: вход без ограничения попыток', exc_info=True)
+        return False
+    return any(counts.get(key, 0) >= limit for key, limit in keys)
+
+
+def register_failure(request, username):
+    """
+    Учитывает неудачную попытку входа. Окно отсчитывается от первой неудачи.
+    """
+    try:
+        for key, _ in _keys(request, username):
+            if not cache.add(key, 1, settings.LOGIN_THROTTLE_WINDOW):
+                try:
+                    cache.incr(key)
+                except ValueError:  # Ключ истёк между add и incr
+                    cache.add(key, 1, settings.LOGIN_THROTTLE_WINDOW)
+    except CACHE_ERRORS:
+        logger.warning('Кэш недоступен: неудачная попытка входа не учтена', exc_info=True)
+
+
+def reset(request, username):
+    """
+    Сбрасывает счётчик неудач для имени пользователя с этого адреса после успешного входа.
+
+    Счётчик IP-адреса не сбрасывается: иначе один свой аккаунт позволял бы
+    бесконечно перебирать пароли к чужим.
+    """
+    try:
+        cache.delete(_keys(request, username)[0][0])
+    except CACHE_ERRORS:
+        logger.warning('Кэш недоступен: счётчик неудач не сброшен', exc_info=True)
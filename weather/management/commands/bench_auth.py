@@ -0,0 +1,166 @@
+import random
+import secrets
+import time
+
+from django.conf import settings
+from django.contrib.auth import authenticate
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, reset_queries
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from weather import login_throttle
+from weather.forms import UserRegistrationForm
+
+HASHERS = {
+    'pbkdf2_sha256': 'django.contrib.auth.hashers.PBKDF2PasswordHasher',
+    'argon2': 'django.contrib.auth.hashers.Argon2PasswordHasher',
+    'bcrypt_sha256': 'django.contrib.auth.hashers.BCryptSHA256PasswordHasher',
+    'scrypt': 'django.contrib.auth.hashers.ScryptPasswordHasher',
+    'md5': 'django.contrib.auth.hashers.MD5PasswordHasher',
+}
+PASSWORD = 'BenchPassword123'
+DELETE_BATCH = 10000
+
+
+class BenchRouter:
+    """
+    Направляет все запросы замера (формы, authenticate) в выбранную базу.
+    """
+
+    def __init__(self, alias):
+        self.alias = alias
+
+    def db_for_read(self, model, **hints):
+        return self.alias
+
+    def db_for_write(self, model, **hints):
+        return self.alias
+
+
+class Command(BaseCommand):
+    """
+    Измеряет регистрацию и вход на большой таблице пользователей с выбранным хешером паролей.
+
+    Пользователи bench_<метка запуска>_<n> создаются пачками (хеш пароля вычисляется один раз);
+    после замера удаляются ровно созданные командой записи, если не указан --keep. База
+    указывается явно (--database): DATABASES по умолчанию указывает на рабочую базу, а DEBUG
+    в этом проекте включён и там, поэтому не годится как признак тестового окружения.
+
+    Пример: python manage.py bench_auth --database default --users 1000000 --hasher pbkdf2_sha256
+    """
+    help = 'Бенчмарк регистрации и входа: запросы и время на операцию при N пользователях.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1_000_000, help='Размер таблицы пользователей.')
+        parser.add_argument('--hasher', default='pbkdf2_sha256',
+                            help=f"Хешер паролей: {', '.join(HASHERS)} или путь к классу.")
+        parser.add_argument('--registrations', type=int, default=200, help='Количество регистраций.')
+        parser.add_argument('--logins', type=int, default=200, help='Количество входов.')
+        parser.add_argument('--keep', action='store_true', help='Не удалять созданных пользователей.')
+        parser.add_argument('--database', required=True,
+                            help='Псевдоним базы из DATABASES; указывается явно, чтобы не задеть рабочую базу.')
+
+    def handle(self, *args, **options):
+        self.alias = options['database']
+        if self.alias not in settings.DATABASES:
+            raise CommandError(f'Неизвестная база: {self.alias}')
+        self.connection = connections[self.alias]
+        self.prefix = f'bench_{secrets.token_hex(4)}_'
+        hasher = HASHERS.get(options['hasher'], options['hasher'])
+        with override_settings(PASSWORD_HASHERS=[hasher], DATABASE_ROUTERS=[BenchRouter(self.alias)]):
+            try:
+                self.seed(options['users'])
+                self.bench_registration(options['registrations'])
+                self.bench_login(options['users'], options['logins'])
+            finally:
+                if not options['keep']:
+                    self.cleanup()
+
+    def seed(self, users, batch_size=10000):
+        """
+        Создаёт пользователей <prefix><n> этого запуска.
+        """
+        password = make_password(PASSWORD)
+        started = time.perf_counter()
+        for start in range(0, users, batch_size):
+            User.objects.bulk_create([
+                User(username=f'{self.prefix}{n}', email=f'{self.prefix}{n}@example.com', password=password)
+                for n in range(start, min(start + batch_size, users))
+            ])
+        self.stdout.write(f'Создано пользователей: {users} за {time.perf_counter() - started:.1f} с')
+
+        name = f'{self.prefix}{users // 2}'
+        form = UserRegistrationForm({'username': name, 'email': f'{name}@example.com',
+                                     'password1': PASSWORD, 'password2': PASSWORD})
+        reset_queries()  # При DEBUG журнал запросов после вставок заполнен, и новые записи не видны
+        with CaptureQueriesContext(self.connection) as captured:
+            form.is_valid()
+        with self.connection.cursor() as cursor:
+            explain = 'EXPLAIN QUERY PLAN ' if self.connection.vendor == 'sqlite' else 'EXPLAIN '
+            cursor.execute(explain + captured[-1]['sql'])  # Параметры уже подставлены в текст запроса
+            plan = '\n'.join(' '.join(map(str, row)) for row in cursor.fetchall())
+        self.stdout.write(f'План проверки занятости:\n{plan}')
+
+    def bench_registration(self, count):
+        """
+        Регистрация через UserRegistrationForm: валидация (проверка занятости) и сохранение с хешем.
+        """
+        validate = save = 0.0
+        queries = 0
+        for i in range(count):
+            name = f'{self.prefix}new_{i}'
+            form = UserRegistrationForm({'username': name, 'email': f'{name.upper()}@Example.com',
+                                         'password1': PASSWORD, 'password2': PASSWORD})
+            reset_queries()
+            started = time.perf_counter()
+            with CaptureQueriesContext(self.connection) as captured:
+                if not form.is_valid():
+                    raise RuntimeError(form.errors.as_text())
+            validate += time.perf_counter() - started
+            queries += len(captured)
+            started = time.perf_counter()
+            form.save()
+            save += time.perf_counter() - started
+        self._report('регистрация: валидация', validate, count, f'{queries / count:.1f} запросов')
+        self._report('регистрация: сохранение', save, count)
+
+    def bench_login(self, users, count):
+        """
+        Вход: authenticate() с проверкой хеша и отказ по лимиту попыток без проверки пароля.
+        """
+        factory = RequestFactory()
+        names = [f'{self.prefix}{random.randrange(users)}' for _ in range(count)]
+        started = time.perf_counter()
+        for name in names:
+            if authenticate(factory.post('/login/'), username=name, password=PASSWORD) is None:
+                raise RuntimeError(f'Не удалось войти как {name}')
+        self._report('вход', time.perf_counter() - started, count)
+
+        request = factory.post('/login/', REMOTE_ADDR='198.51.100.1')
+        for _ in range(2):
+            login_throttle.register_failure(request, names[0])
+        started = time.perf_counter()
+        for _ in range(count):
+            login_throttle.is_throttled(request, names[0])
+        self._report('проверка лимита входа', time.perf_counter() - started, count)
+        login_throttle.reset(request, names[0])
+
+    def cleanup(self):
+        """
+        Удаляет только пользователей, созданных этим запуском (по первичным ключам, пачками).
+
+        Префикс имён случаен для каждого запуска, поэтому под ним нет чужих записей.
+        """
+        created = list(User.objects.filter(username__startswith=self.prefix).values_list('pk', flat=True))
+        for start in range(0, len(created), DELETE_BATCH):
+            User.objects.filter(pk__in=created[start:start + DELETE_BATCH]).delete()
+        self.stdout.write(f'Удалено пользователей: {len(created)}')
+
+    def _report(self, name, elapsed, count, extra=''):
+        self.stdout.write(
+            f'{name:>26}: {elapsed / count * 1000:8.2f} мс/операция, {count / max(elapsed, 1e-9):10,.0f}/с'
+            + (f', {extra}' if extra else '')
+        )
@@ -0,0 +1,116 @@
+import asyncio
+import json
+import time
+
+from channels.layers import InMemoryChannelLayer
+from django.core.management.base import BaseCommand
+
+from weather.chat_hub import RoomHub
+
+
+class FakeSocket:
+    """
+    Имитация WebSocket-соединения: считает кадры и байты, ничего не отправляя.
+    """
+
+    binary = False
+
+    def __init__(self, username):
+        self.username = username
+        self.frames = 0
+        self.bytes = 0
+        self.messages = 0
+
+    async def send(self, text_data=None, bytes_data=None):
+        self.frames += 1
+        self.bytes += len(text_data or bytes_data)
+        # Сообщения в кадре считаются по подстроке, без разбора JSON
+        self.messages += text_data.count('"message":') if text_data else 0
+
+
+class Command(BaseCommand):
+    """
+    Сравнивает рассылку сообщений чата по одному кадру на сообщение и пакетами по тикам.
+
+    Пример: python manage.py bench_chat --sockets 2000 --messages 500 --rate 2000
+    """
+    help = 'Бенчмарк рассылки чата: кадры в секунду и CPU на доставленное сообщение.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sockets', type=int, default=2000, help='Количество имитируемых соединений.')
+        parser.add_argument('--messages', type=int, default=500, help='Количество сообщений в комнату.')
+        parser.add_argument('--rate', type=float, default=2000, help='Темп входящих сообщений, сообщений/с.')
+        parser.add_argument('--tick', type=float, default=0.05, help='Тик пакетной рассылки в секундах.')
+
+    def handle(self, *args, **options):
+        for name, bench in (('по одному', self.bench_unbatched), ('пакетами', self.bench_batched)):
+            result = asyncio.run(bench(options))
+            delivered = result['delivered'] or 1
+            self.stdout.write(
+                f"{name:>10}: кадров {result['frames']:>9} ({result['frames'] / result['wall']:,.0f}/с), "
+                f"JSON-кодирований {result['encodes']:>7}, доставлено {result['delivered']:>9}, "
+                f"CPU {result['cpu'] / delivered * 1e6:.2f} мкс/сообщение, {result['wall']:.2f} с"
+            )
+
+    @staticmethod
+    def _sockets(options):
+        return [FakeSocket(f'user{i}') for i in range(options['sockets'])]
+
+    async def _feed(self, options, send):
+        interval = 1 / options['rate']
+        started = time.monotonic()
+        for i in range(options['messages']):
+            await send({'type': 'chat.message', 'username': f'user{i % 50}', 'message': f'Сообщение {i}'})
+            delay = started + (i + 1) * interval - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+    async def bench_unbatched(self, options):
+        """
+        Прежняя схема: каждое сообщение кодируется и отправляется каждому сокету отдельно.
+        """
+        sockets = self._sockets(options)
+        encodes = 0
+
+        async def send(event):
+            nonlocal encodes
+            for socket in sockets:
+                await socket.send(text_data=json.dumps({'message': event['message'], 'username': event['username']}))
+                encodes += 1
+
+        cpu, wall = time.process_time(), time.perf_counter()
+        await self._feed(options, send)
+        return self._result(sockets, encodes, cpu, wall)
+
+    async def bench_batched(self, options):
+        """
+        Пакетная схема: хаб комнаты кодирует кадр один раз за тик и отправляет его всем сокетам.
+        """
+        layer = InMemoryChannelLayer(capacity=options['messages'] + 1000)
+        hub = RoomHub('chat_bench', channel_layer=layer, tick=options['tick'], heartbeat=3600)
+        sockets = self._sockets(options)
+        for socket in sockets:
+            await hub.join(socket)
+        await asyncio.sleep(options['tick'] * 3)  # Первичная рассылка списка онлайн не входит в замер
+        for socket in sockets:
+            socket.frames = socket.messages = 0
+        hub.stats.clear()
+
+        cpu, wall = time.process_time(), time.perf_counter()
+        await self._feed(options, lambda event: layer.group_send('chat_bench', event))
+        while sockets[-1].messages < options['messages']:
+            await asyncio.sleep(options['tick'] / 5)
+        result = self._result(sockets, hub.stats['encodes'], cpu, wall)
+        for socket in sockets:
+            await hub.leave(socket)
+        return result
+
+    @staticmethod
+    def _result(sockets, encodes, cpu, wall):
+        return {
+            'frames': sum(socket.frames for socket in sockets),
+            'delivered': sum(socket.messages for socket in sockets),
+            'encodes': encodes,
+            'cpu': time.process_time() - cpu,
+            'wall': time.perf_counter() - wall,
+        }
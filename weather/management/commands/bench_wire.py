@@ -0,0 +1,90 @@
+import json
+import random
+import time
+
+from channels_redis.core import RedisChannelLayer
+from django.core.management.base import BaseCommand
+
+from weather import wire
+
+WORDS = ('погода', 'дождь', 'завтра', 'солнце', 'ветер', 'Kyiv', 'forecast', 'снег', 'холодно', 'тепло', 'ok')
+
+
+def sample_messages(count, long_share, seed=1):
+    """
+    Генерирует сообщения чата: в основном короткие, доля long_share — длинные (2-8 КБ).
+    """
+    rnd = random.Random(seed)
+    messages = []
+    for i in range(count):
+        words = rnd.randint(300, 1200) if rnd.random() < long_share else rnd.randint(2, 15)
+        messages.append({'type': 'chat.message', 'username': f'user{rnd.randint(1, 500)}',
+                         'message': ' '.join(rnd.choice(WORDS) for _ in range(words))})
+    return messages
+
+
+class Command(BaseCommand):
+    """
+    Измеряет размер событий чата в Redis и стоимость кодирования: словари событий как есть и компактная запись msgpack.
+
+    Размер считается сериализатором channels_redis (тем же, что пишет в Redis), соединение с Redis не нужно.
+
+    Пример: python manage.py bench_wire --messages 20000 --long-share 0.05
+    """
+    help = 'Бенчмарк формата событий чата: байты в Redis на сообщение и CPU кодирования/декодирования.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--messages', type=int, default=20000, help='Количество сообщений.')
+        parser.add_argument('--long-share', type=float, default=0.05, help='Доля длинных сообщений.')
+        parser.add_argument('--threshold', type=int, default=1024, help='Порог сжатия в байтах.')
+        parser.add_argument('--batch', type=int, default=20, help='Сообщений в одном кадре WebSocket.')
+
+    def handle(self, *args, **options):
+        messages = sample_messages(options['messages'], options['long_share'])
+        layer = RedisChannelLayer(hosts=['redis://127.0.0.1:6379'])
+        threshold = options['threshold']
+
+        formats = (
+            ('словарь (как раньше)', lambda event: event, lambda event: event),
+            ('msgpack', lambda event: wire.pack_event(event), wire.unpack_event),
+            (f'msgpack+сжатие>={threshold}', lambda event: wire.pack_event(event, threshold), wire.unpack_event),
+        )
+        self.stdout.write('Channel layer (Redis):')
+        for name, encode, decode in formats:
+            started = time.process_time()
+            payloads = [layer.serialize(encode(event)) for event in messages]
+            encoded = time.process_time() - started
+            started = time.process_time()
+            for payload in payloads:
+                decode(layer.deserialize(payload))
+            decoded = time.process_time() - started
+            self._report(name, sum(map(len, payloads)), encoded, decoded, len(messages))
+
+        self.stdout.write(f"WebSocket (кадры по {options['batch']} сообщений):")
+        frames = [
+            {'type': 'batch', 'messages': [{'username': m['username'], 'message': m['message']}
+                                           for m in messages[i:i + options['batch']]]}
+            for i in range(0, len(messages), options['batch'])
+        ]
+        for name, encode, decode in (
+            ('json (текст)', wire.encode_text_frame, json.loads),
+            ('chat.msgpack', wire.encode_binary_frame, wire.decode_binary_frame),
+            (f'chat.msgpack+сжатие>={threshold}', lambda frame: wire.encode_binary_frame(frame, threshold),
+             wire.decode_binary_frame),
+        ):
+            started = time.process_time()
+            encoded_frames = [encode(frame) for frame in frames]
+            encoded = time.process_time() - started
+            started = time.process_time()
+            for data in encoded_frames:
+                decode(data)
+            decoded = time.process_time() - started
+            size = sum(len(data.encode() if isinstance(data, str) else data) for data in encoded_frames)
+            self._report(name, size, encoded, decoded, len(messages))
+
+    def _report(self, name, size, encoded, decoded, count):
+        self.stdout.write(
+            f'  {name:>28}: {size / count:8.1f} байт/сообщение, '
+            f'кодирование {encoded / count * 1e6:6.2f} мкс ({count / max(encoded, 1e-9):,.0f}/с), '
+            f'декодирование {decoded / count * 1e6:6.2f} мкс'
+        )
@@ -0,0 +1,54 @@
+import io
+
+from django.core.management.base import BaseCommand, CommandError
+
+from weather import icons
+from weather.providers import WeatherServiceError
+
+
+class Command(BaseCommand):
+    """
+    Собирает спрайт из полного набора иконок погоды.
+
+    Иконки скачиваются через локальный кэш (заполняя его), склеиваются в одно PNG-изображение
+    и сохраняются вместе с картой координат. После перезапуска воркеров шаблоны выводят
+    иконки фрагментами спрайта: вся неделя прогноза загружается одним запросом.
+
+    Требует Pillow.
+    """
+    help = 'Собирает спрайт иконок погоды в каталоге ICON_CACHE_DIR.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', default='64x64', choices=['64x64', '128x128'], help='Размер иконок.')
+        parser.add_argument('--columns', type=int, default=16, help='Количество иконок в строке спрайта.')
+
+    def handle(self, *args, **options):
+        try:
+            from PIL import Image
+        except ImportError:
+            raise CommandError('Для сборки спрайта нужен Pillow (pip install pillow).')
+
+        cache = icons.get_icon_cache()
+        paths = [f"{options['size']}/{period}/{code}.png" for period in ('day', 'night') for code in icons.ICON_CODES]
+        width, height = (int(side) for side in options['size'].split('x'))
+        columns = options['columns']
+        rows = -(-len(paths) // columns)
+
+        sheet = Image.new('RGBA', (columns * width, rows * height))
+        boxes = {}
+        for i, path in enumerate(paths):
+            try:
+                _, file_path = cache.get(path)
+            except WeatherServiceError as e:
+                raise CommandError(str(e))
+            x, y = (i % columns) * width, (i // columns) * height
+            with Image.open(file_path) as image:
+                sheet.paste(image.convert('RGBA').resize((width, height)), (x, y))
+            boxes[path] = (x, y, width, height)
+
+        buffer = io.BytesIO()
+        sheet.save(buffer, format='PNG', optimize=True)
+        digest = cache.save_sprite(buffer.getvalue(), boxes)
+        self.stdout.write(self.style.SUCCESS(
+            f'Спрайт из {len(paths)} иконок: {cache.object_file(digest)} ({len(buffer.getvalue())} байт)'
+        ))
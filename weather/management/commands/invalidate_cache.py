@@ -0,0 +1,23 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from weather.cache_bus import get_near_cache
+
+
+class Command(BaseCommand):
+    """
+    Сбрасывает кэши в памяти всех воркеров через шину инвалидаций.
+
+    Пример: после смены погодного провайдера — 'python manage.py invalidate_cache weather'.
+    """
+    help = 'Рассылает инвалидацию ключа или пространства имён near-cache всем воркерам.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('namespace', help="Пространство имён, например 'weather' или 'favorites'.")
+        parser.add_argument('--key', help='Ключ внутри пространства имён; без него сбрасывается всё пространство.')
+
+    def handle(self, *args, **options):
+        target = f"{options['namespace']}:{options['key']}" if options['key'] else options['namespace']
+        if not get_near_cache().invalidate(options['namespace'], options['key']):
+            raise CommandError(f'Шина инвалидаций недоступна ({settings.CACHE_BUS_URL}), {target} не разослана.')
+        self.stdout.write(self.style.SUCCESS(f'Инвалидация {target} отправлена.'))
@@ -0,0 +1,151 @@
+import os
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Скрипт, выполняемый в отдельном интерпретаторе: имитирует старт воркера
+# (импорт WSGI/ASGI-приложения и загрузку URLConf) и печатает время в миллисекундах.
+BOOT_SCRIPT = """
+import time
+start = time.perf_counter()
+import importlib
+importlib.import_module({module!r})
+from django.urls import get_resolver
+get_resolver().url_patterns
+print((time.perf_counter() - start) * 1000)
+"""
+
+
+def parse_importtime(output):
+    """
+    Разбирает вывод интерпретатора, запущенного с флагом '-X importtime'.
+
+    Параметры:
+        output (str): Содержимое stderr дочернего процесса.
+
+    Возвращает:
+        list: Список кортежей (module, self_us, cumulative_us) в порядке импорта.
+    """
+    rows = []
+    for line in output.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        parts = line[len('import time:'):].split('|')
+        if len(parts) != 3:
+            continue
+        self_us, cumulative_us, module = parts
+        try:
+            rows.append((module.strip(), int(self_us), int(cumulative_us)))
+        except ValueError:
+            continue  # Строка заголовка "self [us] | cumulative | imported package"
+    return rows
+
+
+def cost_by_package(rows):
+    """
+    Суммирует собственное время импорта модулей по пакетам верхнего уровня.
+
+    Параметры:
+        rows (list): Результат parse_importtime.
+
+    Возвращает:
+        list: Список пар (package, self_us), отсортированный по убыванию стоимости.
+    """
+    totals = defaultdict(int)
+    for module, self_us, _ in rows:
+        totals[module.split('.')[0]] += self_us
+    return sorted(totals.items(), key=lambda item: item[1], reverse=True)
+
+
+class Command(BaseCommand):
+    """
+    Профилирует импорт модулей при старте воркера и измеряет время холодного старта.
+
+    Каждый замер выполняется в новом интерпретаторе, поэтому результат соответствует
+    старту нового воркера gunicorn/daphne. Если медиана превышает бюджет
+    (settings.COLD_START_BUDGET_MS или --budget-ms), команда завершается с ошибкой.
+    """
+    help = "Отчёт о стоимости импорта модулей и времени холодного старта воркера."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--entry', choices=('wsgi', 'asgi'), default='wsgi',
+                            help="Точка входа, старт которой измеряется.")
+        parser.add_argument('--top', type=int, default=20,
+                            help="Сколько самых дорогих модулей и пакетов показать.")
+        parser.add_argument('--repeat', type=int, default=5,
+                            help="Количество замеров холодного старта.")
+        parser.add_argument('--budget-ms', type=float, default=None,
+                            help="Допустимая медиана холодного старта в миллисекундах.")
+
+    def handle(self, *args, **options):
+        module = self.entry_module(options['entry'])
+        top = options['top']
+
+        result = self.run_boot(module, importtime=True)
+        rows = parse_importtime(result.stderr)
+
+        self.stdout.write(f"Модули с наибольшим собственным временем импорта ({module}):")
+        for name, self_us, cumulative_us in sorted(rows, key=lambda row: row[1], reverse=True)[:top]:
+            self.stdout.write(f"  {self_us / 1000:9.1f} мс  (всего {cumulative_us / 1000:9.1f} мс)  {name}")
+
+        self.stdout.write("Стоимость импорта по пакетам:")
+        for package, self_us in cost_by_package(rows)[:top]:
+            self.stdout.write(f"  {self_us / 1000:9.1f} мс  {package}")
+
+        boot_ms, process_ms = [], []
+        for _ in range(max(options['repeat'], 1)):
+            started = time.perf_counter()
+            result = self.run_boot(module)
+            process_ms.append((time.perf_counter() - started) * 1000)
+            boot_ms.append(float(result.stdout.strip().splitlines()[-1]))
+
+        boot_median = statistics.median(boot_ms)
+        self.stdout.write(
+            f"Холодный старт: загрузка приложения {boot_median:.1f} мс (медиана), "
+            f"процесс целиком {statistics.median(process_ms):.1f} мс"
+        )
+
+        budget = options['budget_ms']
+        if budget is None:
+            budget = settings.COLD_START_BUDGET_MS
+        if boot_median > budget:
+            raise CommandError(f"Холодный старт {boot_median:.1f} мс превышает бюджет {budget:.0f} мс.")
+        self.stdout.write(self.style.SUCCESS(f"В пределах бюджета {budget:.0f} мс."))
+
+    @staticmethod
+    def entry_module(entry):
+        """
+        Возвращает имя модуля с WSGI- или ASGI-приложением из настроек проекта.
+        """
+        application = settings.WSGI_APPLICATION if entry == 'wsgi' else settings.ASGI_APPLICATION
+        return application.rsplit('.', 1)[0]
+
+    @staticmethod
+    def run_boot(module, importtime=False):
+        """
+        Запускает имитацию старта воркера в отдельном интерпретаторе.
+
+        Параметры:
+            module (str): Модуль точки входа (например, 'weather_project.wsgi').
+            importtime (bool): Включить ли отчёт '-X importtime'.
+
+        Возвращает:
+            CompletedProcess: Результат выполнения дочернего процесса.
+        """
+        env = dict(os.environ)
+        env['DJANGO_SETTINGS_MODULE'] = settings.SETTINGS_MODULE
+        env['PYTHONPATH'] = os.pathsep.join(path for path in sys.path if path)
+        command = [sys.executable]
+        if importtime:
+            command += ['-X', 'importtime']
+        command += ['-c', BOOT_SCRIPT.format(module=module)]
+
+        result = subprocess.run(command, capture_output=True, text=True, env=env)
+        if result.returncode != 0:
+            raise CommandError(f"Не удалось загрузить {module}:\n{result.stderr[-2000:]}")
+        return result
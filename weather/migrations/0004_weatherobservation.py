@@ -0,0 +1,32 @@
+# Generated by Django 5.1.3 on 2026-10-19 14:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('weather', '0003_searchstatistic'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WeatherObservation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('city_id', models.BigIntegerField()),
+                ('city_name', models.CharField(max_length=100)),
+                ('observed_at', models.DateTimeField()),
+                ('kind', models.CharField(choices=[('current', 'Наблюдение'), ('forecast', 'Прогноз')], default='current', max_length=8)),
+                ('temp_c', models.FloatField()),
+                ('feelslike_c', models.FloatField(null=True)),
+                ('humidity', models.FloatField(null=True)),
+                ('wind_kph', models.FloatField(null=True)),
+                ('pressure_mb', models.FloatField(null=True)),
+                ('precip_mm', models.FloatField(null=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('city_id', 'observed_at', 'kind'), name='unique_weather_observation')],
+            },
+        ),
+    ]
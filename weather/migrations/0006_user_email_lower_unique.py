@@ -0,0 +1,23 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """
+    Уникальный индекс по LOWER(email) для таблицы пользователей.
+
+    Ускоряет проверку занятости адреса при регистрации (без полного просмотра auth_user)
+    и не даёт зарегистрировать один адрес дважды в разном регистре. Пустые адреса
+    (пользователи, созданные без почты) в индекс не входят.
+    """
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('weather', '0005_chatmessage_created_at_index'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            sql="CREATE UNIQUE INDEX auth_user_email_lower_uniq ON auth_user (LOWER(email)) WHERE email <> ''",
+            reverse_sql='DROP INDEX auth_user_email_lower_uniq',
+        ),
+    ]
@@ -52,10 +52,51 @@ class ChatMessage(models.Model):
     """
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     message = models.TextField()
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
 
     def __str__(self):
         return f'{self.user.username}: {self.message[:20]}...'
 
     class Meta:
         ordering = ['created_at']
+
+
+class WeatherObservation(models.Model):
+    """
+    Модель для хранения нормализованных погодных наблюдений (временной ряд).
+
+    Каждая строка — одна точка: текущая погода или час прогноза для города.
+    Уникальное ограничение (city_id, observed_at, kind) служит и индексом для выборок по городу и времени.
+
+    Атрибуты:
+        city_id (BigIntegerField): Стабильный идентификатор города из индекса городов.
+        city_name (CharField): Каноническое название города.
+        observed_at (DateTimeField): Время наблюдения (UTC).
+        kind (CharField): Тип точки: 'current' (наблюдение) или 'forecast' (час прогноза).
+        temp_c, feelslike_c, humidity, wind_kph, pressure_mb, precip_mm (FloatField): Показатели погоды.
+    """
+    KIND_CURRENT = 'current'
+    KIND_FORECAST = 'forecast'
+    KIND_CHOICES = [
+        (KIND_CURRENT, 'Наблюдение'),
+        (KIND_FORECAST, 'Прогноз'),
+    ]
+
+    city_id = models.BigIntegerField()
+    city_name = models.CharField(max_length=100)
+    observed_at = models.DateTimeField()
+    kind = models.CharField(max_length=8, choices=KIND_CHOICES, default=KIND_CURRENT)
+    temp_c = models.FloatField()
+    feelslike_c = models.FloatField(null=True)
+    humidity = models.FloatField(null=True)
+    wind_kph = models.FloatField(null=True)
+    pressure_mb = models.FloatField(null=True)
+    precip_mm = models.FloatField(null=True)
+
+    def __str__(self):
+        return f"{self.city_name} {self.observed_at:%Y-%m-%d %H:%M}: {self.temp_c}°C"
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['city_id', 'observed_at', 'kind'], name='unique_weather_observation'),
+        ]
@@ -0,0 +1,135 @@
+from datetime import datetime, timezone
+
+from django.utils.timezone import now, timedelta
+
+from .lazy import lazy_import
+from .models import WeatherObservation
+
+# pandas нужен только страницам истории, поэтому не загружается при старте воркера
+pd = lazy_import('pandas')
+
+OBSERVATION_FIELDS = ('temp_c', 'feelslike_c', 'humidity', 'wind_kph', 'pressure_mb', 'precip_mm')
+INSERT_BATCH_SIZE = 500
+
+
+def _point(city, observed_at, kind, values):
+    return WeatherObservation(
+        city_id=city.id,
+        city_name=city.name,
+        observed_at=datetime.fromtimestamp(observed_at, tz=timezone.utc),
+        kind=kind,
+        **{field: values.get(field) for field in OBSERVATION_FIELDS},
+    )
+
+
+def extract_observations(city, data):
+    """
+    Преобразует нормализованный ответ провайдера в строки временного ряда.
+
+    Параметры:
+        city (City): Канонический город.
+        data (dict): Ответ провайдера (блок 'current' и, для прогноза, 'forecast.forecastday[].hour').
+
+    Возвращает:
+        list: Несохранённые объекты WeatherObservation.
+    """
+    points = []
+    current = data.get('current') or {}
+    if current.get('last_updated_epoch') is not None and current.get('temp_c') is not None:
+        points.append(_point(city, current['last_updated_epoch'], WeatherObservation.KIND_CURRENT, current))
+
+    for day in (data.get('forecast') or {}).get('forecastday', []):
+        for hour in day.get('hour', []):
+            if hour.get('time_epoch') is not None and hour.get('temp_c') is not None:
+                points.append(_point(city, hour['time_epoch'], WeatherObservation.KIND_FORECAST, hour))
+    return points
+
+
+def record_observations(city, data):
+    """
+    Сохраняет наблюдения из ответа провайдера одной пакетной вставкой.
+
+    Повторные точки (тот же город, время и тип) обновляются, а не дублируются —
+    так более свежий прогноз заменяет старый.
+
+    Параметры:
+        city (City): Канонический город.
+        data (dict): Нормализованный ответ провайдера.
+
+    Возвращает:
+        int: Количество сохранённых точек.
+    """
+    points = extract_observations(city, data)
+    if points:
+        WeatherObservation.objects.bulk_create(
+            points,
+            batch_size=INSERT_BATCH_SIZE,
+            update_conflicts=True,
+            unique_fields=['city_id', 'observed_at', 'kind'],
+            update_fields=['city_name', *OBSERVATION_FIELDS],
+        )
+    return len(points)
+
+
+def load_history(city_ids, days=30):
+    """
+    Загружает историю температуры городов в DataFrame одним запросом.
+
+    Для каждого часа берётся фактическое наблюдение, а если его нет — уже наступивший час прогноза.
+
+    Параметры:
+        city_ids (iterable): Идентификаторы городов.
+        days (int): Глубина истории в днях.
+
+    Возвращает:
+        DataFrame: Столбцы city_name, observed_at, temp_c.
+    """
+    until = now()
+    rows = WeatherObservation.objects.filter(
+        city_id__in=list(city_ids), observed_at__gte=until - timedelta(days=days), observed_at__lte=until,
+    ).values_list('city_id', 'city_name', 'observed_at', 'kind', 'temp_c')
+    frame = pd.DataFrame.from_records(list(rows), columns=['city_id', 'city_name', 'observed_at', 'kind', 'temp_c'])
+    if frame.empty:
+        return frame[['city_name', 'observed_at', 'temp_c']]
+
+    frame['observed_at'] = pd.to_datetime(frame['observed_at'], utc=True)
+    frame['hour'] = frame['observed_at'].dt.floor('h')
+    # 'current' < 'forecast' по алфавиту: после сортировки наблюдение идёт раньше прогноза за тот же час
+    frame = frame.sort_values(['city_id', 'hour', 'kind']).drop_duplicates(['city_id', 'hour'])
+    return frame[['city_name', 'observed_at', 'temp_c']].reset_index(drop=True)
+
+
+def daily_summary(frame, window=7, threshold=5.0):
+    """
+    Считает дневные минимум, максимум и среднюю температуру и отклонение от скользящего среднего.
+
+    Параметры:
+        frame (DataFrame): Результат load_history.
+        window (int): Количество предыдущих дней для скользящего среднего.
+        threshold (float): Отклонение (°C), начиная с которого день считается аномальным.
+
+    Возвращает:
+        DataFrame: Индекс (city_name, date); столбцы min, max, mean, trailing_mean, anomaly, is_anomaly.
+    """
+    if frame.empty:
+        return pd.DataFrame(columns=['min', 'max', 'mean', 'trailing_mean', 'anomaly', 'is_anomaly'])
+
+    dates = frame['observed_at'].dt.floor('D').rename('date')
+    daily = frame.groupby([frame['city_name'], dates])['temp_c'].agg(['min', 'max', 'mean'])
+
+    previous = daily.groupby(level='city_name')['mean'].shift(1)
+    daily['trailing_mean'] = (
+        previous.groupby(level='city_name').rolling(window, min_periods=2).mean().droplevel(0)
+    )
+    daily['anomaly'] = daily['mean'] - daily['trailing_mean']
+    daily['is_anomaly'] = daily['anomaly'].abs() >= threshold
+    return daily.round(1)
+
+
+def compare_cities(daily):
+    """
+    Строит таблицу сравнения средних дневных температур: строки — даты, столбцы — города.
+    """
+    if daily.empty:
+        return pd.DataFrame()
+    return daily['mean'].unstack(level='city_name').sort_index()
@@ -0,0 +1,258 @@
+import contextvars
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter, deque
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.utils import timezone
+
+# Профиль текущего запроса; None — запрос не профилируется
+_current = contextvars.ContextVar('weather_request_profile', default=None)
+
+# Фазы, на которые делится время запроса; остаток считается временем Python
+PHASES = ('upstream', 'orm', 'template')
+
+
+class RequestProfile:
+    """
+    Профиль одного HTTP-запроса: время по фазам и, при выборочном профилировании, стеки.
+
+    Фазы учитываются исключительно: пока идёт вложенная фаза (например, SQL-запрос ленивого
+    QuerySet во время рендеринга шаблона), время родительской не идёт.
+
+    Параметры:
+        request (HttpRequest): Профилируемый запрос.
+        reason (str): Почему запрос профилируется: 'header', 'sample' или None (только замер фаз).
+    """
+
+    def __init__(self, request, reason=None):
+        self.id = None  # Назначается, когда профиль сохраняется в буфер
+        self.method = request.method
+        self.path = request.path  # Полный путь с параметрами записывается при сохранении в буфер
+        self.reason = reason
+        self.started_at = timezone.now()
+        self.status = None
+        self.total = 0.0
+        self.queries = 0
+        self.phases = Counter()
+        self.stacks = Counter()
+        self._stack = []
+
+    def enter(self, phase):
+        now = time.perf_counter()
+        if self._stack:
+            parent = self._stack[-1]
+            self.phases[parent[0]] += now - parent[1]
+        self._stack.append([phase, now])
+
+    def exit(self):
+        now = time.perf_counter()
+        phase, started = self._stack.pop()
+        self.phases[phase] += now - started
+        if self._stack:
+            self._stack[-1][1] = now
+
+    def breakdown(self):
+        """
+        Возвращает время по фазам в секундах, включая 'python' — время вне upstream, ORM и шаблонов.
+        """
+        result = {phase: self.phases[phase] for phase in PHASES}
+        result['python'] = max(0.0, self.total - sum(result.values()))
+        return result
+
+    def breakdown_ms(self):
+        """
+        Возвращает время по фазам и общее ('total') в миллисекундах, для шаблонов.
+        """
+        result = {phase: round(seconds * 1000, 1) for phase, seconds in self.breakdown().items()}
+        result['total'] = round(self.total * 1000, 1)
+        return result
+
+    def folded(self):
+        """
+        Возвращает стеки в свёрнутом формате flamegraph.pl / speedscope: «кадр;кадр;кадр количество».
+        """
+        return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+
+
+@contextmanager
+def phase(name):
+    """
+    Учитывает время блока в фазе name профиля текущего запроса. Без профиля ничего не делает.
+    """
+    profile = _current.get()
+    if profile is None:
+        yield
+        return
+    profile.enter(name)
+    try:
+        yield
+    finally:
+        profile.exit()
+
+
+def _orm_wrapper(execute, sql, params, many, context):
+    profile = _current.get()
+    if profile is None:
+        return execute(sql, params, many, context)
+    profile.queries += 1
+    profile.enter('orm')
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        profile.exit()
+
+
+def _frame_name(frame):
+    return f"{frame.f_globals.get('__name__', '?')}:{frame.f_code.co_name}"
+
+
+class StackSampler(threading.Thread):
+    """
+    Поток, который раз в interval секунд снимает стек потока запроса и считает свёрнутые стеки.
+
+    Параметры:
+        thread_id (int): Идентификатор профилируемого потока (threading.get_ident()).
+        stacks (Counter): Счётчик, в который добавляются свёрнутые стеки.
+        interval (float): Период выборки в секундах.
+    """
+
+    def __init__(self, thread_id, stacks, interval):
+        super().__init__(name=f'profiler-{thread_id}', daemon=True)
+        self.thread_id = thread_id
+        self.stacks = stacks
+        self.interval = interval
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            names = []
+            while frame is not None:
+                names.append(_frame_name(frame))
+                frame = frame.f_back
+            if names:
+                self.stacks[';'.join(reversed(names))] += 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join(timeout=1.0)
+
+
+_slow_requests = deque(maxlen=50)
+# Кольцевой буфер пополняют потоки запросов: перебор без блокировки падает с «deque mutated during iteration»
+_slow_requests_lock = threading.Lock()
+_template_patched = False
+
+
+def recent_profiles():
+    """
+    Возвращает профили из кольцевого буфера этого процесса, начиная с последних.
+    """
+    with _slow_requests_lock:
+        return list(reversed(_slow_requests))
+
+
+def get_profile(profile_id):
+    """
+    Возвращает профиль из кольцевого буфера по идентификатору или None.
+    """
+    with _slow_requests_lock:
+        return next((profile for profile in _slow_requests if profile.id == profile_id), None)
+
+
+def _patch_template_render():
+    """
+    Оборачивает рендеринг шаблонов Django, чтобы учитывать его в фазе 'template'.
+    """
+    global _template_patched
+    if _template_patched:
+        return
+    from django.template.backends.django import Template
+
+    render = Template.render
+
+    def profiled_render(self, context=None, request=None):
+        with phase('template'):
+            return render(self, context, request)
+
+    Template.render = profiled_render
+    _template_patched = True
+
+
+class ProfilingMiddleware:
+    """
+    Профилирование запросов по требованию и захват медленных запросов.
+
+    У каждого запроса замеряется время upstream (погодные API и CDN иконок), ORM и шаблонов;
+    запросы дольше PROFILING_SLOW_THRESHOLD секунд попадают в кольцевой буфер процесса
+    (PROFILING_BUFFER_SIZE записей). Запросы сотрудников с заголовком X-Profile: 1 и доля
+    PROFILING_SAMPLE_RATE остальных дополнительно профилируются выборкой стеков раз в
+    PROFILING_INTERVAL секунд и попадают в буфер независимо от длительности; идентификатор
+    профиля возвращается в заголовке X-Profile-Id.
+
+    При PROFILING_ENABLED = False middleware отключается при старте (MiddlewareNotUsed)
+    и не участвует в обработке запросов.
+    """
+
+    header = 'HTTP_X_PROFILE'
+
+    def __init__(self, get_response):
+        if not settings.PROFILING_ENABLED:
+            raise MiddlewareNotUsed
+        global _slow_requests
+        if _slow_requests.maxlen != settings.PROFILING_BUFFER_SIZE:
+            _slow_requests = deque(_slow_requests, maxlen=settings.PROFILING_BUFFER_SIZE)
+        _patch_template_render()
+        self.get_response = get_response
+        self.threshold = settings.PROFILING_SLOW_THRESHOLD
+        self.sample_rate = settings.PROFILING_SAMPLE_RATE
+        self.interval = settings.PROFILING_INTERVAL
+        self.aliases = list(connections)
+
+    def __call__(self, request):
+        reason = self._reason(request)
+        profile = RequestProfile(request, reason)
+        sampler = None
+        if reason:
+            sampler = StackSampler(threading.get_ident(), profile.stacks, self.interval)
+            sampler.start()
+
+        for alias in self.aliases:
+            connection = connections[alias]
+            if _orm_wrapper not in connection.execute_wrappers:
+                # Обёртка остаётся на соединении потока: без профиля она сразу вызывает execute
+                connection.execute_wrappers.append(_orm_wrapper)
+
+        token = _current.set(profile)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            profile.total = time.perf_counter() - started
+            _current.reset(token)
+            if sampler is not None:
+                sampler.stop()
+
+        profile.status = response.status_code
+        if reason or profile.total >= self.threshold:
+            profile.id = uuid.uuid4().hex[:12]
+            profile.path = request.get_full_path()
+            with _slow_requests_lock:
+                _slow_requests.append(profile)
+        if reason:
+            response['X-Profile-Id'] = profile.id
+        return response
+
+    def _reason(self, request):
+        if request.META.get(self.header) == '1' and request.user.is_staff:
+            return 'header'
+        if self.sample_rate and random.random() < self.sample_rate:
+            return 'sample'
+        return None
@@ -0,0 +1,490 @@
+import math
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import datetime, timezone
+
+from . import profiling
+from .cities import LEARNED_ID_BASE
+from .lazy import lazy_import
+
+# HTTP-клиент загружается при первом запросе к внешнему API, а не при старте воркера
+requests = lazy_import('requests')
+
+
+class WeatherServiceError(Exception):
+    """
+    Ошибка получения данных от внешнего погодного API.
+    """
+
+
+class InvalidLocationError(WeatherServiceError):
+    """
+    Провайдер не может найти место по запросу (ответ 4xx, неизвестный город, нет координат).
+
+    Ошибка относится к вводу пользователя, а не к провайдеру: она не учитывается автоматом
+    защиты и не приводит к переключению на резервный провайдер.
+    """
+
+
+class CircuitOpenError(WeatherServiceError):
+    """
+    Провайдер временно отключён автоматом защиты (circuit breaker).
+    """
+
+
+# Коды погоды WMO (Open-Meteo) -> (код иконки weatherapi.com, описание)
+WMO_CONDITIONS = {
+    0: (113, 'Ясно'),
+    1: (116, 'Преимущественно ясно'),
+    2: (116, 'Переменная облачность'),
+    3: (122, 'Пасмурно'),
+    45: (248, 'Туман'),
+    48: (260, 'Изморозь, туман'),
+    51: (266, 'Слабая морось'),
+    53: (266, 'Морось'),
+    55: (266, 'Сильная морось'),
+    56: (281, 'Переохлаждённая морось'),
+    57: (284, 'Сильная переохлаждённая морось'),
+    61: (296, 'Небольшой дождь'),
+    63: (302, 'Умеренный дождь'),
+    65: (308, 'Сильный дождь'),
+    66: (311, 'Ледяной дождь'),
+    67: (314, 'Сильный ледяной дождь'),
+    71: (326, 'Небольшой снег'),
+    73: (332, 'Умеренный снег'),
+    75: (338, 'Сильный снег'),
+    77: (350, 'Снежная крупа'),
+    80: (353, 'Небольшой ливень'),
+    81: (356, 'Ливень'),
+    82: (359, 'Сильный ливень'),
+    85: (368, 'Небольшой снегопад'),
+    86: (371, 'Сильный снегопад'),
+    95: (389, 'Гроза'),
+    96: (392, 'Гроза с градом'),
+    99: (395, 'Сильная гроза с градом'),
+}
+
+# Ответы 4xx, которые говорят о проблеме провайдера (ключ, лимит запросов), а не о запросе пользователя
+PROVIDER_FAULT_STATUSES = (401, 403, 408, 429)
+
+COMPASS_POINTS = ('N', 'NNE', 'NE', 'ENE', 'E', 'ESE', 'SE', 'SSE',
+                  'S', 'SSW', 'SW', 'WSW', 'W', 'WNW', 'NW', 'NNW')
+
+
+class WeatherProvider:
+    """
+    Базовый класс погодного провайдера.
+
+    Все провайдеры возвращают данные в нормализованном формате — подмножестве формата weatherapi.com
+    ('location', 'current', 'forecast.forecastday[].day/hour'), который используют шаблоны и API.
+
+    Параметры:
+        base_url (str): Базовый URL API провайдера.
+        timeout (float): Таймаут HTTP-запроса в секундах.
+    """
+    name = 'base'
+
+    def __init__(self, base_url, timeout=5.0):
+        self.base_url = base_url.rstrip('/')
+        self.timeout = timeout
+
+    def current(self, city):
+        """
+        Возвращает текущую погоду. city — объект City или строка с названием.
+        """
+        raise NotImplementedError
+
+    def forecast(self, city, days):
+        """
+        Возвращает прогноз на days дней. city — объект City или строка с названием.
+        """
+        raise NotImplementedError
+
+    def supports(self, city):
+        """
+        Может ли провайдер ответить для city без обращения к API.
+        """
+        return True
+
+    def _get(self, endpoint, params):
+        try:
+            response = requests.get(f"{self.base_url}/{endpoint}", params=params, timeout=self.timeout)
+            if 400 <= response.status_code < 500 and response.status_code not in PROVIDER_FAULT_STATUSES:
+                raise InvalidLocationError(self._error_message(response))
+            response.raise_for_status()
+            return response.json()
+        except (requests.RequestException, ValueError) as e:
+            raise WeatherServiceError(str(e)) from e
+
+    @staticmethod
+    def _error_message(response):
+        try:
+            message = response.json()['error']['message']  # Формат ошибок weatherapi.com
+        except (ValueError, KeyError, TypeError):
+            message = f"HTTP {response.status_code}"
+        return f"Место не найдено: {message}"
+
+
+class WeatherAPIProvider(WeatherProvider):
+    """
+    Провайдер weatherapi.com — его формат ответа и является нормализованным.
+    """
+    name = 'weatherapi'
+
+    def __init__(self, base_url, api_key, timeout=5.0):
+        super().__init__(base_url, timeout)
+        self.api_key = api_key
+
+    def current(self, city):
+        return self._get("current.json", {"key": self.api_key, "q": self._query(city), "aqi": "no"})
+
+    def forecast(self, city, days):
+        return self._get("forecast.json", {"key": self.api_key, "q": self._query(city), "days": days, "lang": "ru"})
+
+    @staticmethod
+    def _query(city):
+        """
+        Параметр q: название или, для выученного города с координатами, 'lat,lon'.
+
+        Выученные города — это одноимённые с известными ('Paris, Texas'): по одному названию
+        API вернул бы другой город, и его погода легла бы в кэш под чужим идентификатором.
+        """
+        if getattr(city, 'id', 0) >= LEARNED_ID_BASE and not (math.isnan(city.lat) or math.isnan(city.lon)):
+            return f"{city.lat:.4f},{city.lon:.4f}"
+        return getattr(city, 'name', city)
+
+
+class OpenMeteoProvider(WeatherProvider):
+    """
+    Провайдер open-meteo.com. Работает по координатам, поэтому принимает только City с lat/lon.
+    """
+    name = 'open-meteo'
+    current_fields = ('temperature_2m,apparent_temperature,relative_humidity_2m,weather_code,'
+                      'wind_speed_10m,wind_direction_10m,pressure_msl,precipitation,visibility,is_day')
+    hourly_fields = 'temperature_2m,precipitation,wind_speed_10m,relative_humidity_2m,weather_code,is_day'
+    daily_fields = 'temperature_2m_max,temperature_2m_min,precipitation_sum,wind_speed_10m_max,weather_code'
+
+    def current(self, city):
+        data = self._get("forecast", {**self._coordinates(city), "current": self.current_fields,
+                                      "timezone": "auto", "timeformat": "unixtime"})
+        try:
+            return {'location': self._location(city, data), 'current': self._current(data)}
+        except (KeyError, IndexError, TypeError) as e:
+            raise WeatherServiceError(f"Некорректный ответ {self.name}: {e!r}") from e
+
+    def forecast(self, city, days):
+        data = self._get("forecast", {**self._coordinates(city), "current": self.current_fields,
+                                      "hourly": self.hourly_fields, "daily": self.daily_fields,
+                                      "forecast_days": days, "timezone": "auto", "timeformat": "unixtime"})
+        try:
+            return {
+                'location': self._location(city, data),
+                'current': self._current(data),
+                'forecast': {'forecastday': self._forecast_days(data)},
+            }
+        except (KeyError, IndexError, TypeError) as e:
+            raise WeatherServiceError(f"Некорректный ответ {self.name}: {e!r}") from e
+
+    def supports(self, city):
+        lat, lon = getattr(city, 'lat', math.nan), getattr(city, 'lon', math.nan)
+        return not (math.isnan(lat) or math.isnan(lon))
+
+    def _coordinates(self, city):
+        if not self.supports(city):
+            raise InvalidLocationError(f"Нет координат для города {getattr(city, 'name', city)!r}")
+        return {"latitude": city.lat, "longitude": city.lon}
+
+    @staticmethod
+    def _local_time(epoch, data):
+        moment = datetime.fromtimestamp(epoch + data.get('utc_offset_seconds', 0), tz=timezone.utc)
+        return moment.strftime('%Y-%m-%d %H:%M')
+
+    @staticmethod
+    def _condition(code, is_day=1):
+        icon, text = WMO_CONDITIONS.get(code, (113, 'Нет данных'))
+        period = 'day' if is_day else 'night'
+        return {'text': text, 'icon': f'//cdn.weatherapi.com/weather/64x64/{period}/{icon}.png', 'code': icon}
+
+    def _location(self, city, data):
+        current_time = data.get('current', {}).get('time', time.time())
+        return {
+            'name': getattr(city, 'name', city),
+            'country': getattr(city, 'country', ''),
+            'lat': data.get('latitude'),
+            'lon': data.get('longitude'),
+            'tz_id': data.get('timezone'),
+            'localtime': self._local_time(current_time, data),
+        }
+
+    def _current(self, data):
+        current = data['current']
+        visibility = current.get('visibility')
+        return {
+            'last_updated_epoch': current['time'],
+            'last_updated': self._local_time(current['time'], data),
+            'temp_c': current['temperature_2m'],
+            'feelslike_c': current.get('apparent_temperature'),
+            'humidity': current.get('relative_humidity_2m'),
+            'wind_kph': current.get('wind_speed_10m'),
+            'wind_degree': current.get('wind_direction_10m'),
+            'wind_dir': COMPASS_POINTS[int((current.get('wind_direction_10m') or 0) / 22.5 + 0.5) % 16],
+            'pressure_mb': current.get('pressure_msl'),
+            'precip_mm': current.get('precipitation'),
+            'vis_km': None if visibility is None else round(visibility / 1000, 1),
+            'is_day': current.get('is_day', 1),
+            'condition': self._condition(current.get('weather_code'), current.get('is_day', 1)),
+        }
+
+    def _forecast_days(self, data):
+        daily, hourly = data['daily'], data.get('hourly', {})
+        hours_by_date = {}
+        for i, epoch in enumerate(hourly.get('time', [])):
+            moment = self._local_time(epoch, data)
+            hours_by_date.setdefault(moment[:10], []).append({
+                'time_epoch': epoch,
+                'time': moment,
+                'temp_c': hourly['temperature_2m'][i],
+                'precip_mm': hourly['precipitation'][i],
+                'wind_kph': hourly['wind_speed_10m'][i],
+                'humidity': hourly['relative_humidity_2m'][i],
+                'is_day': hourly['is_day'][i],
+                'condition': self._condition(hourly['weather_code'][i], hourly['is_day'][i]),
+            })
+
+        days = []
+        for i, epoch in enumerate(daily['time']):
+            date = self._local_time(epoch, data)[:10]
+            max_c, min_c = daily['temperature_2m_max'][i], daily['temperature_2m_min'][i]
+            days.append({
+                'date': date,
+                'date_epoch': epoch,
+                'day': {
+                    'maxtemp_c': max_c,
+                    'mintemp_c': min_c,
+                    'avgtemp_c': round((max_c + min_c) / 2, 1),
+                    'totalprecip_mm': daily['precipitation_sum'][i],
+                    'maxwind_kph': daily['wind_speed_10m_max'][i],
+                    'condition': self._condition(daily['weather_code'][i]),
+                },
+                'hour': hours_by_date.get(date, []),
+            })
+        return days
+
+
+class CircuitBreaker:
+    """
+    Автомат защиты: после failure_threshold ошибок подряд провайдер отключается на reset_timeout секунд,
+    затем пропускается один пробный запрос (полуоткрытое состояние).
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0, clock=time.monotonic):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+    def allow(self):
+        """
+        Возвращает True, если запрос к провайдеру разрешён.
+        """
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if self.clock() - self.opened_at >= self.reset_timeout and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.failures >= self.failure_threshold:
+                self.opened_at = self.clock()
+
+
+class LatencyTracker:
+    """
+    Скользящее окно задержек успешных ответов для расчёта перцентиля.
+    """
+
+    def __init__(self, window=200):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._samples)
+
+    def add(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, percent):
+        with self._lock:
+            samples = sorted(self._samples)
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * percent / 100))]
+
+
+class HedgeBudget:
+    """
+    Бюджет хеджирования: каждый запрос добавляет ratio токенов (не больше burst), хедж тратит один токен.
+
+    Так дополнительная нагрузка на внешние API не превышает ratio от общего числа запросов.
+    """
+
+    def __init__(self, ratio=0.1, burst=5.0):
+        self.ratio = ratio
+        self.burst = burst
+        self.tokens = burst
+        self._lock = threading.Lock()
+
+    def deposit(self):
+        with self._lock:
+            self.tokens = min(self.burst, self.tokens + self.ratio)
+
+    def try_spend(self):
+        with self._lock:
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return True
+            return False
+
+
+class HedgedWeatherClient:
+    """
+    Клиент с основным и резервным провайдером.
+
+    Если основной провайдер не ответил за время, равное заданному перцентилю его задержек,
+    параллельно отправляется хедж-запрос к резервному и берётся первый успешный ответ.
+    При ошибке основного или открытом автомате защиты запрос сразу уходит к резервному;
+    InvalidLocationError (место не найдено) возвращается пользователю без переключения.
+
+    Параметры:
+        primary (WeatherProvider): Основной провайдер.
+        secondary (WeatherProvider): Резервный провайдер.
+        hedge_percentile (float): Перцентиль задержки основного провайдера, после которого отправляется хедж.
+        hedge_budget (float): Максимальная доля запросов, для которых допускается хедж.
+        min_hedge_delay (float): Нижняя граница задержки перед хеджем, секунды.
+        initial_hedge_delay (float): Задержка перед хеджем, пока статистики недостаточно.
+        max_workers (int): Размер пула потоков для запросов к провайдерам.
+    """
+    min_samples = 20
+
+    def __init__(self, primary, secondary, hedge_percentile=95, hedge_budget=0.1, min_hedge_delay=0.05,
+                 initial_hedge_delay=1.0, failure_threshold=5, reset_timeout=30.0, max_workers=8):
+        self.primary = primary
+        self.secondary = secondary
+        self.hedge_percentile = hedge_percentile
+        self.min_hedge_delay = min_hedge_delay
+        self.initial_hedge_delay = initial_hedge_delay
+        self.budget = HedgeBudget(hedge_budget)
+        self.latency = LatencyTracker()
+        self.breakers = {
+            provider: CircuitBreaker(failure_threshold, reset_timeout) for provider in (primary, secondary)
+        }
+        self.stats = {'requests': 0, 'hedges': 0, 'hedge_wins': 0, 'failovers': 0}
+        self._stats_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='weather-upstream')
+
+    def current(self, city):
+        with profiling.phase('upstream'):
+            return self._call('current', city)
+
+    def forecast(self, city, days):
+        with profiling.phase('upstream'):
+            return self._call('forecast', city, days)
+
+    def hedge_delay(self):
+        """
+        Возвращает время ожидания основного провайдера перед отправкой хедж-запроса.
+        """
+        if len(self.latency) < self.min_samples:
+            return self.initial_hedge_delay
+        return max(self.min_hedge_delay, self.latency.percentile(self.hedge_percentile))
+
+    def _call(self, method, *args):
+        self._count('requests')
+        self.budget.deposit()
+
+        # Резервный провайдер, который не может ответить для города (нет координат), не вызывается
+        backup = self.secondary.supports(args[0])
+        if not self.breakers[self.primary].allow():
+            if not backup:
+                raise CircuitOpenError("Погодный провайдер временно недоступен.")
+            self._count('failovers')
+            return self._call_secondary(method, *args)
+
+        primary = self._executor.submit(self._invoke, self.primary, method, *args)
+        done, _ = wait([primary], timeout=self.hedge_delay())
+        if not done and backup and self.breakers[self.secondary].allow() and self.budget.try_spend():
+            self._count('hedges')
+            secondary = self._executor.submit(self._invoke, self.secondary, method, *args)
+            return self._first_success(primary, secondary)
+
+        try:
+            return primary.result()
+        except InvalidLocationError:
+            raise
+        except WeatherServiceError:
+            if not backup:
+                raise
+            self._count('failovers')
+            return self._call_secondary(method, *args)
+
+    def _count(self, name):
+        with self._stats_lock:  # Клиент общий для потоков воркера (gunicorn --threads)
+            self.stats[name] += 1
+
+    def _first_success(self, primary, secondary):
+        pending = {primary, secondary}
+        error = None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    result = future.result()
+                except WeatherServiceError as e:
+                    error = e
+                    continue
+                if future is secondary:
+                    self._count('hedge_wins')
+                return result
+        raise error
+
+    def _call_secondary(self, method, *args):
+        if not self.breakers[self.secondary].allow():
+            raise CircuitOpenError("Все погодные провайдеры временно недоступны.")
+        return self._invoke(self.secondary, method, *args)
+
+    def _invoke(self, provider, method, *args):
+        breaker = self.breakers[provider]
+        started = time.perf_counter()
+        try:
+            result = getattr(provider, method)(*args)
+        except InvalidLocationError:
+            breaker.record_success()  # Провайдер исправен: ошибка в запросе
+            raise
+        except WeatherServiceError:
+            breaker.record_failure()
+            raise
+        breaker.record_success()
+        if provider is self.primary:
+            self.latency.add(time.perf_counter() - started)
+        return result
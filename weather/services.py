@@ -0,0 +1,300 @@
+import math
+from functools import lru_cache
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db.models import F
+from django.utils.timezone import now, timedelta
+
+from . import charts
+from .cache_bus import get_near_cache
+from .cities import City, get_city_index, normalize_city_name, stable_city_id
+from .geo import get_geo_index, haversine_km
+from .models import SearchStatistic
+from .observations import record_observations
+from .providers import HedgedWeatherClient, OpenMeteoProvider, WeatherAPIProvider
+from .providers import InvalidLocationError, WeatherServiceError  # noqa: F401 (используются представлениями)
+
+# Пространства имён near-cache (см. cache_bus.py)
+WEATHER_CACHE = 'weather'
+FAVORITES_CACHE = 'favorites'
+CHART_CACHE = 'charts'
+
+
+@lru_cache(maxsize=None)
+def get_weather_client():
+    """
+    Возвращает клиент погодных провайдеров процесса (основной weatherapi.com, резервный open-meteo.com).
+    """
+    return HedgedWeatherClient(
+        WeatherAPIProvider(settings.WEATHER_PRIMARY_URL, settings.WEATHER_API_KEY,
+                           timeout=settings.WEATHER_UPSTREAM_TIMEOUT),
+        OpenMeteoProvider(settings.WEATHER_SECONDARY_URL, timeout=settings.WEATHER_UPSTREAM_TIMEOUT),
+        hedge_percentile=settings.WEATHER_HEDGE_PERCENTILE,
+        hedge_budget=settings.WEATHER_HEDGE_BUDGET,
+    )
+
+
+def fetch_current_weather(city):
+    """
+    Получает текущую погоду для города у основного или резервного провайдера.
+
+    Параметры:
+        city (City | str): Канонический город или название.
+
+    Возвращает:
+        dict: Нормализованный ответ (ключи 'location' и 'current').
+    """
+    return get_weather_client().current(city)
+
+
+def fetch_forecast(city, days=7):
+    """
+    Получает прогноз погоды для города на несколько дней у основного или резервного провайдера.
+
+    Параметры:
+        city (City | str): Канонический город или название.
+        days (int): Количество дней прогноза (1-7).
+
+    Возвращает:
+        dict: Нормализованный ответ (ключи 'location', 'current' и 'forecast').
+    """
+    return get_weather_client().forecast(city, days)
+
+
+def canonicalize_city(city):
+    """
+    Сопоставляет ввод пользователя с каноническим городом до обращения к внешнему API.
+
+    Параметры:
+        city (str): Ввод пользователя в произвольном написании.
+
+    Возвращает:
+        City | None: Город со стабильным идентификатором или None, если город неизвестен.
+    """
+    if not city:
+        return None
+    return get_city_index().canonicalize(city)
+
+
+def lookup_city(city):
+    """
+    Находит город только по точному (после нормализации) написанию, без нечёткого поиска.
+
+    Дешёвая проверка для мест, где canonicalize_city слишком дорог: допуск запроса
+    ограничителем нагрузки и ключ сохранённого ответа при сбросе нагрузки.
+
+    Возвращает:
+        City | None: Город или None, если написание не известно индексу.
+    """
+    if not city:
+        return None
+    return get_city_index().lookup(city)
+
+
+def is_weather_cached(city, cache_key):
+    """
+    Проверяет, лежит ли ответ для города в near-cache, то есть обслуживается ли запрос без внешнего API.
+
+    Город ищется только по точному написанию (lookup_city): проверка выполняется до допуска
+    запроса ограничителем и не должна запускать нечёткий поиск.
+
+    Параметры:
+        city (str): Ввод пользователя.
+        cache_key (str): Вид данных, как в _get_weather: 'current' или 'forecast:<дней>'.
+
+    Возвращает:
+        bool: True, если данные есть в кэше.
+    """
+    canonical = lookup_city(city)
+    return canonical is not None and get_near_cache().get(WEATHER_CACHE, f'{cache_key}:{canonical.id}') is not None
+
+
+def _get_weather(city, fetch, cache_key, locate=False):
+    canonical = canonicalize_city(city)
+    if canonical is None:
+        data = fetch(city)
+        canonical = get_city_index().learn(data['location'], alias=city)
+        record_observations(canonical, data)
+        return data, canonical
+
+    return _load_weather(canonical, fetch, cache_key, locate), canonical
+
+
+def _load_weather(canonical, fetch, cache_key, locate=False, record=True):
+    """
+    Возвращает данные канонического города из near-cache или загружает их у API.
+
+    Параметры:
+        record (bool): Сохранять ли загруженный ответ в историю наблюдений.
+    """
+    def load():
+        data = fetch(canonical)
+        if record:
+            record_observations(canonical, data)
+        if locate:
+            _locate(canonical, data)
+        return data
+
+    return get_near_cache().get_or_set(WEATHER_CACHE, f'{cache_key}:{canonical.id}', load,
+                                       ttl=settings.WEATHER_CACHE_TTL)
+
+
+def _locate(canonical, data):
+    """
+    Добавляет город со свежей текущей погодой в пространственный индекс на время жизни записи кэша.
+    """
+    location = data.get('location') or {}
+    lat, lon = location.get('lat', canonical.lat), location.get('lon', canonical.lon)
+    if lat is not None and lon is not None and not (math.isnan(lat) or math.isnan(lon)):
+        get_geo_index().add(canonical, lat, lon, settings.WEATHER_CACHE_TTL)
+
+
+def get_current_weather(city):
+    """
+    Возвращает текущую погоду для города, указанного в произвольном написании.
+
+    Известные города запрашиваются по каноническому названию, а ответ на WEATHER_CACHE_TTL
+    кэшируется в памяти воркера; незнакомые после ответа API запоминаются в индексе вместе
+    с исходным написанием. Ответ сохраняется в историю наблюдений.
+
+    Параметры:
+        city (str): Ввод пользователя.
+
+    Возвращает:
+        tuple: (ответ API, City).
+    """
+    return _get_weather(city, fetch_current_weather, 'current', locate=True)
+
+
+def get_weather_near(lat, lon, radius_km=None):
+    """
+    Возвращает текущую погоду для точки: из кэша ближайшего города в радиусе или от API.
+
+    Города попадают в пространственный индекс (geo.GridIndex), когда их текущая погода
+    загружается в кэш, и выпадают вместе с записью кэша. Если в радиусе нет города со свежими
+    данными, погода запрашивается для ближайшего известного города в радиусе, а если такого
+    нет — для центра ячейки сетки NEARBY_SNAP_DEG, в которую попала точка. Так число мест
+    в кэше и индексе ограничено, а в историю наблюдений попадают только города с названием.
+
+    Параметры:
+        lat (float), lon (float): Координаты точки в градусах.
+        radius_km (float): Радиус поиска; по умолчанию NEARBY_RADIUS_KM.
+
+    Возвращает:
+        tuple: (ответ API, City, расстояние от точки до места данных в км).
+    """
+    radius_km = settings.NEARBY_RADIUS_KM if radius_km is None else radius_km
+    cache, index = get_near_cache(), get_geo_index()
+    for canonical, distance in index.nearest(lat, lon, radius_km):
+        data = cache.get(WEATHER_CACHE, f'current:{canonical.id}')
+        if data is not None:
+            return data, canonical, distance
+        index.discard(canonical.id)  # Запись кэша истекла или инвалидирована
+
+    known = get_city_index().nearest(lat, lon, radius_km)
+    if known is not None:
+        canonical, distance = known
+        return _load_weather(canonical, fetch_current_weather, 'current', locate=True), canonical, distance
+
+    step = settings.NEARBY_SNAP_DEG
+    cell_lat, cell_lon = round(lat / step) * step, round(lon / step) * step
+    query = f'{cell_lat:.4f},{cell_lon:.4f}'
+    data = fetch_current_weather(City(0, query, '', cell_lat, cell_lon))
+    location = data['location']
+    if normalize_city_name(location.get('name', '')) == normalize_city_name(query):
+        # Провайдер не назвал место (open-meteo): данные кэшируются под ячейкой, без истории наблюдений
+        canonical = City(stable_city_id(query), query, '', cell_lat, cell_lon)
+    else:
+        canonical = get_city_index().learn(location)
+        record_observations(canonical, data)
+    cache.set(WEATHER_CACHE, f'current:{canonical.id}', data, ttl=settings.WEATHER_CACHE_TTL)
+    _locate(canonical, data)
+    data_lat, data_lon = location.get('lat', cell_lat), location.get('lon', cell_lon)
+    distance = float(haversine_km(lat, lon, data_lat, data_lon))
+    return data, canonical, distance
+
+
+def get_forecast(city, days=7):
+    """
+    Возвращает прогноз для города, указанного в произвольном написании.
+
+    Текущая погода и часы прогноза сохраняются в историю наблюдений.
+
+    Параметры:
+        city (str): Ввод пользователя.
+        days (int): Количество дней прогноза (1-7).
+
+    Возвращает:
+        tuple: (ответ API, City).
+    """
+    return _get_weather(city, lambda target: fetch_forecast(target, days=days), f'forecast:{days}')
+
+
+def get_hourly_chart(city, points, method='lttb', by='temp_c'):
+    """
+    Возвращает почасовой ряд семидневного прогноза, прореженный для графика (см. charts.hourly_chart).
+
+    Результат кэшируется в памяти воркера по городу и разрешению (points, method, by)
+    на WEATHER_CACHE_TTL, поэтому повторные запросы графика не пересчитывают выборку.
+
+    Параметры:
+        city (str): Ввод пользователя.
+        points (int): Желаемое количество точек.
+        method (str): 'lttb' или 'minmax'.
+        by (str): Столбец, по которому выбираются точки.
+
+    Возвращает:
+        tuple: (данные графика, City).
+    """
+    data, canonical = get_forecast(city, days=7)
+    chart = get_near_cache().get_or_set(
+        CHART_CACHE, f'{canonical.id}:{points}:{method}:{by}',
+        lambda: charts.hourly_chart(data, points, method, by),
+        ttl=settings.WEATHER_CACHE_TTL,
+    )
+    return chart, canonical
+
+
+def favorite_cities(user):
+    """
+    Возвращает избранные города пользователя из кэша воркера.
+
+    Кэш сбрасывается во всех воркерах при любом изменении избранного (см. signals.py), а если
+    рассылка инвалидации не удалась, запись устаревает через FAVORITES_CACHE_TTL.
+
+    Параметры:
+        user (User): Пользователь.
+
+    Возвращает:
+        list: Словари с ключами 'id' и 'city_name' в порядке добавления.
+    """
+    return get_near_cache().get_or_set(
+        FAVORITES_CACHE, str(user.pk),
+        lambda: list(user.favorite_cities.order_by('id').values('id', 'city_name')),
+        ttl=settings.FAVORITES_CACHE_TTL,
+    )
+
+
+def record_search(city):
+    """
+    Увеличивает счётчик поисковых запросов для города.
+
+    Параметры:
+        city (str): Название города.
+    """
+    search_stat, created = SearchStatistic.objects.get_or_create(city_name=city)
+    SearchStatistic.objects.filter(pk=search_stat.pk).update(search_count=F('search_count') + 1)
+
+
+def active_users_count(period=timedelta(days=1)):
+    """
+    Возвращает количество пользователей, заходивших за указанный период.
+
+    Параметры:
+        period (timedelta): Период активности, по умолчанию последние 24 часа.
+
+    Возвращает:
+        int: Количество активных пользователей.
+    """
+    return User.objects.filter(last_login__gte=now() - period).count()
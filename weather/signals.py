@@ -0,0 +1,15 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .cache_bus import get_near_cache
+from .models import FavoriteCity
+
+
+@receiver([post_save, post_delete], sender=FavoriteCity)
+def invalidate_favorites(sender, instance, **kwargs):
+    """
+    Сбрасывает кэш избранных городов пользователя во всех воркерах после изменения.
+    """
+    from .services import FAVORITES_CACHE
+
+    get_near_cache().invalidate(FAVORITES_CACHE, str(instance.user_id))
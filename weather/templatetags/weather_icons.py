@@ -0,0 +1,39 @@
+from django import template
+from django.urls import reverse
+from django.utils.html import format_html
+
+from weather import icons
+
+register = template.Library()
+
+
+@register.filter
+def local_icon(url):
+    """
+    Заменяет адрес иконки на CDN провайдера адресом локального прокси (/icons/...).
+
+    Адреса, которые не относятся к иконкам провайдера, возвращаются без изменений.
+    """
+    path = icons.icon_path(url)
+    return reverse('icon', args=[path]) if path else url
+
+
+@register.simple_tag
+def weather_icon(url, alt=''):
+    """
+    Выводит иконку погоды: фрагмент собранного спрайта, если он есть, иначе <img> через локальный прокси.
+
+    Параметры:
+        url (str): Адрес иконки из ответа API.
+        alt (str): Альтернативный текст.
+    """
+    path = icons.icon_path(url)
+    sprite = icons.get_icon_cache().sprite() if path else None
+    if sprite and path in sprite[1]:
+        x, y, width, height = sprite[1][path]
+        return format_html(
+            '<span role="img" aria-label="{}" style="display:inline-block;width:{}px;height:{}px;'
+            'background:url({}) -{}px -{}px"></span>',
+            alt, width, height, reverse('icon', args=[f'sprite-{sprite[0]}.png']), x, y,
+        )
+    return format_html('<img src="{}" alt="{}">', local_icon(url), alt)
@@ -1,6 +1,94 @@
-from django.test import TestCase
-from django.urls import reverse
-from django.contrib.auth.models import User
+import asyncio
+import base64
+import hashlib
+import io
+import json
+import math
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from unittest import mock
+from urllib.parse import parse_qs, urlparse
+from urllib.request import urlopen
+
+import msgpack
+import numpy as np
+from channels.layers import InMemoryChannelLayer
+from channels.testing import WebsocketCommunicator
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.management import CommandError, call_command
+from django.http import HttpResponse
+from django.template import Context, Template
+from django.db import IntegrityError, connection, transaction
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import resolve, reverse
+from django.contrib.auth.models import AnonymousUser, User
+
+from weather import bulk_delete, charts, concurrency, icons, observations, profiling, services, wire
+from weather.cache_bus import InMemoryBus, NearCache, get_near_cache
+from weather.cities import City, CityIndex, normalize_city_name
+from weather.chat_hub import RoomHub, get_room_hub
+from weather.consumers import ChatConsumer
+from weather.geo import GridIndex, get_geo_index
+from weather.lazy import lazy_import
+from weather.forms import UserRegistrationForm
+from weather.icons import IconCache
+from weather.management.commands.profile_startup import parse_importtime, cost_by_package
+from weather.models import ChatMessage, FavoriteCity, SearchStatistic, WeatherObservation
+from weather.providers import HedgedWeatherClient, InvalidLocationError, OpenMeteoProvider, WeatherAPIProvider
+
+
+class StubServer:
+    """
+    Локальный HTTP-сервер-заглушка для внешних API с настраиваемой задержкой ответа.
+
+    Параметры:
+        respond (callable): Функция (path, params) -> (status, payload), payload — dict или bytes.
+        latency (callable): Функция без аргументов, возвращающая задержку ответа в секундах.
+    """
+
+    def __init__(self, respond, latency=lambda: 0):
+        self.hits = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub.hits += 1
+                time.sleep(latency())
+                url = urlparse(self.path)
+                status, payload = respond(url.path, {k: v[0] for k, v in parse_qs(url.query).items()})
+                body = payload if isinstance(payload, bytes) else json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f'http://127.0.0.1:{self.server.server_port}'
+
+    def __enter__(self):
+        threading.Thread(target=self.server.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
 
 
 class RegistrationFormTests(TestCase):
@@ -69,3 +157,1589 @@ class RegistrationFormTests(TestCase):
         self.assertTrue(form.errors)  # Убедимся, что есть ошибки
         self.assertIn('email', form.errors)  # Ошибка в поле "email"
         self.assertEqual(form.errors['email'], ['This field is required.'])
+
+    def test_registration_rejects_taken_username_and_email_in_one_query(self):
+        """
+        Проверяет, что занятые имя и адрес (в другом регистре) находятся одним запросом.
+        """
+        User.objects.create_user('taken', 'Taken@Example.com', 'StrongPassword123!')
+        form = UserRegistrationForm({
+            'username': 'taken',
+            'email': 'taken@example.COM',
+            'password1': 'StrongPassword123!',
+            'password2': 'StrongPassword123!',
+        })
+        with CaptureQueriesContext(connection) as queries:
+            self.assertFalse(form.is_valid())
+        self.assertEqual(len(queries), 1)
+        self.assertIn('Это имя пользователя уже занято.', form.errors['username'])
+        self.assertIn('Этот адрес электронной почты уже используется.', form.errors['email'])
+
+    def test_email_unique_index_is_case_insensitive(self):
+        """
+        Проверяет, что база не даёт сохранить один адрес в разном регистре, а пустые адреса не конфликтуют.
+        """
+        User.objects.create_user('first', 'same@example.com')
+        User.objects.create_user('no_email_1')
+        User.objects.create_user('no_email_2')
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            User.objects.create_user('second', 'SAME@example.com')
+
+    def test_registration_race_shows_form_error(self):
+        """
+        Проверяет, что нарушение уникального индекса при сохранении возвращает форму с ошибкой, а не 500.
+        """
+        data = {
+            'username': 'racer',
+            'email': 'racer@example.com',
+            'password1': 'StrongPassword123!',
+            'password2': 'StrongPassword123!',
+        }
+        # Проверка формы прошла, но другой запрос успел вставить тот же адрес
+        with mock.patch.object(UserRegistrationForm, 'clean', lambda form: super(UserRegistrationForm, form).clean()):
+            User.objects.create_user('other', 'RACER@example.com')
+            response = self.client.post(self.register_url, data)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context['form'].non_field_errors())
+        self.assertFalse(User.objects.filter(username='racer').exists())
+
+
+# Кэш Django в памяти процесса вместо общего Redis для тестов, которые его используют
+LOCAL_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class LoginThrottleTests(TestCase):
+    """
+    Тесты ограничения неудачных попыток входа.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.login_url = reverse('login')
+        User.objects.create_user('alice', 'alice@example.com', 'StrongPassword123!')
+
+    @override_settings(LOGIN_THROTTLE_ATTEMPTS=3)
+    def test_locks_after_failures_without_checking_password(self):
+        """
+        Проверяет, что после лимита неудач вход с того же адреса отклоняется с 429 без проверки хеша,
+        а с другого адреса пользователь входит: ошибками в пароле нельзя заблокировать чужой аккаунт.
+        """
+        for _ in range(3):
+            response = self.client.post(self.login_url, {'username': 'alice', 'password': 'wrong'})
+            self.assertEqual(response.status_code, 200)
+
+        with mock.patch('weather.views.authenticate') as authenticate:
+            response = self.client.post(self.login_url, {'username': 'Alice', 'password': 'StrongPassword123!'})
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], str(settings.LOGIN_THROTTLE_WINDOW))
+        authenticate.assert_not_called()
+
+        response = self.client.post(self.login_url, {'username': 'alice', 'password': 'StrongPassword123!'},
+                                    REMOTE_ADDR='198.51.100.7')
+        self.assertEqual(response.status_code, 302)
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+                                           'LOCATION': 'redis://127.0.0.1:1'}})
+    def test_cache_outage_fails_open(self):
+        """
+        Проверяет, что при недоступном Redis вход работает без ограничения, а не отвечает 500.
+        """
+        with self.assertLogs('weather.login_throttle', 'WARNING'):
+            failed = self.client.post(self.login_url, {'username': 'alice', 'password': 'wrong'})
+            response = self.client.post(self.login_url, {'username': 'alice', 'password': 'StrongPassword123!'})
+        self.assertEqual(failed.status_code, 200)
+        self.assertEqual(response.status_code, 302)
+
+    def test_bench_command_removes_only_its_users(self):
+        """
+        Проверяет, что замер входа требует явной базы и удаляет только созданных им пользователей.
+        """
+        User.objects.create_user('bench_real', 'bench@example.com', 'StrongPassword123!')
+        with self.assertRaises(CommandError):
+            call_command('bench_auth', users=10, stdout=io.StringIO())
+        call_command('bench_auth', database='default', users=20, registrations=3, logins=3, hasher='md5',
+                     stdout=io.StringIO())
+        self.assertEqual(sorted(User.objects.values_list('username', flat=True)), ['alice', 'bench_real'])
+
+    def test_api_rejects_basic_auth(self):
+        """
+        Проверяет, что API не принимает пароль в заголовке Authorization в обход ограничения попыток.
+        """
+        credentials = base64.b64encode(b'alice:StrongPassword123!').decode()
+        response = self.client.get(reverse('v1:stats'), HTTP_AUTHORIZATION=f'Basic {credentials}')
+        self.assertIn(response.status_code, (401, 403))
+
+    @override_settings(LOGIN_THROTTLE_ATTEMPTS=3)
+    def test_successful_login_resets_counter(self):
+        """
+        Проверяет, что успешный вход сбрасывает счётчик неудач пользователя.
+        """
+        for _ in range(2):
+            self.client.post(self.login_url, {'username': 'alice', 'password': 'wrong'})
+        response = self.client.post(self.login_url, {'username': 'alice', 'password': 'StrongPassword123!'})
+        self.assertRedirects(response, reverse('weather'), fetch_redirect_response=False)
+        self.client.logout()
+        for _ in range(2):
+            response = self.client.post(self.login_url, {'username': 'alice', 'password': 'wrong'})
+        self.assertEqual(response.status_code, 200)
+
+    @override_settings(LOGIN_THROTTLE_IP_ATTEMPTS=4)
+    def test_ip_limit_covers_many_usernames(self):
+        """
+        Проверяет, что перебор разных имён с одного адреса ограничивается лимитом по IP.
+        """
+        for i in range(4):
+            self.client.post(self.login_url, {'username': f'user{i}', 'password': 'wrong'})
+        response = self.client.post(self.login_url, {'username': 'alice', 'password': 'StrongPassword123!'})
+        self.assertEqual(response.status_code, 429)
+
+    @override_settings(LOGIN_THROTTLE_IP_ATTEMPTS=2, LOGIN_THROTTLE_PROXY_COUNT=1)
+    def test_ip_limit_uses_forwarded_address_behind_proxy(self):
+        """
+        Проверяет, что за доверенным прокси лимит считается по адресу клиента из X-Forwarded-For.
+        """
+        for i in range(2):
+            self.client.post(self.login_url, {'username': f'user{i}', 'password': 'wrong'},
+                             HTTP_X_FORWARDED_FOR='spoofed, 203.0.113.5')
+        response = self.client.post(self.login_url, {'username': 'alice', 'password': 'StrongPassword123!'},
+                                    HTTP_X_FORWARDED_FOR='203.0.113.6')
+        self.assertEqual(response.status_code, 302)
+
+
+class StartupImportTests(TestCase):
+    """
+    Тесты ленивой загрузки тяжёлых модулей при старте воркера.
+    """
+
+    def test_urlconf_does_not_import_docs_or_http_client(self):
+        """
+        Проверяет, что загрузка URLConf не импортирует drf_yasg и HTTP-клиент.
+        """
+        script = (
+            "import sys, django; django.setup()\n"
+            "import weather_project.urls\n"
+            "print('drf_yasg.views' in sys.modules, 'requests.adapters' in sys.modules)\n"
+        )
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=settings.SETTINGS_MODULE,
+                   PYTHONPATH=os.pathsep.join(path for path in sys.path if path))
+        result = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, env=env)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        self.assertEqual(result.stdout.split(), ['False', 'False'])
+
+    def test_lazy_module_first_access_from_threads(self):
+        """
+        Проверяет, что одновременное первое обращение к ленивому модулю из потоков видит его целиком.
+        """
+        with tempfile.TemporaryDirectory() as root:
+            with open(os.path.join(root, 'slow_lazy_module.py'), 'w') as f:
+                f.write('import time\ntime.sleep(0.2)\nVALUE = 42\n')
+            sys.path.insert(0, root)
+            self.addCleanup(sys.modules.pop, 'slow_lazy_module', None)
+            try:
+                module = lazy_import('slow_lazy_module')
+                results = []
+                threads = [threading.Thread(target=lambda: results.append(module.VALUE)) for _ in range(8)]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+            finally:
+                sys.path.remove(root)
+        self.assertEqual(results, [42] * 8)
+
+    def test_schema_view_is_built_on_first_request(self):
+        """
+        Проверяет, что документация API доступна после ленивой инициализации.
+        """
+        response = self.client.get('/swagger.json')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('swagger', response.json())
+
+    def test_parse_importtime(self):
+        """
+        Проверяет разбор отчёта '-X importtime' и агрегацию по пакетам.
+        """
+        output = (
+            "import time: self [us] | cumulative | imported package\n"
+            "import time:       120 |        120 |   requests.utils\n"
+            "import time:       300 |        420 | requests\n"
+            "import time:        50 |         50 | json\n"
+        )
+        rows = parse_importtime(output)
+        self.assertEqual(rows[0], ('requests.utils', 120, 120))
+        self.assertEqual(cost_by_package(rows), [('requests', 420), ('json', 50)])
+
+
+class ApiV1Tests(TestCase):
+    """
+    Тесты JSON REST API версии 1.
+    """
+
+    def setUp(self):
+        """
+        Создаёт пользователя и авторизует тестовый клиент.
+        """
+        self.user = User.objects.create_user(username='apiuser', password='StrongPassword123!')
+        self.client.force_login(self.user)
+        get_near_cache().clear()
+
+    def test_current_weather_sparse_fields(self):
+        """
+        Проверяет, что '?fields=' оставляет только запрошенные вложенные поля.
+        """
+        data = {'location': {'name': 'Kyiv', 'country': 'Ukraine'}, 'current': {'temp_c': 3.0, 'humidity': 80}}
+        with mock.patch.object(services, 'fetch_current_weather', return_value=data):
+            response = self.client.get(reverse('v1:weather'), {'city': 'Kyiv', 'fields': 'location.name,current'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {'location': {'name': 'Kyiv'}, 'current': {'temp_c': 3.0, 'humidity': 80}})
+
+    def test_current_weather_upstream_error(self):
+        """
+        Проверяет, что ошибка внешнего API возвращается как 502.
+        """
+        with mock.patch.object(services, 'fetch_current_weather', side_effect=services.WeatherServiceError('timeout')):
+            response = self.client.get(reverse('v1:weather'), {'city': 'Kyiv'})
+        self.assertEqual(response.status_code, 502)
+
+    def test_favorites_crud_and_cursor_pagination(self):
+        """
+        Проверяет создание без дубликатов, курсорную пагинацию и удаление избранных городов.
+        """
+        url = reverse('v1:favorites')
+        self.assertEqual(self.client.post(url, {'city_name': ' Kyiv '}).status_code, 201)
+        self.assertEqual(self.client.post(url, {'city_name': 'Kyiv'}).status_code, 200)
+        self.client.post(url, {'city_name': 'Lviv'})
+
+        page = self.client.get(url, {'page_size': 1, 'fields': 'city_name'}).json()
+        self.assertEqual(page['results'], [{'city_name': 'Lviv'}])
+        page = self.client.get(page['next']).json()
+        self.assertEqual(page['results'], [{'city_name': 'Kyiv'}])
+
+        city = FavoriteCity.objects.get(user=self.user, city_name='Kyiv')
+        response = self.client.delete(reverse('v1:favorite-detail', args=[city.id]))
+        self.assertEqual(response.status_code, 204)
+        self.assertFalse(FavoriteCity.objects.filter(id=city.id).exists())
+
+    def test_city_statistics_cursor_survives_count_changes(self):
+        """
+        Проверяет, что обход статистики курсором не пропускает и не повторяет города,
+        даже если счётчики меняются между страницами.
+        """
+        names = ['Kharkiv', 'Kyiv', 'Lviv', 'Odesa', 'Dnipro']
+        for count, name in enumerate(names):
+            SearchStatistic.objects.create(city_name=name, search_count=count)
+
+        url = reverse('v1:stats-cities')
+        page = self.client.get(url, {'page_size': 2}).json()
+        seen = [row['city_name'] for row in page['results']]
+        while page['next']:
+            SearchStatistic.objects.filter(city_name=seen[-1]).update(search_count=100)
+            SearchStatistic.objects.filter(city_name='Odesa').update(search_count=-1)
+            page = self.client.get(page['next']).json()
+            seen.extend(row['city_name'] for row in page['results'])
+        self.assertEqual(seen, sorted(names))
+
+    def test_unknown_list_field_is_rejected(self):
+        """
+        Проверяет, что неизвестное поле в '?fields=' для списка возвращает 400.
+        """
+        response = self.client.get(reverse('v1:chat'), {'fields': 'password'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_chat_history_etag(self):
+        """
+        Проверяет, что повторный запрос с If-None-Match возвращает 304.
+        """
+        ChatMessage.objects.create(user=self.user, message='Привет')
+        response = self.client.get(reverse('v1:chat'), {'fields': 'username,message'})
+        self.assertEqual(response.json()['results'], [{'username': 'apiuser', 'message': 'Привет'}])
+
+        response = self.client.get(reverse('v1:chat'), {'fields': 'username,message'},
+                                   HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+
+
+class CityIndexTests(TestCase):
+    """
+    Тесты префиксного индекса городов и канонизации названий.
+    """
+
+    def setUp(self):
+        """
+        Загружает встроенный список городов.
+        """
+        self.index = CityIndex()
+        self.index.load_csv(settings.CITY_LIST_PATH)
+
+    def test_canonicalize_spellings(self):
+        """
+        Проверяет, что разные написания и опечатки ведут к одному городу.
+        """
+        for text in ('Kyiv', ' KIEV ', 'киев', 'Київ', 'Kyyiv', 'Kyiv, Ukraine'):
+            self.assertEqual(self.index.canonicalize(text).name, 'Kyiv', text)
+        self.assertEqual(self.index.canonicalize('Kraków').name, 'Krakow')
+        self.assertEqual(self.index.canonicalize('Kyyiv, ukraine').name, 'Kyiv')
+        self.assertIsNone(self.index.canonicalize('Qwzxv'))
+
+    def test_qualifier_must_match_country(self):
+        """
+        Проверяет, что уточнение через запятую не отбрасывается: чужой город уходит в API как есть.
+        """
+        for text in ('Paris, Texas', 'London, Ontario', 'Odessa, Texas', 'Moscow, Idaho'):
+            self.assertIsNone(self.index.canonicalize(text), text)
+        self.assertEqual(self.index.canonicalize('Paris, France').name, 'Paris')
+        texas = self.index.learn({'name': 'Paris', 'country': 'United States of America', 'lat': 33.66, 'lon': -95.55},
+                                 alias='Paris, Texas')
+        self.assertEqual(self.index.canonicalize('Paris, Texas'), texas)
+        self.assertEqual(self.index.canonicalize('Paris').country, 'France')
+        # Выученный город запрашивается по координатам: по названию API вернул бы Париж во Франции
+        self.assertEqual(WeatherAPIProvider._query(texas), '33.6600,-95.5500')
+        self.assertEqual(WeatherAPIProvider._query(self.index.canonicalize('Paris')), 'Paris')
+
+        ontario = {'name': 'Paris', 'country': 'Canada', 'lat': 43.19, 'lon': -80.38}
+        canada = self.index.learn(ontario)
+        self.assertNotEqual(canada.id, texas.id)
+        restarted = CityIndex()
+        restarted.restore(texas.id, 'Paris')
+        restarted.restore(canada.id, 'Paris')
+        self.assertEqual(restarted.learn(ontario), canada)
+
+    def test_search_by_prefix(self):
+        """
+        Проверяет автодополнение: точное совпадение первым, без дубликатов городов.
+        """
+        names = [city.name for city in self.index.search('львов')]
+        self.assertEqual(names, ['Lviv'])
+        names = [city.name for city in self.index.search('lo')]
+        self.assertIn('London', names)
+        self.assertEqual(len(names), len(set(names)))
+
+    def test_learned_city_is_stable(self):
+        """
+        Проверяет, что город из ответа API получает стабильный id и доступен по исходному написанию.
+        """
+        location = {'name': 'Vorokhta', 'country': 'Ukraine', 'lat': 48.28, 'lon': 24.57}
+        city = self.index.learn(location, alias='Ворохта')
+        other = CityIndex()
+        self.assertEqual(other.learn(location).id, city.id)
+        # После перезапуска город восстанавливается из истории наблюдений с тем же id,
+        # а избранное и новый ответ API находят именно его
+        restarted = CityIndex()
+        restarted.restore(city.id, 'Vorokhta')
+        self.assertEqual(restarted.add('Vorokhta').id, city.id)
+        self.assertEqual(restarted.learn(location), city)
+        self.assertEqual(self.index.canonicalize('ворохта'), city)
+        self.assertEqual(normalize_city_name(' Ivano-Frankivsk '), 'ivano frankivsk')
+
+    def test_lookup_speed_on_large_index(self):
+        """
+        Проверяет, что поиск в индексе на 50 тыс. городов занимает микросекунды.
+        """
+        index = CityIndex()
+        index.load((n, f'City{n:06d}', 'Country', 0.0, 0.0, ()) for n in range(50000))
+        queries = [f'city{n:06d}'[:8] for n in range(0, 50000, 50)]
+        started = time.perf_counter()
+        for query in queries:
+            index.search(query)
+        self.assertLess((time.perf_counter() - started) / len(queries), 0.001)
+
+    def test_autocomplete_endpoint(self):
+        """
+        Проверяет эндпоинт автодополнения городов.
+        """
+        user = User.objects.create_user(username='cityuser', password='StrongPassword123!')
+        self.client.force_login(user)
+        response = self.client.get(reverse('v1:city-autocomplete'), {'q': 'одес'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()[0]['name'], 'Odesa')
+
+    def test_weather_view_requests_canonical_name(self):
+        """
+        Проверяет, что внешний API и статистика получают каноническое название города.
+        """
+        user = User.objects.create_user(username='cityuser', password='StrongPassword123!')
+        self.client.force_login(user)
+        data = {'location': {'name': 'Kyiv', 'country': 'Ukraine'}, 'current': {'condition': {}}}
+        get_near_cache().clear()
+        with mock.patch.object(services, 'fetch_current_weather', return_value=data) as fetch:
+            self.client.post(reverse('weather'), {'city': 'киев'})
+            self.client.post(reverse('weather'), {'city': 'Kiev'})
+        # Второй запрос обслуживается из кэша воркера по каноническому городу
+        self.assertEqual([call.args[0].name for call in fetch.call_args_list], ['Kyiv'])
+        self.assertEqual(SearchStatistic.objects.get().search_count, 2)
+
+
+def weatherapi_stub(path, params):
+    """
+    Ответ заглушки weatherapi.com.
+    """
+    return 200, {'location': {'name': params['q'], 'country': 'Ukraine'},
+                 'current': {'temp_c': 1.0, 'condition': {'text': 'Ясно', 'icon': ''}}}
+
+
+def open_meteo_stub(path, params):
+    """
+    Ответ заглушки open-meteo.com.
+    """
+    return 200, {'latitude': float(params['latitude']), 'longitude': float(params['longitude']),
+                 'timezone': 'Europe/Kyiv', 'utc_offset_seconds': 7200,
+                 'current': {'time': 1700000000, 'temperature_2m': 2.0, 'weather_code': 61,
+                             'wind_direction_10m': 90, 'is_day': 1}}
+
+
+class HedgedWeatherClientTests(TestCase):
+    """
+    Тесты хедж-запросов и переключения между погодными провайдерами на локальных заглушках.
+    """
+    city = City(1, 'Kyiv', 'Ukraine', 50.45, 30.52)
+
+    def test_hedge_cuts_tail_latency(self):
+        """
+        Проверяет, что медленные ответы основного провайдера перекрываются резервным.
+        """
+        rnd = random.Random(7)
+        primary_latency = lambda: 0.4 if rnd.random() < 0.05 else 0.003  # noqa: E731
+        with StubServer(weatherapi_stub, primary_latency) as primary, \
+                StubServer(open_meteo_stub, lambda: 0.01) as secondary:
+            client = HedgedWeatherClient(WeatherAPIProvider(primary.url, 'key'), OpenMeteoProvider(secondary.url),
+                                         hedge_percentile=90, hedge_budget=0.5, min_hedge_delay=0.05,
+                                         initial_hedge_delay=0.05)
+            durations = []
+            for _ in range(80):
+                started = time.perf_counter()
+                data = client.current(self.city)
+                durations.append(time.perf_counter() - started)
+                self.assertIn('temp_c', data['current'])
+
+        self.assertGreater(client.stats['hedge_wins'], 0)
+        self.assertLess(max(durations), 0.3)
+
+    def test_hedge_budget_bounds_extra_load(self):
+        """
+        Проверяет, что количество хеджей не превышает бюджет.
+        """
+        with StubServer(weatherapi_stub, lambda: 0.02) as primary, \
+                StubServer(open_meteo_stub, lambda: 0.02) as secondary:
+            client = HedgedWeatherClient(WeatherAPIProvider(primary.url, 'key'), OpenMeteoProvider(secondary.url),
+                                         hedge_budget=0.1, min_hedge_delay=0.001, initial_hedge_delay=0.001)
+            for _ in range(40):
+                client.current(self.city)
+
+        self.assertLessEqual(client.stats['hedges'], 40 * 0.1 + client.budget.burst)
+        self.assertLessEqual(secondary.hits, client.stats['hedges'])
+
+    def test_stats_counted_across_threads(self):
+        """
+        Проверяет, что счётчики клиента не теряют значения, когда клиент вызывают потоки воркера.
+        """
+        with StubServer(weatherapi_stub, lambda: 0) as primary, StubServer(open_meteo_stub, lambda: 0) as secondary:
+            client = HedgedWeatherClient(WeatherAPIProvider(primary.url, 'key'), OpenMeteoProvider(secondary.url))
+            threads = [threading.Thread(target=lambda: [client.current(self.city) for _ in range(25)])
+                       for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(client.stats['requests'], 200)
+
+    def test_failover_on_errors_and_open_circuit(self):
+        """
+        Проверяет переключение на резервный провайдер при ошибках и при открытом автомате защиты.
+        """
+        with StubServer(lambda path, params: (500, {}), lambda: 0) as primary, \
+                StubServer(open_meteo_stub, lambda: 0) as secondary:
+            client = HedgedWeatherClient(WeatherAPIProvider(primary.url, 'key'), OpenMeteoProvider(secondary.url),
+                                         failure_threshold=3)
+            results = [client.current(self.city) for _ in range(6)]
+
+        self.assertEqual(primary.hits, 3)  # После трёх ошибок основной провайдер больше не вызывается
+        self.assertEqual(secondary.hits, 6)
+        self.assertEqual(results[-1]['location']['name'], 'Kyiv')
+        self.assertEqual(results[-1]['current']['condition']['text'], 'Небольшой дождь')
+        self.assertEqual(results[-1]['current']['wind_dir'], 'E')
+
+    def test_unknown_city_does_not_open_circuit(self):
+        """
+        Проверяет, что «место не найдено» не переключает на резервный провайдер и не открывает автоматы.
+        """
+        not_found = lambda path, params: (400, {'error': {'code': 1006, 'message': 'No matching location found.'}})  # noqa: E731
+        with StubServer(not_found) as primary, StubServer(open_meteo_stub) as secondary:
+            client = HedgedWeatherClient(WeatherAPIProvider(primary.url, 'key'), OpenMeteoProvider(secondary.url),
+                                         failure_threshold=3)
+            for _ in range(6):
+                with self.assertRaisesMessage(InvalidLocationError, 'No matching location found.'):
+                    client.current('Nowhereville')
+
+        self.assertEqual(primary.hits, 6)
+        self.assertEqual(secondary.hits, 0)
+        self.assertFalse(any(breaker.is_open for breaker in client.breakers.values()))
+
+
+class WeatherHistoryTests(TestCase):
+    """
+    Тесты хранилища наблюдений и агрегатов истории погоды.
+    """
+    city = City(1, 'Kyiv', 'Ukraine', 50.45, 30.52)
+
+    def setUp(self):
+        """
+        Создаёт пользователя и авторизует тестовый клиент.
+        """
+        self.user = User.objects.create_user(username='historyuser', password='StrongPassword123!')
+        self.client.force_login(self.user)
+        self.today = int(time.time()) // 86400 * 86400
+
+    def forecast_response(self, temps, start):
+        """
+        Формирует нормализованный ответ с прогнозом: по две точки (00:00 и 12:00) на каждый день.
+        """
+        return {'location': {'name': 'Kyiv'}, 'forecast': {'forecastday': [
+            {'hour': [{'time_epoch': start + day * 86400 + hour * 3600, 'temp_c': temp + hour / 12}
+                      for hour in (0, 12)]}
+            for day, temp in enumerate(temps)
+        ]}}
+
+    def test_record_is_idempotent_upsert(self):
+        """
+        Проверяет, что повторная запись тех же часов обновляет строки, а не дублирует их.
+        """
+        start = self.today - 3 * 86400
+        observations.record_observations(self.city, self.forecast_response([1, 2, 3], start))
+        observations.record_observations(self.city, self.forecast_response([5, 2, 3], start))
+
+        self.assertEqual(WeatherObservation.objects.count(), 6)
+        self.assertEqual(WeatherObservation.objects.order_by('observed_at').first().temp_c, 5)
+
+    def test_daily_summary_and_anomaly(self):
+        """
+        Проверяет дневные минимум/максимум/среднюю, приоритет наблюдения над прогнозом и поиск аномалий.
+        """
+        start = self.today - 9 * 86400
+        observations.record_observations(self.city, self.forecast_response([10] * 8 + [20], start))
+        observations.record_observations(self.city, {
+            'current': {'last_updated_epoch': start + 12 * 3600, 'temp_c': 12.0},
+        })
+
+        daily = observations.daily_summary(observations.load_history([self.city.id], days=30))
+        first = daily.iloc[0]
+        self.assertEqual((first['min'], first['max'], first['mean']), (10, 12, 11))
+        self.assertEqual(len(daily), 9)
+        self.assertEqual(list(daily.index[daily['is_anomaly']].get_level_values('city_name')), ['Kyiv'])
+        self.assertEqual(daily.iloc[-1]['anomaly'], 20.5 - 10.5)  # Окно — 7 предыдущих дней
+
+    def test_history_view_without_upstream(self):
+        """
+        Проверяет, что страница истории строится из сохранённых данных без обращения к внешнему API.
+        """
+        FavoriteCity.objects.create(user=self.user, city_name='Kyiv')
+        kyiv = services.canonicalize_city('Kyiv')
+        observations.record_observations(kyiv, self.forecast_response([4, 6], self.today - 2 * 86400))
+
+        with mock.patch.object(services, 'get_weather_client') as client:
+            response = self.client.get(reverse('history'))
+        client.assert_not_called()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([day['mean'] for day in response.context['daily']], [4.5, 6.5])
+
+
+def png_bytes(color):
+    """
+    Возвращает небольшой PNG-файл заданного цвета.
+    """
+    from PIL import Image
+
+    buffer = io.BytesIO()
+    Image.new('RGBA', (64, 64), color).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+class IconProxyTests(TestCase):
+    """
+    Тесты прокси иконок погоды с дисковым кэшем.
+    """
+
+    def setUp(self):
+        """
+        Направляет кэш иконок во временный каталог.
+        """
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.icon = png_bytes('red')
+
+    def use_cache(self, upstream_url):
+        """
+        Подменяет кэш процесса кэшем во временном каталоге с заглушкой вместо CDN.
+        """
+        cache = IconCache(self.tmp.name, upstream_url)
+        patcher = mock.patch.object(icons, 'get_icon_cache', return_value=cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return cache
+
+    def test_template_rewrites_cdn_urls(self):
+        """
+        Проверяет, что шаблоны ссылаются на локальный прокси вместо CDN.
+        """
+        html = Template('{% load weather_icons %}{% weather_icon url "Иконка" %}').render(
+            Context({'url': '//cdn.weatherapi.com/weather/64x64/night/296.png'}))
+        self.assertEqual(html, '<img src="/icons/64x64/night/296.png" alt="Иконка">')
+        self.assertEqual(icons.icon_path('https://example.com/64x64/day/113.png'), None)
+
+    def test_icon_cached_on_disk_and_revalidated(self):
+        """
+        Проверяет, что иконка скачивается один раз, а дальше отдаётся с диска с ETag и без immutable.
+        """
+        with StubServer(lambda path, params: (200, self.icon)) as cdn:
+            self.use_cache(cdn.url)
+            first = self.client.get('/icons/64x64/day/113.png')
+            second = self.client.get('/icons/64x64/day/113.png')
+            # Ночная иконка с тем же содержимым хранится одним файлом
+            self.client.get('/icons/64x64/night/113.png')
+            not_modified = self.client.get('/icons/64x64/day/113.png', HTTP_IF_NONE_MATCH=first['ETag'])
+
+        self.assertEqual(b''.join(first.streaming_content), self.icon)
+        self.assertEqual(b''.join(second.streaming_content), self.icon)
+        self.assertEqual(first['Cache-Control'], 'public, max-age=86400')
+        self.assertEqual(first['ETag'], f'"{hashlib.sha256(self.icon).hexdigest()}"')
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(cdn.hits, 2)
+        objects = [name for _, _, names in os.walk(os.path.join(self.tmp.name, 'objects')) for name in names]
+        self.assertEqual(len(objects), 1)
+
+    def test_upstream_failure_and_invalid_path(self):
+        """
+        Проверяет редирект на CDN при его недоступности и отказ проксировать произвольные пути.
+        """
+        with StubServer(lambda path, params: (503, {})) as cdn:
+            self.use_cache(cdn.url)
+            response = self.client.get('/icons/64x64/day/113.png')
+            self.assertEqual(self.client.get('/icons/../../etc/passwd').status_code, 404)
+
+        self.assertRedirects(response, f'{cdn.url}/64x64/day/113.png', fetch_redirect_response=False)
+        self.assertEqual(cdn.hits, 1)
+
+    def test_sprite_sheet(self):
+        """
+        Проверяет сборку спрайта и вывод иконки его фрагментом.
+        """
+        with StubServer(lambda path, params: (200, self.icon)) as cdn:
+            cache = self.use_cache(cdn.url)
+            with mock.patch('builtins.open', wraps=open) as opened:
+                self.assertIsNone(cache.sprite())
+                self.assertIsNone(cache.sprite())  # Отсутствие спрайта запомнено: файл не открывается снова
+            self.assertEqual(opened.call_count, 1)
+            call_command('build_icon_sprite', stdout=io.StringIO())
+
+        digest, boxes = cache.sprite()
+        self.assertEqual(len(boxes), 2 * len(icons.ICON_CODES))
+        html = Template('{% load weather_icons %}{% weather_icon url "Иконка" %}').render(
+            Context({'url': '//cdn.weatherapi.com/weather/64x64/day/116.png'}))
+        self.assertIn(f'/icons/sprite-{digest}.png) -64px -0px', html)
+        response = self.client.get(f'/icons/sprite-{digest}.png')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=315360000, immutable')
+        response.close()
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class ChatMessageAdminTests(TransactionTestCase):
+    """
+    Тесты админ-интерфейса сообщений чата: фоновое удаление порциями и дешёвый список.
+
+    TransactionTestCase: фоновый поток удаления работает через собственное соединение с базой
+    и должен видеть созданные тестом записи.
+    """
+
+    def setUp(self):
+        """
+        Создаёт администратора, обычного пользователя и сообщения.
+        """
+        self.admin = User.objects.create_superuser(username='admin', password='StrongPassword123!')
+        self.client.force_login(self.admin)
+        self.users = [User.objects.create_user(username=f'user{i}') for i in range(3)]
+        ChatMessage.objects.bulk_create(
+            ChatMessage(user=self.users[i % 3], message=f'Сообщение {i}') for i in range(25)
+        )
+
+    def test_delete_in_chunks_reports_progress(self):
+        """
+        Проверяет удаление порциями и итоговый прогресс.
+        """
+        keep = ChatMessage.objects.order_by('pk').first()
+        queryset = ChatMessage.objects.exclude(pk=keep.pk)
+        with CaptureQueriesContext(connection) as queries:
+            deleted = bulk_delete.delete_in_chunks(queryset, 'job', chunk_size=10)
+
+        self.assertEqual(deleted, 24)
+        self.assertEqual(list(ChatMessage.objects.all()), [keep])
+        progress = bulk_delete.get_progress('job')
+        self.assertEqual((progress['total'], progress['deleted'], progress['done']), (24, 24, True))
+        deletes = [q['sql'] for q in queries if q['sql'].startswith('DELETE')]
+        self.assertEqual(len(deletes), 3)
+
+    def test_interrupted_job_reported(self):
+        """
+        Проверяет, что задача, остановленная вместе с воркером или потерявшая поток, не висит незавершённой.
+        """
+        with mock.patch.object(bulk_delete, '_stopping', threading.Event()) as stopping, \
+                mock.patch.object(bulk_delete, '_running', {}) as running:
+            running['exiting'] = bulk_delete._new_progress()
+            bulk_delete._interrupt_running()
+            self.assertTrue(stopping.is_set())
+            self.assertEqual(bulk_delete.delete_in_chunks(ChatMessage.objects.all(), 'stopped'), 0)
+        self.assertEqual(ChatMessage.objects.count(), 25)
+        for job_id in ('exiting', 'stopped'):
+            progress = bulk_delete.get_progress(job_id)
+            self.assertEqual((progress['done'], progress['error']), (True, bulk_delete.INTERRUPTED))
+
+        lost = {**bulk_delete._new_progress(), 'updated_at': time.time() - bulk_delete.HEARTBEAT_TIMEOUT - 1}
+        cache.set(bulk_delete.progress_key('lost'), lost)
+        self.assertEqual(bulk_delete.get_progress('lost')['error'], bulk_delete.INTERRUPTED)
+        self.assertContains(self.client.get(reverse('admin:weather_chatmessage_delete_progress', args=['lost'])),
+                            'Удаление прервано')
+
+    def test_admin_action_deletes_in_background(self):
+        """
+        Проверяет, что действие админки сразу возвращает ответ со ссылкой на прогресс, а удаление идёт в фоне.
+        """
+        selected = list(ChatMessage.objects.filter(user=self.users[0]).values_list('pk', flat=True))
+        response = self.client.post(reverse('admin:weather_chatmessage_changelist'), {
+            'action': 'delete_selected_messages', '_selected_action': selected,
+        })
+        self.assertEqual(response.status_code, 302)
+        # SQLite в памяти не допускает параллельного чтения и записи, поэтому дожидаемся фонового потока
+        for thread in threading.enumerate():
+            if thread.name.startswith('bulk-delete-'):
+                thread.join(5)
+
+        response = self.client.get(response['Location'])
+        progress_url = re.search(r'href="([^"]*delete-progress/[^"]+)"', response.content.decode())[1]
+        job_id = progress_url.rstrip('/').rsplit('/', 1)[1]
+        self.assertEqual(bulk_delete.get_progress(job_id)['deleted'], len(selected))
+        self.assertFalse(ChatMessage.objects.filter(user=self.users[0]).exists())
+        self.assertEqual(ChatMessage.objects.count(), 25 - len(selected))
+        self.assertContains(self.client.get(progress_url), f'Удалено {len(selected)} сообщений.')
+
+    def test_changelist_query_count_does_not_grow_with_rows(self):
+        """
+        Проверяет, что пользователи сообщений загружаются одним запросом со списком.
+        """
+        url = reverse('admin:weather_chatmessage_changelist')
+        with CaptureQueriesContext(connection) as few:
+            self.client.get(url)
+        ChatMessage.objects.bulk_create(
+            ChatMessage(user=User.objects.create_user(username=f'extra{i}'), message='Ещё') for i in range(20)
+        )
+        with CaptureQueriesContext(connection) as many:
+            response = self.client.get(url)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(many), len(few))
+
+
+class CacheBusTests(TestCase):
+    """
+    Тесты шины инвалидаций для кэшей в памяти воркеров (воркеры имитируются несколькими NearCache).
+    """
+
+    def setUp(self):
+        """
+        Создаёт два «воркера» на общей шине в памяти.
+        """
+        self.bus = InMemoryBus()
+        self.first = NearCache(self.bus, check_interval=3600)
+        self.second = NearCache(self.bus, check_interval=3600)
+        for cache in (self.first, self.second):
+            cache.set('weather', 'kyiv', 1)
+            cache.set('weather', 'lviv', 2)
+
+    def test_key_and_namespace_invalidation(self):
+        """
+        Проверяет, что инвалидация ключа удаляет только его, а пространства имён — всё, во всех воркерах.
+        """
+        self.first.invalidate('weather', 'kyiv')
+        self.assertIsNone(self.second.get('weather', 'kyiv'))
+        self.assertEqual(self.second.get('weather', 'lviv'), 2)
+
+        self.second.invalidate('weather')
+        self.assertIsNone(self.first.get('weather', 'lviv'))
+
+    def test_missed_message_recovered_by_version_check(self):
+        """
+        Проверяет, что пропущенное сообщение обнаруживается по версии и сбрасывает пространство имён.
+        """
+        self.bus.drop_messages = True
+        self.first.invalidate('weather', 'kyiv')
+        self.bus.drop_messages = False
+        self.assertEqual(self.second.get('weather', 'kyiv'), 1)  # Пока сообщение потеряно, данные устарели
+
+        self.second.check_versions()
+        self.assertIsNone(self.second.get('weather', 'kyiv'))
+        self.assertIsNone(self.second.get('weather', 'lviv'))
+
+        # Следующее сообщение снова применяется точечно
+        self.second.set('weather', 'lviv', 2)
+        self.first.invalidate('weather', 'kyiv')
+        self.assertEqual(self.second.get('weather', 'lviv'), 2)
+
+    def test_value_computed_during_invalidation_is_not_cached(self):
+        """
+        Проверяет, что значение, вычисленное до пришедшей инвалидации, не попадает в кэш.
+        """
+        def load():
+            self.first.invalidate('weather', 'odesa')
+            return 'old'
+
+        self.assertEqual(self.second.get_or_set('weather', 'odesa', load), 'old')
+        self.assertIsNone(self.second.get('weather', 'odesa'))
+
+    def test_favorites_change_invalidates_workers(self):
+        """
+        Проверяет, что изменение избранного сбрасывает закэшированный список у пользователя.
+        """
+        user = User.objects.create_user(username='cacheuser', password='StrongPassword123!')
+        with mock.patch('weather.services.get_near_cache', return_value=self.second), \
+                mock.patch('weather.signals.get_near_cache', return_value=self.first):
+            self.assertEqual(services.favorite_cities(user), [])
+            city = FavoriteCity.objects.create(user=user, city_name='Kyiv')
+            self.assertEqual(services.favorite_cities(user), [{'id': city.id, 'city_name': 'Kyiv'}])
+            city.delete()
+            with self.assertNumQueries(1):
+                self.assertEqual(services.favorite_cities(user), [])
+
+    @override_settings(FAVORITES_CACHE_TTL=0.05)
+    def test_favorites_recover_after_lost_invalidation(self):
+        """
+        Проверяет, что без разосланной инвалидации (Redis недоступен) избранное обновляется через ttl.
+        """
+        user = User.objects.create_user(username='ttluser', password='StrongPassword123!')
+        with mock.patch('weather.services.get_near_cache', return_value=self.second), \
+                mock.patch('weather.signals.get_near_cache', return_value=self.first), \
+                mock.patch.object(self.first.bus, 'publish', side_effect=OSError):
+            self.assertEqual(services.favorite_cities(user), [])
+            city = FavoriteCity.objects.create(user=user, city_name='Kyiv')
+            self.assertEqual(services.favorite_cities(user), [])  # Инвалидация не дошла
+            time.sleep(0.1)
+            self.assertEqual(services.favorite_cities(user), [{'id': city.id, 'city_name': 'Kyiv'}])
+
+
+# Channel layer в памяти процесса вместо Redis для тестов чата
+LOCAL_CHANNEL_LAYERS = {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}
+
+
+class FakeSocket:
+    """
+    Сокет чата для тестов хаба: запоминает отправленные кадры.
+    """
+    binary = False
+
+    def __init__(self, username):
+        self.username = username
+        self.frames = []
+
+    async def send(self, text_data=None, bytes_data=None):
+        self.frames.append(json.loads(text_data))
+
+
+@override_settings(CHANNEL_LAYERS=LOCAL_CHANNEL_LAYERS)
+class ChatBroadcastTests(TestCase):
+    """
+    Тесты пакетной рассылки чата по WebSocket.
+    """
+
+    async def connect(self, username):
+        """
+        Подключает клиента WebSocket от имени пользователя.
+        """
+        communicator = WebsocketCommunicator(ChatConsumer.as_asgi(), '/ws/chat/')
+        communicator.scope['user'] = SimpleNamespace(username=username, is_authenticated=True)
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        return communicator
+
+    async def receive_frames(self, communicator, timeout=0.3):
+        """
+        Возвращает все кадры, пришедшие клиенту за время ожидания.
+        """
+        frames = []
+        while not await communicator.receive_nothing(timeout=timeout):
+            frames.append(json.loads(await communicator.receive_from()))
+        return frames
+
+    async def test_burst_is_delivered_as_one_frame(self):
+        """
+        Проверяет, что пачка сообщений приходит каждому клиенту одним кадром, а список онлайн — общий.
+        """
+        clients = [await self.connect(name) for name in ('alice', 'bob', 'carol')]
+        for client in clients:
+            frames = await self.receive_frames(client)
+            self.assertEqual(frames[-1]['presence'], ['alice', 'bob', 'carol'])
+
+        for i in range(5):
+            await clients[0].send_to(text_data=json.dumps({'message': f'Привет {i}'}))
+        for client in clients:
+            frames = await self.receive_frames(client)
+            self.assertEqual(len(frames), 1)
+            self.assertEqual([m['message'] for m in frames[0]['messages']], [f'Привет {i}' for i in range(5)])
+
+        await clients[2].disconnect()
+        frames = await self.receive_frames(clients[0])
+        self.assertEqual(frames, [{'type': 'batch', 'presence': ['alice', 'bob']}])
+        for client in clients[:2]:
+            await client.disconnect()
+
+    async def test_typing_is_debounced(self):
+        """
+        Проверяет, что частые события «печатает…» сводятся к одному.
+        """
+        alice, bob = await self.connect('alice'), await self.connect('bob')
+        await self.receive_frames(bob)
+
+        for _ in range(10):
+            await alice.send_to(text_data=json.dumps({'typing': True}))
+        frames = await self.receive_frames(bob)
+        self.assertEqual(frames, [{'type': 'batch', 'typing': ['alice']}])
+
+        await alice.disconnect()
+        await bob.disconnect()
+
+    async def test_concurrent_joins_subscribe_once_and_bad_events_skipped(self):
+        """
+        Проверяет, что одновременные первые подключения создают одну подписку, а некорректное
+        событие не останавливает доставку остальных.
+        """
+        layer = InMemoryChannelLayer()
+        new_channel = layer.new_channel
+
+        async def slow_new_channel():
+            await asyncio.sleep(0.01)  # Переключение на другой join, как у Redis
+            return await new_channel()
+
+        layer.new_channel = slow_new_channel
+        hub = RoomHub('race', channel_layer=layer, tick=0.01)
+        sockets = [FakeSocket('alice'), FakeSocket('bob')]
+        await asyncio.gather(*(hub.join(socket) for socket in sockets))
+        self.assertEqual(len(layer.groups['race']), 1)
+
+        await layer.group_send('race', {'type': 'chat.message'})  # Без имени и текста
+        await hub.send_message('alice', 'Привет')
+        await asyncio.sleep(0.1)
+        for socket in sockets:
+            messages = [m['message'] for frame in socket.frames for m in frame.get('messages', ())]
+            self.assertEqual(messages, ['Привет'])
+        self.assertEqual(hub.stats['bad_events'], 1)
+        for socket in sockets:
+            await hub.leave(socket)
+
+    async def test_join_after_last_leave_gets_live_hub(self):
+        """
+        Проверяет, что сокет, получивший хаб до того, как ушёл последний участник, подключается
+        к живому хабу и получает сообщения.
+        """
+        alice, bob = FakeSocket('alice'), FakeSocket('bob')
+        hub = get_room_hub('rejoin')
+        await hub.join(alice)
+        stale = get_room_hub('rejoin')  # Второй сокет ещё ждёт accept
+        await hub.leave(alice)
+        live = await stale.join(bob)
+        self.assertIsNot(live, hub)
+        self.assertIs(get_room_hub('rejoin'), live)
+
+        await live.send_message('bob', 'Снова здесь')
+        await asyncio.sleep(0.2)
+        messages = [m['message'] for frame in bob.frames for m in frame.get('messages', ())]
+        self.assertEqual(messages, ['Снова здесь'])
+        await live.leave(bob)
+
+
+@override_settings(CHANNEL_LAYERS=LOCAL_CHANNEL_LAYERS)
+class WireFormatTests(TestCase):
+    """
+    Тесты компактного формата событий чата и бинарного подпротокола WebSocket.
+    """
+
+    def test_events_round_trip(self):
+        """
+        Проверяет, что события восстанавливаются без потерь, а большие сжимаются.
+        """
+        events = [
+            {'type': 'chat.message', 'username': 'alice', 'message': 'Привет'},
+            {'type': 'chat.typing', 'username': 'bob'},
+            {'type': 'chat.presence', 'hub': uuid.uuid4().hex, 'users': ['alice', 'bob'], 'request': True},
+        ]
+        for event in events:
+            self.assertEqual(wire.unpack_event(wire.pack_event(event)), event)
+
+        long_event = {'type': 'chat.message', 'username': 'alice', 'message': 'дождь ' * 1000}
+        packed = wire.pack_event(long_event, compress_threshold=1024)
+        self.assertNotEqual(packed['p'][0], wire.CODEC_NONE)
+        self.assertLess(len(packed['p']), 200)
+        self.assertEqual(wire.unpack_event(packed), long_event)
+
+    async def test_decompression_bounded(self):
+        """
+        Проверяет, что «zip-бомба» не распаковывается целиком, сжатые кадры клиентов отклоняются,
+        а событие, которое узел не может распаковать, пропускается без остановки хаба.
+        """
+        bomb = bytes([wire.CODEC_ZLIB]) + zlib.compress(b'\0' * (wire.MAX_DECOMPRESSED_SIZE * 8))
+        with self.assertRaises(ValueError):
+            wire.decompress(bomb)
+        if wire.zstandard is not None:
+            bomb = bytes([wire.CODEC_ZSTD]) + wire.zstandard.ZstdCompressor().compress(b'\0' * (wire.MAX_DECOMPRESSED_SIZE * 8))
+            with self.assertRaises(ValueError):
+                wire.decompress(bomb)
+        frame = bytes([wire.CODEC_ZLIB]) + zlib.compress(msgpack.packb({'message': 'дождь'}))
+        self.assertEqual(wire.decompress(frame, max_size=100), msgpack.packb({'message': 'дождь'}))
+        with self.assertRaises(ValueError):
+            wire.decode_client_message(bytes_data=frame)
+
+        hub = RoomHub('chat')
+        with mock.patch.object(wire, 'zstandard', None):
+            hub.deliver({'type': wire.PACKED_EVENT, 'p': bytes([wire.CODEC_ZSTD]) + b'data'})
+        self.assertEqual(hub.stats['undecodable_events'], 1)
+
+    async def test_client_messages_validated(self):
+        """
+        Проверяет, что кадр не того вида закрывает соединение с кодом 1003, а сообщение, которое
+        не кодируется, не лишает остальных пакета с корректными сообщениями.
+        """
+        for bad in ([1, 2], 5, {'message': b'bytes'}, {'message': 'x' * (wire.MAX_MESSAGE_LENGTH + 1)}, {}):
+            with self.assertRaises(ValueError):
+                wire.decode_client_message(bytes_data=b'\x00' + msgpack.packb(bad))
+        self.assertEqual(wire.decode_client_message('{"typing": true}'), {'typing': True})
+
+        communicator = WebsocketCommunicator(ChatConsumer.as_asgi(), '/ws/chat/', subprotocols=['chat.msgpack'])
+        communicator.scope['user'] = SimpleNamespace(username='mallory', is_authenticated=True)
+        await communicator.connect()
+        await communicator.send_to(bytes_data=b'\x00' + msgpack.packb([1, 2]))
+        while True:
+            output = await communicator.receive_output()
+            if output['type'] == 'websocket.close':
+                break
+        self.assertEqual(output['code'], 1003)
+
+        hub = RoomHub('chat')
+        socket = FakeSocket('alice')
+        with self.assertLogs('weather.chat_hub', 'WARNING'):
+            await hub._broadcast({socket}, {'type': 'batch', 'messages': [
+                {'username': 'mallory', 'message': b'bytes'}, {'username': 'alice', 'message': 'Привет'},
+            ]})
+        self.assertEqual(socket.frames[0]['messages'], [{'username': 'alice', 'message': 'Привет'}])
+        self.assertEqual(hub.stats['bad_events'], 1)
+
+    async def test_binary_subprotocol(self):
+        """
+        Проверяет, что клиент с подпротоколом 'chat.msgpack' получает бинарные кадры, а JSON-клиент — текст.
+        """
+        binary = WebsocketCommunicator(ChatConsumer.as_asgi(), '/ws/chat/', subprotocols=['chat.msgpack', 'chat.json'])
+        binary.scope['user'] = SimpleNamespace(username='alice', is_authenticated=True)
+        connected, subprotocol = await binary.connect()
+        self.assertEqual(subprotocol, 'chat.msgpack')
+        text = WebsocketCommunicator(ChatConsumer.as_asgi(), '/ws/chat/')
+        text.scope['user'] = SimpleNamespace(username='bob', is_authenticated=True)
+        await text.connect()
+        while not await binary.receive_nothing(timeout=0.2):
+            await binary.receive_output()
+        while not await text.receive_nothing(timeout=0.2):
+            await text.receive_output()
+
+        await binary.send_to(bytes_data=b'\x00' + msgpack.packb({'message': 'дождь ' * 500}))
+        frame = wire.decode_binary_frame(await binary.receive_from())
+        self.assertEqual(frame['messages'], [{'username': 'alice', 'message': 'дождь ' * 500}])
+        self.assertEqual(json.loads(await text.receive_from())['messages'][0]['username'], 'alice')
+
+        await binary.disconnect()
+        await text.disconnect()
+
+
+@override_settings(PROFILING_ENABLED=True)
+class ProfilingTests(TestCase):
+    """
+    Тесты профилирования запросов и буфера медленных запросов.
+    """
+
+    def setUp(self):
+        profiling._slow_requests.clear()
+        self.staff = User.objects.create_user('staff', 'staff@example.com', 'StrongPassword123!', is_staff=True)
+        self.user = User.objects.create_user('user', 'user@example.com', 'StrongPassword123!')
+
+    def test_staff_header_profiles_request(self):
+        """
+        Проверяет, что запрос сотрудника с X-Profile: 1 профилируется, а страница профилей его показывает.
+        """
+        self.client.force_login(self.staff)
+        response = self.client.get(reverse('statistics'), HTTP_X_PROFILE='1')
+        profile = profiling.get_profile(response['X-Profile-Id'])
+        self.assertEqual(profile.reason, 'header')
+        self.assertEqual(profile.status, 200)
+        self.assertGreater(profile.queries, 0)
+        breakdown = profile.breakdown()
+        self.assertGreater(breakdown['orm'], 0)
+        self.assertGreater(breakdown['template'], 0)
+        self.assertAlmostEqual(sum(breakdown.values()), profile.total, places=6)
+
+        response = self.client.get(reverse('profiles'))
+        self.assertContains(response, reverse('profile_detail', args=[profile.id]))
+        self.assertEqual(self.client.get(reverse('profile_detail', args=[profile.id])).status_code, 200)
+
+    def test_header_ignored_for_regular_users(self):
+        """
+        Проверяет, что заголовок X-Profile обычного пользователя игнорируется, а страница профилей ему недоступна.
+        """
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('statistics'), HTTP_X_PROFILE='1')
+        self.assertNotIn('X-Profile-Id', response)
+        self.assertEqual(profiling.recent_profiles(), [])
+        self.assertEqual(self.client.get(reverse('profiles')).status_code, 302)
+
+    def test_slow_requests_captured_in_bounded_buffer(self):
+        """
+        Проверяет, что запросы дольше порога попадают в кольцевой буфер ограниченного размера.
+        """
+        self.client.force_login(self.user)
+        with self.settings(PROFILING_SLOW_THRESHOLD=0.0, PROFILING_BUFFER_SIZE=3):
+            for _ in range(5):
+                self.client.get(reverse('statistics'))
+            profiles = profiling.recent_profiles()
+        self.assertEqual(len(profiles), 3)
+        self.assertIsNone(profiles[0].reason)
+        self.assertFalse(profiles[0].stacks)
+
+        # Настройки читаются при старте middleware, поэтому нужен новый клиент
+        profiling._slow_requests.clear()
+        self.client = self.client_class()
+        self.client.force_login(self.user)
+        self.client.get(reverse('statistics'))
+        self.assertEqual(profiling.recent_profiles(), [])
+
+    def test_phases_are_exclusive(self):
+        """
+        Проверяет, что время вложенной фазы не засчитывается родительской.
+        """
+        profile = profiling.RequestProfile(RequestFactory().get('/'))
+        token = profiling._current.set(profile)
+        try:
+            with profiling.phase('template'):
+                time.sleep(0.02)
+                with profiling.phase('orm'):
+                    time.sleep(0.03)
+        finally:
+            profiling._current.reset(token)
+        self.assertGreaterEqual(profile.phases['orm'], 0.03)
+        self.assertLess(profile.phases['template'], 0.03)
+
+    def test_stack_sampler_exports_folded_stacks(self):
+        """
+        Проверяет, что выборка стеков находит работающую функцию и выгружается в свёрнутом формате.
+        """
+        profile = profiling.RequestProfile(RequestFactory().get('/'), reason='header')
+        sampler = profiling.StackSampler(threading.get_ident(), profile.stacks, 0.001)
+        sampler.start()
+        deadline = time.perf_counter() + 0.1
+        while time.perf_counter() < deadline:
+            pass
+        sampler.stop()
+        folded = profile.folded()
+        self.assertIn('weather.tests:test_stack_sampler_exports_folded_stacks', folded)
+        self.assertRegex(folded.splitlines()[0], r'^\S+ \d+$')
+
+    def test_disabled_middleware_is_not_used(self):
+        """
+        Проверяет, что при PROFILING_ENABLED = False middleware исключается из цепочки.
+        """
+        with self.settings(PROFILING_ENABLED=False), self.assertRaises(MiddlewareNotUsed):
+            profiling.ProfilingMiddleware(lambda request: None)
+
+
+def reference_lttb(x, y, points):
+    """
+    Построчная реализация LTTB для сверки с векторной.
+    """
+    size = len(x)
+    def edge(i):
+        return i * (size - 2) // (points - 2) + 1
+
+    selected, previous = [0], 0
+    for i in range(points - 2):
+        start, end = edge(i), edge(i + 1)
+        next_start, next_end = end, edge(i + 2)
+        if i == points - 3:
+            next_start, next_end = size - 1, size
+        avg_x = sum(x[next_start:next_end]) / (next_end - next_start)
+        avg_y = sum(y[next_start:next_end]) / (next_end - next_start)
+        best, best_area = start, -1.0
+        for j in range(start, end):
+            area = abs((x[previous] - avg_x) * (y[j] - y[previous]) - (x[previous] - x[j]) * (avg_y - y[previous]))
+            if area > best_area:
+                best, best_area = j, area
+        selected.append(best)
+        previous = best
+    return selected + [size - 1]
+
+
+class HourlyChartTests(TestCase):
+    """
+    Тесты почасового ряда для графиков и прореживания на сервере.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='chartuser', password='StrongPassword123!')
+        self.client.force_login(self.user)
+        get_near_cache().clear()
+
+    @staticmethod
+    def forecast(hours=168):
+        start = 1_760_000_400
+        rnd = random.Random(7)
+        day = {'hour': [
+            {'time_epoch': start + 3600 * i, 'temp_c': round(10 + 8 * math.sin(i / 24 * 2 * math.pi) + rnd.random(), 1),
+             'precip_mm': 25.0 if i == 100 else 0.0, 'wind_kph': None if i == 5 else 12.0}
+            for i in range(hours)
+        ]}
+        return {'location': {'name': 'Kyiv', 'country': 'Ukraine'}, 'forecast': {'forecastday': [day]}}
+
+    def test_lttb_matches_reference(self):
+        """
+        Проверяет, что векторный LTTB выбирает те же точки, что и построчная реализация.
+        """
+        rnd = random.Random(3)
+        x = np.arange(500, dtype=float)
+        y = np.array([rnd.gauss(0, 1) for _ in range(500)])
+        for points in (3, 10, 47, 499):
+            self.assertEqual(charts.lttb(x, y, points).tolist(), reference_lttb(x.tolist(), y.tolist(), points))
+        self.assertEqual(charts.lttb(x, y, 600).tolist(), list(range(500)))
+
+    def test_minmax_keeps_extremes(self):
+        """
+        Проверяет, что min-max сохраняет пики, игнорирует пропуски и не превышает бюджет точек.
+        """
+        x = np.arange(168)
+        y = np.zeros(168)
+        y[100], y[20], y[21] = 25.0, -5.0, np.nan
+        indices = charts.minmax(x, y, 24)
+        self.assertIn(100, indices)
+        self.assertIn(20, indices)
+        self.assertNotIn(21, indices)
+        self.assertLessEqual(len(indices), 24)
+        self.assertEqual(indices.tolist(), sorted(set(indices.tolist())))
+
+    def test_hourly_endpoint_returns_cached_columns(self):
+        """
+        Проверяет столбцы ответа, небольшой размер и кэширование по городу и разрешению.
+        """
+        url = reverse('v1:forecast-hourly')
+        with mock.patch.object(services, 'fetch_forecast', return_value=self.forecast()) as fetch, \
+                mock.patch.object(charts, 'hourly_chart', wraps=charts.hourly_chart) as build:
+            response = self.client.get(url, {'city': 'Kyiv', 'points': 24, 'method': 'minmax', 'by': 'precip_mm'})
+            self.client.get(url, {'city': 'Kyiv', 'points': 24, 'method': 'minmax', 'by': 'precip_mm'})
+            self.client.get(url, {'city': 'Kyiv', 'points': 48})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(fetch.call_count, 1)
+        self.assertEqual(build.call_count, 2)
+
+        chart = response.json()
+        self.assertEqual(chart['city']['name'], 'Kyiv')
+        self.assertEqual(chart['source_points'], 168)
+        self.assertLessEqual(chart['points'], 24)
+        self.assertEqual({len(chart[column]) for column in ('t', 'temp_c', 'precip_mm', 'wind_kph')}, {chart['points']})
+        self.assertIn(25.0, chart['precip_mm'])
+        self.assertLess(len(response.content), 2048)
+
+    def test_hourly_endpoint_validates_params(self):
+        """
+        Проверяет, что недопустимые параметры возвращают 400 без запроса к API.
+        """
+        url = reverse('v1:forecast-hourly')
+        with mock.patch.object(services, 'fetch_forecast') as fetch:
+            for params in ({'points': 1}, {'points': 'many'}, {'method': 'average'}, {'by': 'humidity'}):
+                response = self.client.get(url, {'city': 'Kyiv', **params})
+                self.assertEqual(response.status_code, 400)
+        fetch.assert_not_called()
+
+
+class NearbyWeatherTests(TestCase):
+    """
+    Тесты поиска погоды по координатам через пространственный индекс кэшированных городов.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='geouser', password='StrongPassword123!')
+        self.client.force_login(self.user)
+        get_near_cache().clear()
+        get_geo_index.cache_clear()
+
+    @staticmethod
+    def current(name, lat, lon, country='Ukraine'):
+        return {'location': {'name': name, 'country': country, 'lat': lat, 'lon': lon},
+                'current': {'temp_c': 11.0, 'condition': {'text': 'Ясно', 'icon': ''}}}
+
+    def test_grid_nearest_radius_and_expiry(self):
+        """
+        Проверяет порядок по расстоянию, радиус, переход через 180-й меридиан и устаревание записей.
+        """
+        index = GridIndex(cell_deg=0.5)
+        kyiv, brovary = City(1, 'Kyiv', 'Ukraine', 50.45, 30.52), City(2, 'Brovary', 'Ukraine', 50.51, 30.79)
+        index.add(kyiv, kyiv.lat, kyiv.lon, ttl=60)
+        index.add(brovary, brovary.lat, brovary.lon, ttl=60)
+        result = index.nearest(50.47, 30.70, radius_km=30)
+        self.assertEqual([city.name for city, _ in result], ['Brovary', 'Kyiv'])
+        self.assertAlmostEqual(result[1][1], 12.9, delta=0.5)
+        self.assertEqual(index.nearest(50.47, 30.70, radius_km=10), [(brovary, mock.ANY)])
+
+        fiji = City(3, 'Suva', 'Fiji', -18.1, 179.95)
+        index.add(fiji, fiji.lat, fiji.lon, ttl=60)
+        self.assertEqual([city for city, _ in index.nearest(-18.1, -179.95, radius_km=20)], [fiji])
+
+        index.discard(brovary.id)
+        index.add(kyiv, kyiv.lat, kyiv.lon, ttl=-1)
+        self.assertEqual(index.nearest(50.47, 30.70, radius_km=30), [])
+        self.assertEqual(len(index), 1)
+
+    def test_grid_reuses_rows(self):
+        """
+        Проверяет, что строки удалённых и истёкших записей используются повторно, а массивы не растут.
+        """
+        index = GridIndex(cell_deg=0.5, capacity=2)
+        for i in range(100):
+            city = City(i, f'Point {i}', '', 10 + i / 10, 20.0)
+            index.add(city, city.lat, city.lon, ttl=-1 if i % 2 else 60)
+            if i % 2 == 0:
+                index.discard(city.id)
+        self.assertEqual(len(index._lat), 2)
+        last = City(100, 'Last', '', 15.0, 20.0)
+        index.add(last, last.lat, last.lon, ttl=60)
+        self.assertEqual(index.nearest(15.0, 20.0, radius_km=5), [(last, mock.ANY)])
+        self.assertEqual(len(index), 1)
+
+    def test_cached_city_served_without_upstream(self):
+        """
+        Проверяет, что загрузка погоды города пополняет индекс и точка рядом получает её без запроса к API.
+        """
+        with mock.patch.object(services, 'fetch_current_weather',
+                               return_value=self.current('Kyiv', 50.45, 30.52)) as fetch:
+            services.get_current_weather('Kyiv')
+            response = self.client.get(reverse('v1:weather'), {'lat': '50.48', 'lon': '30.60'})
+        self.assertEqual(fetch.call_count, 1)
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        self.assertEqual(body['location']['name'], 'Kyiv')
+        self.assertEqual(body['nearest']['name'], 'Kyiv')
+        self.assertLess(body['nearest']['distance_km'], 10)
+        self.assertNotIn('nearest', get_near_cache().get(services.WEATHER_CACHE,
+                                                         f"current:{body['nearest']['id']}"))
+
+    def test_miss_goes_upstream_and_fills_index(self):
+        """
+        Проверяет, что без города в радиусе погода запрашивается по координатам и кэшируется для соседей.
+        """
+        data = self.current('Lviv', 49.84, 24.03)
+        with mock.patch.object(services, 'fetch_current_weather', return_value=data) as fetch:
+            first, canonical, _ = services.get_weather_near(49.83, 24.02)
+            second, again, distance = services.get_weather_near(49.85, 24.05)
+        self.assertEqual(fetch.call_count, 1)
+        self.assertEqual(fetch.call_args.args[0].name, 'Lviv')  # Ближайший город из встроенного списка
+        self.assertEqual((first, canonical), (second, again))
+        self.assertLess(distance, 2)
+
+    def test_unnamed_point_snapped_to_grid(self):
+        """
+        Проверяет, что точка без города поблизости запрашивается по центру ячейки сетки,
+        соседние точки делят одну запись кэша, а история наблюдений не пополняется.
+        """
+        def unnamed(city):
+            return self.current(city.name, city.lat, city.lon, country='')
+
+        with mock.patch.object(services, 'fetch_current_weather', side_effect=unnamed) as fetch:
+            _, canonical, _ = services.get_weather_near(40.0123, -30.0234)
+            _, again, distance = services.get_weather_near(39.9789, -29.9811)
+        self.assertEqual(fetch.call_count, 1)
+        self.assertEqual(canonical.name, '40.0000,-30.0000')
+        self.assertEqual(again, canonical)
+        self.assertLess(distance, 8)
+        self.assertFalse(WeatherObservation.objects.exists())
+
+    def test_invalid_coordinates(self):
+        """
+        Проверяет отказ API и страницы погоды на координаты вне допустимых диапазонов.
+        """
+        with mock.patch.object(services, 'fetch_current_weather') as fetch:
+            response = self.client.get(reverse('v1:weather'), {'lat': '91', 'lon': '0'})
+            page = self.client.post(reverse('weather'), {'lat': 'nan', 'lon': '10'})
+        self.assertEqual(response.status_code, 400)
+        self.assertContains(page, 'Некорректные координаты')
+        fetch.assert_not_called()
+
+
+class ConcurrencyLimitTests(TestCase):
+    """
+    Тесты адаптивного ограничения параллельных запросов и сброса нагрузки.
+    """
+    classes = {'upstream': {'initial': 4, 'min': 1, 'max': 8, 'target': 0.15},
+               'db': {'initial': 4, 'min': 1, 'max': 4, 'target': 0.5}}
+
+    def setUp(self):
+        get_near_cache().clear()
+        concurrency.get_limiter.cache_clear()
+        concurrency.get_stale_store.cache_clear()
+        self.addCleanup(concurrency.get_limiter.cache_clear)
+        self.factory = RequestFactory()
+
+    def handler(self, view):
+        """
+        Собирает обработчик, как Django: middleware, затем process_view, затем представление.
+        """
+        middleware = concurrency.ConcurrencyLimitMiddleware(
+            lambda request: middleware.process_view(request, view, (), {}) or view(request))
+        return middleware
+
+    def call(self, handler, path, user=SimpleNamespace(is_authenticated=True), **params):
+        request = self.factory.get(path, params)
+        request.resolver_match = resolve(path)
+        request.user = user  # Как после AuthenticationMiddleware
+        return handler(request)
+
+    @staticmethod
+    def upstream_view(stub):
+        def view(request):
+            with urlopen(f"{stub.url}/current?q={request.GET['city']}") as response:
+                return HttpResponse(response.read(), content_type='application/json')
+        return view
+
+    def load(self, handler, path, threads=16, requests_per_thread=6):
+        """
+        Возвращает задержки и статусы запросов, отправленных из threads потоков одновременно.
+        """
+        results = []
+
+        def worker():
+            for _ in range(requests_per_thread):
+                started = time.perf_counter()
+                response = self.call(handler, path, city='Kyiv')
+                results.append((time.perf_counter() - started, response.status_code))
+                time.sleep(0.01)
+
+        workers = [threading.Thread(target=worker) for _ in range(threads)]
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        return results
+
+    def test_aimd_limit(self):
+        """
+        Проверяет рост лимита на быстрых ответах под нагрузкой, уменьшение на медленных и отказ сверх лимита.
+        """
+        limiter = concurrency.AIMDLimiter('upstream', initial=2, min_limit=1, max_limit=4, target=0.1, backoff=0.5)
+        self.assertTrue(limiter.try_acquire())
+        self.assertTrue(limiter.try_acquire())
+        self.assertFalse(limiter.try_acquire())
+        limiter.release(0.01)
+        self.assertEqual(limiter.limit, 2.5)
+        limiter.release(0.01)  # Лимит загружен меньше чем наполовину: не растёт
+        self.assertEqual(limiter.limit, 2.5)
+
+        self.assertTrue(limiter.try_acquire())
+        limiter.release(1.0)
+        self.assertEqual(limiter.limit, 1.25)
+        self.assertTrue(limiter.try_acquire())
+        limiter.release(1.0)  # Второй медленный ответ той же волны не уменьшает лимит ещё раз
+        self.assertEqual(limiter.limit, 1.25)
+        self.assertEqual(limiter.snapshot()['shed'], 1)
+
+    def test_p99_bounded_under_overload(self):
+        """
+        Проверяет, что при медленном upstream задержка p99 ограничена: лишние запросы сразу получают 503.
+        """
+        capacity = threading.BoundedSemaphore(2)
+
+        def upstream_latency():
+            with capacity:  # Upstream обслуживает два запроса одновременно, остальные ждут в очереди
+                time.sleep(0.05)
+            return 0
+
+        def p99(results):
+            return sorted(latency for latency, _ in results)[int(len(results) * 0.99) - 1]
+
+        with StubServer(weatherapi_stub, upstream_latency) as stub, \
+                override_settings(CONCURRENCY_CLASSES=self.classes, CONCURRENCY_STALE_ROUTES=()):
+            view = self.upstream_view(stub)
+            unlimited = self.load(lambda request: view(request), '/api/v1/weather/')
+            started = time.perf_counter()
+            limited = self.load(self.handler(view), '/api/v1/weather/')
+            elapsed = time.perf_counter() - started
+
+        statuses = [status for _, status in limited]
+        self.assertGreater(p99(unlimited), 0.3)
+        self.assertLess(p99(limited), 0.25)
+        # Upstream при этом остаётся загружен: обслужено не меньше половины его пропускной способности
+        self.assertGreater(statuses.count(200), 0.5 * elapsed * 2 / 0.05)
+        self.assertGreater(statuses.count(503), 0)
+
+    def test_cheap_and_cached_routes_not_limited(self):
+        """
+        Проверяет, что дешёвые маршруты и город с погодой в кэше обслуживаются при исчерпанном лимите.
+        """
+        view = lambda request: HttpResponse('ok')  # noqa: E731
+        classes = dict(self.classes, upstream=dict(self.classes['upstream'], initial=1))
+        with override_settings(CONCURRENCY_CLASSES=classes):
+            handler = self.handler(view)
+            self.assertTrue(concurrency.get_limiter('upstream').try_acquire())
+            self.assertEqual(self.call(handler, '/api/v1/weather/', city='Kyiv').status_code, 503)
+            self.assertEqual(self.call(handler, '/index/').status_code, 200)
+
+            kyiv = services.canonicalize_city('Kyiv')
+            get_near_cache().set(services.WEATHER_CACHE, f'current:{kyiv.id}', {'location': {}}, ttl=60)
+            self.assertEqual(self.call(handler, '/api/v1/weather/', city='Kyiv').status_code, 200)
+
+    def test_stale_response_when_shedding(self):
+        """
+        Проверяет, что сброшенный запрос API вошедшего пользователя получает последний удачный ответ
+        на тот же запрос, анонимный — 503, а допуск запроса обходится без нечёткого поиска города.
+        """
+        view = lambda request: HttpResponse(b'{"current": {}}', content_type='application/json')  # noqa: E731
+        with override_settings(CONCURRENCY_CLASSES=self.classes):
+            handler = self.handler(view)
+            self.call(handler, '/api/v1/forecast/', city='Kyiv', days='3')
+            with mock.patch.object(CityIndex, 'canonicalize') as canonicalize:
+                self.call(handler, '/api/v1/forecast/', city='Kyyiv', days='3')
+            canonicalize.assert_not_called()
+            limiter = concurrency.get_limiter('upstream')
+            while limiter.try_acquire():
+                pass
+            stale = self.call(handler, '/api/v1/forecast/', city='Kyiv', days='3')
+            other = self.call(handler, '/api/v1/forecast/', city='Kyiv', days='5')
+            anonymous = self.call(handler, '/api/v1/forecast/', user=AnonymousUser(), city='Kyiv', days='3')
+
+        self.assertEqual(stale.status_code, 200)
+        self.assertEqual(stale.content, b'{"current": {}}')
+        self.assertEqual(stale['X-Load-Shed'], 'stale')
+        self.assertEqual(other.status_code, 503)
+        self.assertEqual(other['Retry-After'], str(settings.CONCURRENCY_RETRY_AFTER))
+        self.assertEqual(anonymous.status_code, 503)  # Данные API только для вошедших
+
+    def test_stale_key_normalized_and_store_bounded(self):
+        """
+        Проверяет, что ответ ищется по каноническому городу и параметрам без мусора в URL,
+        а ответы лежат в отдельном ограниченном хранилище и не вытесняют near-cache.
+        """
+        view = lambda request: HttpResponse(b'{"current": {}}', content_type='application/json')  # noqa: E731
+        with override_settings(CONCURRENCY_CLASSES=self.classes, CONCURRENCY_STALE_MAXSIZE=3):
+            handler = self.handler(view)
+            get_near_cache().set(services.WEATHER_CACHE, 'marker', 1)
+            for days in range(1, 8):
+                self.call(handler, '/api/v1/forecast/', city='Kyiv', days=str(days), junk=str(days))
+            for i in range(50):
+                self.call(handler, '/api/v1/forecast/', city='Atlantis', days='3', junk=str(i))
+            self.call(handler, '/api/v1/forecast/', city='Kyiv', days='3', fields='current,location')
+            self.assertEqual(len(concurrency.get_stale_store()), 3)
+
+            limiter = concurrency.get_limiter('upstream')
+            while limiter.try_acquire():
+                pass
+            stale = self.call(handler, '/api/v1/forecast/', city='Киев', days='03', fields='location,current', _='1')
+            unknown = self.call(handler, '/api/v1/forecast/', city='Atlantis', days='3', junk='1')
+        self.assertEqual(stale['X-Load-Shed'], 'stale')
+        self.assertEqual(unknown.status_code, 503)
+        self.assertEqual(get_near_cache().get(services.WEATHER_CACHE, 'marker'), 1)
+
@@ -1,12 +1,18 @@
+import os
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified
 from django.shortcuts import render, redirect, get_object_or_404
+from django.contrib import admin
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth import login, authenticate, logout
 from django.contrib.auth.decorators import login_required
-from django.contrib.auth.models import User
 from .forms import UserRegistrationForm
-import requests
-from django.conf import settings
 from django.contrib import messages
 from .models import FavoriteCity, ChatMessage, SearchStatistic
+from . import concurrency, icons, login_throttle, observations, profiling, services
+from .geo import parse_coordinates
 
 
 def register_view(request):
@@ -25,9 +31,15 @@ def register_view(request):
     if request.method == "POST":
         form = UserRegistrationForm(request.POST)
         if form.is_valid():
-            user = form.save()
-            login(request, user)  # Авторизуем пользователя сразу после регистрации
-            return redirect('weather')  # Перенаправление на страницу погоды
+            try:
+                with transaction.atomic():
+                    user = form.save()
+            except IntegrityError:
+                # Имя или адрес заняли между проверкой формы и вставкой (уникальные индексы базы)
+                form.add_error(None, "Имя пользователя или адрес электронной почты уже заняты.")
+            else:
+                login(request, user)  # Авторизуем пользователя сразу после регистрации
+                return redirect('weather')  # Перенаправление на страницу погоды
     else:
         form = UserRegistrationForm()
 
@@ -41,6 +53,9 @@ def login_view(request):
     При POST-запросе проверяет имя пользователя и пароль. Если они правильные,
     то авторизует пользователя и перенаправляет на страницу погоды.
 
+    После LOGIN_THROTTLE_ATTEMPTS неудач для имени пользователя (или LOGIN_THROTTLE_IP_ATTEMPTS
+    с одного IP-адреса) попытки отклоняются со статусом 429 без проверки пароля до конца окна.
+
     Параметры:
         request (HttpRequest): Запрос пользователя.
 
@@ -50,11 +65,18 @@ def login_view(request):
     if request.method == "POST":
         username = request.POST.get('username')
         password = request.POST.get('password')
+        if login_throttle.is_throttled(request, username):
+            response = render(request, 'weather/login.html',
+                              {'error': 'Слишком много неудачных попыток входа. Попробуйте позже.'}, status=429)
+            response['Retry-After'] = str(settings.LOGIN_THROTTLE_WINDOW)
+            return response
         user = authenticate(request, username=username, password=password)
         if user:
+            login_throttle.reset(request, username)
             login(request, user)
             return redirect('weather')  # Перенаправление на страницу погоды
         else:
+            login_throttle.register_failure(request, username)
             return render(request, 'weather/login.html', {'error': 'Неправильное имя пользователя или пароль'})
     return render(request, 'weather/login.html')
 
@@ -105,7 +127,7 @@ def favorite_cities_view(request):
     if not user.is_authenticated:
         return redirect('login')
 
-    favorite_cities = user.favorite_cities.all()
+    favorite_cities = services.favorite_cities(user)
 
     context = {
         'favorite_cities': favorite_cities,
@@ -169,6 +191,8 @@ def weather_view(request):
     Отображает страницу погоды для указанного города.
 
     При POST-запросе извлекает данные о погоде через API и отображает их пользователю.
+    Вместо города можно передать координаты lat и lon (кнопка «Моё местоположение»):
+    тогда показываются данные ближайшего города из кэша (services.get_weather_near).
 
     Параметры:
         request (HttpRequest): Запрос пользователя.
@@ -181,26 +205,33 @@ def weather_view(request):
 
     if request.method == 'POST':
         city = request.POST.get('city')
-        if city:
-            url = "http://api.weatherapi.com/v1/current.json"
-            params = {
-                "key": settings.WEATHER_API_KEY,
-                "q": city,
-                "aqi": "no"
-            }
+        if request.POST.get('lat') and request.POST.get('lon'):
             try:
-                response = requests.get(url, params=params)
-                response.raise_for_status()
-                weather_data = response.json()
-                search_stat, created = SearchStatistic.objects.get_or_create(city_name=city)
-                search_stat.search_count += 1
-                search_stat.save()
+                lat, lon = parse_coordinates(request.POST['lat'], request.POST['lon'])
+                weather_data, canonical, distance = services.get_weather_near(lat, lon)
+                return render(request, 'weather/index.html', {
+                    'weather': weather_data,
+                    'city': canonical.name,
+                    'distance_km': round(distance, 1),  # Насколько далеко место данных от пользователя
+                })
+            except ValueError:
+                error = "Некорректные координаты."
+            except services.InvalidLocationError:
+                error = "Для этих координат нет данных о погоде."
+            except services.WeatherServiceError as e:
+                error = f"Ошибка запроса к API: {e}"
+        elif city:
+            try:
+                weather_data, canonical = services.get_current_weather(city)
+                services.record_search(canonical.name)
 
                 return render(request, 'weather/index.html', {
                     'weather': weather_data,  # Передаём погоду в шаблон
-                    'city': city
+                    'city': canonical.name
                 })
-            except requests.RequestException as e:
+            except services.InvalidLocationError:
+                error = f"Город «{city}» не найден."
+            except services.WeatherServiceError as e:
                 error = f"Ошибка запроса к API: {e}"
 
     return render(request, 'weather/index.html', {'weather': weather_data, 'error': error})
@@ -212,8 +243,7 @@ def statistics_view(request):
     popular_cities = SearchStatistic.objects.order_by('-search_count')[:5]
 
     # Получаем количество активных пользователей (например, заходили за последние 24 часа)
-    from django.utils.timezone import now, timedelta
-    active_users_count = User.objects.filter(last_login__gte=now() - timedelta(days=1)).count()
+    active_users_count = services.active_users_count()
 
     context = {
         'popular_cities': popular_cities,
@@ -239,16 +269,8 @@ def forecast_view(request):
     period = request.GET.get('period', 'tomorrow')
 
     try:
-        url = f"http://api.weatherapi.com/v1/forecast.json"
-        params = {
-            "key": settings.WEATHER_API_KEY,
-            "q": city,
-            "days": 7,
-            "lang": "ru",
-        }
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        data = response.json()
+        data, canonical = services.get_forecast(city, days=7)
+        city = canonical.name
 
         if period == 'tomorrow':
             forecast = data['forecast']['forecastday'][1]  # Прогноз на завтра
@@ -262,7 +284,9 @@ def forecast_view(request):
             'forecast': forecast,
             'period': period,
         }
-    except (requests.RequestException, KeyError) as e:
+    except services.InvalidLocationError:
+        context = {'city': city, 'error': f'Город «{city}» не найден.'}
+    except (services.WeatherServiceError, KeyError) as e:
         context = {
             'city': city,
             'error': 'Не удалось получить данные о погоде. Пожалуйста, попробуйте снова.',
@@ -293,3 +317,163 @@ def chat_view(request):
     # Получаем все сообщения
     messages = ChatMessage.objects.all()
     return render(request, 'weather/chat.html', {'messages': messages})
+
+
+@login_required
+def history_view(request):
+    """
+    Отображает историю погоды: дневные минимум, максимум и среднюю температуру,
+    аномалии относительно скользящего среднего и сравнение городов.
+
+    Данные берутся только из сохранённых наблюдений, без обращения к внешнему API.
+
+    Параметры:
+        request (HttpRequest): Запрос пользователя. Параметры 'city' (можно несколько)
+            и 'days' (глубина истории, по умолчанию 30). Без 'city' показываются избранные города.
+
+    Возвращает:
+        HttpResponse: Отображает страницу истории.
+    """
+    names = [name for name in request.GET.getlist('city') if name.strip()]
+    if not names:
+        names = [city['city_name'] for city in services.favorite_cities(request.user)]
+    try:
+        days = min(max(int(request.GET.get('days', 30)), 1), 365)
+    except ValueError:
+        days = 30
+
+    cities = {}
+    for name in names:
+        canonical = services.canonicalize_city(name)
+        if canonical is not None:
+            cities[canonical.id] = canonical
+
+    daily = observations.daily_summary(observations.load_history(cities, days=days))
+    comparison = observations.compare_cities(daily)
+    # Пропуски (NaN) в шаблоне выводятся как «—»
+    daily = daily.astype(object).where(daily.notna(), None)
+    comparison = comparison.astype(object).where(comparison.notna(), None)
+
+    context = {
+        'cities': [city.name for city in cities.values()],
+        'days': days,
+        'daily': [
+            {'city': city, 'date': date, **row}
+            for (city, date), row in daily.to_dict('index').items()
+        ],
+        'comparison_columns': list(comparison.columns),
+        'comparison': [
+            {'date': date, 'values': list(row)}
+            for date, row in zip(comparison.index, comparison.itertuples(index=False))
+        ],
+    }
+    return render(request, 'weather/history.html', context)
+
+
+# Заголовок для файлов, которые никогда не меняются по своему адресу (как у WhiteNoise для файлов с хешем)
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=315360000, immutable'
+# Иконка по пути CDN может обновиться у провайдера: кэшируется на сутки и перепроверяется по ETag
+ICON_CACHE_CONTROL = 'public, max-age=86400'
+
+
+def icon_view(request, path):
+    """
+    Отдаёт иконку погоды из локального кэша вместо CDN провайдера.
+
+    При первом обращении иконка скачивается с CDN и сохраняется на диск; дальше отдаётся
+    с ETag по хешу содержимого. Вечно кэшируется только спрайт, адрес которого содержит хеш.
+    Если CDN недоступен, браузер перенаправляется на адрес иконки в ICON_UPSTREAM_BASE.
+
+    Параметры:
+        request (HttpRequest): Запрос пользователя.
+        path (str): Путь иконки ('64x64/day/113.png') или собранного спрайта ('sprite-<хеш>.png').
+
+    Возвращает:
+        HttpResponse: PNG-файл, 304 Not Modified или редирект на CDN.
+    """
+    cache = icons.get_icon_cache()
+    sprite = icons.SPRITE_PATH_RE.match(path)
+    if sprite:
+        digest = sprite['digest']
+        file_path = cache.object_file(digest)
+        if not os.path.exists(file_path):
+            raise Http404('Спрайт не найден.')
+        cache_control = IMMUTABLE_CACHE_CONTROL
+    elif icons.ICON_PATH_RE.match(path):
+        try:
+            digest, file_path = cache.get(path)
+        except services.WeatherServiceError:
+            return redirect(cache.upstream_base + path)
+        cache_control = ICON_CACHE_CONTROL
+    else:
+        raise Http404('Иконка не найдена.')
+
+    etag = f'"{digest}"'
+    if request.headers.get('If-None-Match') == etag:
+        response = HttpResponseNotModified()
+    else:
+        response = FileResponse(open(file_path, 'rb'), content_type='image/png')
+    response['ETag'] = etag
+    response['Cache-Control'] = cache_control
+    return response
+
+
+@staff_member_required
+def profiles_view(request):
+    """
+    Страница администратора со списком профилей медленных и профилированных запросов.
+
+    Профили хранятся в кольцевом буфере каждого процесса (см. profiling.ProfilingMiddleware),
+    поэтому показываются запросы, обработанные тем же воркером.
+
+    Параметры:
+        request (HttpRequest): Запрос сотрудника.
+
+    Возвращает:
+        HttpResponse: Таблица профилей с разбивкой времени по фазам.
+    """
+    context = {
+        **admin.site.each_context(request),
+        'title': 'Профили запросов',
+        'profiles': profiling.recent_profiles(),
+        'threshold': settings.PROFILING_SLOW_THRESHOLD,
+        'limiters': concurrency.limiters_snapshot() if settings.CONCURRENCY_LIMIT_ENABLED else [],
+    }
+    return render(request, 'admin/weather/profiles.html', context)
+
+
+@staff_member_required
+def profile_detail_view(request, profile_id):
+    """
+    Страница администратора с профилем одного запроса: фазы и самые частые стеки.
+
+    Параметры:
+        request (HttpRequest): Запрос сотрудника.
+        profile_id (str): Идентификатор профиля (заголовок X-Profile-Id).
+
+    Возвращает:
+        HttpResponse: Подробности профиля или 404, если его уже вытеснили из буфера.
+    """
+    profile = profiling.get_profile(profile_id)
+    if profile is None:
+        raise Http404('Профиль не найден.')
+    context = {
+        **admin.site.each_context(request),
+        'title': f'Профиль {profile.method} {profile.path}',
+        'profile': profile,
+        'stacks': profile.stacks.most_common(20),
+    }
+    return render(request, 'admin/weather/profile_detail.html', context)
+
+
+@staff_member_required
+def profile_folded_view(request, profile_id):
+    """
+    Отдаёт стеки профиля в свёрнутом формате для flamegraph.pl или speedscope.
+    """
+    profile = profiling.get_profile(profile_id)
+    if profile is None:
+        raise Http404('Профиль не найден.')
+    response = HttpResponse(profile.folded(), content_type='text/plain; charset=utf-8')
+    response['Content-Disposition'] = f'attachment; filename="profile-{profile.id}.folded"'
+    return response
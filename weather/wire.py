@@ -0,0 +1,201 @@
+import json
+import uuid
+import zlib
+
+from .lazy import lazy_import
+
+msgpack = lazy_import('msgpack')
+
+try:
+    zstandard = lazy_import('zstandard')
+except ModuleNotFoundError:  # zstandard необязателен: без него используется zlib
+    zstandard = None
+
+# Подпротоколы WebSocket чата: клиент перечисляет поддерживаемые, сервер выбирает первый известный
+BINARY_SUBPROTOCOL = 'chat.msgpack'
+TEXT_SUBPROTOCOL = 'chat.json'
+
+# Первый байт бинарного кадра — способ сжатия остатка
+CODEC_NONE = 0
+CODEC_ZLIB = 1
+CODEC_ZSTD = 2
+
+# Предел размера распакованной записи channel layer: защита от «zip-бомбы»
+MAX_DECOMPRESSED_SIZE = 1 << 20
+
+# Максимальная длина сообщения чата от клиента (символы)
+MAX_MESSAGE_LENGTH = 4000
+
+# Тип события channel layer -> код в компактной записи и обратно
+EVENT_CODES = {'chat.message': 0, 'chat.typing': 1, 'chat.presence': 2}
+EVENT_TYPES = {code: kind for kind, code in EVENT_CODES.items()}
+# Тип события, которым компактная запись передаётся через channel layer
+PACKED_EVENT = 'chat.packed'
+
+
+def compress(payload, threshold, codec=None):
+    """
+    Добавляет к данным байт-заголовок и сжимает их, если они не короче threshold байт.
+
+    Параметры:
+        payload (bytes): Данные.
+        threshold (int): Минимальный размер для сжатия (0 — не сжимать).
+        codec (int): CODEC_ZLIB или CODEC_ZSTD; по умолчанию zstd, если установлен.
+
+    Возвращает:
+        bytes: Кадр (заголовок + данные). Сжатие не применяется, если не уменьшает размер.
+    """
+    if threshold and len(payload) >= threshold:
+        if codec is None:
+            codec = CODEC_ZSTD if zstandard is not None else CODEC_ZLIB
+        if codec == CODEC_ZSTD:
+            compressed = zstandard.ZstdCompressor(level=3).compress(payload)
+        else:
+            compressed = zlib.compress(payload, 6)
+        if len(compressed) < len(payload):
+            return bytes((codec,)) + compressed
+    return bytes((CODEC_NONE,)) + payload
+
+
+def decompress(frame, max_size=MAX_DECOMPRESSED_SIZE):
+    """
+    Восстанавливает данные из кадра, созданного compress.
+
+    Исключения:
+        ValueError: Неизвестный способ сжатия, zstd без пакета zstandard или данные длиннее max_size байт.
+    """
+    codec, payload = frame[0], frame[1:]
+    if codec == CODEC_NONE:
+        return payload
+    if codec == CODEC_ZLIB:
+        decompressor = zlib.decompressobj()
+        try:
+            data = decompressor.decompress(payload, max_size + 1)
+        except zlib.error as e:
+            raise ValueError(f'Повреждённый кадр zlib: {e}') from e
+    elif codec == CODEC_ZSTD:
+        if zstandard is None:
+            raise ValueError('Кадр сжат zstd, но пакет zstandard не установлен')
+        chunks, size = [], 0
+        try:
+            with zstandard.ZstdDecompressor().stream_reader(payload) as reader:
+                while size <= max_size:
+                    chunk = reader.read(max_size + 1 - size)
+                    if not chunk:
+                        break
+                    chunks.append(chunk)
+                    size += len(chunk)
+        except zstandard.ZstdError as e:
+            raise ValueError(f'Повреждённый кадр zstd: {e}') from e
+        data = b''.join(chunks)
+    else:
+        raise ValueError(f'Неизвестный способ сжатия кадра: {codec}')
+    if len(data) > max_size:
+        raise ValueError(f'Кадр после распаковки больше {max_size} байт')
+    return data
+
+
+def pack_event(event, compress_threshold=0):
+    """
+    Кодирует событие чата для channel layer позиционным массивом msgpack, без повторяющихся ключей.
+
+    Параметры:
+        event (dict): Событие ('chat.message', 'chat.typing' или 'chat.presence').
+        compress_threshold (int): Сжимать записи не короче этого размера (0 — не сжимать).
+
+    Возвращает:
+        dict: Событие {'type': 'chat.packed', 'p': bytes} для group_send.
+    """
+    kind = event['type']
+    if kind == 'chat.message':
+        fields = [event['username'], event['message']]
+    elif kind == 'chat.typing':
+        fields = [event['username']]
+    elif kind == 'chat.presence':
+        fields = [uuid.UUID(hex=event['hub']).bytes, event['users'], event.get('request', False)]
+    else:
+        raise ValueError(f'Неизвестный тип события чата: {kind}')
+    payload = msgpack.packb([EVENT_CODES[kind], *fields], use_bin_type=True)
+    return {'type': PACKED_EVENT, 'p': compress(payload, compress_threshold)}
+
+
+def unpack_event(event):
+    """
+    Восстанавливает событие чата из записи, созданной pack_event.
+    """
+    code, *fields = msgpack.unpackb(decompress(event['p']), raw=False)
+    kind = EVENT_TYPES[code]
+    if kind == 'chat.message':
+        return {'type': kind, 'username': fields[0], 'message': fields[1]}
+    if kind == 'chat.typing':
+        return {'type': kind, 'username': fields[0]}
+    return {'type': kind, 'hub': uuid.UUID(bytes=fields[0]).hex, 'users': fields[1], 'request': fields[2]}
+
+
+def encode_text_frame(frame):
+    """
+    Кодирует пакет событий для текстового (JSON) протокола WebSocket.
+    """
+    return json.dumps(frame, ensure_ascii=False)
+
+
+def encode_binary_frame(frame, compress_threshold=0):
+    """
+    Кодирует пакет событий для бинарного протокола WebSocket ('chat.msgpack').
+
+    Кадр — байт сжатия (0 — нет, 1 — zlib) и msgpack-словарь с короткими ключами:
+    'm' — сообщения [[имя, текст], ...], 't' — кто печатает, 'p' — кто онлайн.
+    В браузере zlib распаковывается штатным DecompressionStream('deflate'), поэтому zstd здесь не используется.
+    """
+    compact = {}
+    if 'messages' in frame:
+        compact['m'] = [[message['username'], message['message']] for message in frame['messages']]
+    if 'typing' in frame:
+        compact['t'] = frame['typing']
+    if 'presence' in frame:
+        compact['p'] = frame['presence']
+    return compress(msgpack.packb(compact, use_bin_type=True), compress_threshold, codec=CODEC_ZLIB)
+
+
+def decode_binary_frame(data):
+    """
+    Декодирует бинарный кадр в пакет событий того же вида, что и у текстового протокола.
+    """
+    compact = msgpack.unpackb(decompress(data), raw=False)
+    frame = {'type': 'batch'}
+    if 'm' in compact:
+        frame['messages'] = [{'username': username, 'message': message} for username, message in compact['m']]
+    if 't' in compact:
+        frame['typing'] = compact['t']
+    if 'p' in compact:
+        frame['presence'] = compact['p']
+    return frame
+
+
+def decode_client_message(text_data=None, bytes_data=None):
+    """
+    Декодирует сообщение клиента: JSON-текст или msgpack-словарь (с байтом сжатия) в бинарном протоколе.
+
+    Сжатые кадры от клиентов не принимаются: сообщения чата короткие, а распаковка чужих
+    данных позволила бы «zip-бомбой» занять память воркера.
+
+    Возвращает:
+        dict: {'typing': True} или {'message': str} не длиннее MAX_MESSAGE_LENGTH.
+
+    Исключения:
+        ValueError: Кадр сжат, некорректен или не является сообщением чата.
+    """
+    if bytes_data is not None:
+        if not bytes_data or bytes_data[0] != CODEC_NONE:
+            raise ValueError('Ожидается несжатый кадр msgpack')
+        data = msgpack.unpackb(bytes_data[1:], raw=False)
+    else:
+        data = json.loads(text_data)
+    if not isinstance(data, dict):
+        raise ValueError('Ожидается объект')
+    if data.get('typing') is True:
+        return {'typing': True}
+    message = data.get('message')
+    if not isinstance(message, str) or not message or len(message) > MAX_MESSAGE_LENGTH:
+        raise ValueError(f'Ожидается строка message длиной от 1 до {MAX_MESSAGE_LENGTH} символов')
+    return {'message': message}
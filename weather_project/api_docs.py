@@ -0,0 +1,57 @@
+"""
+Ленивое построение представлений документации API (Swagger / ReDoc).
+
+drf_yasg и генератор схемы импортируются только при первом обращении к '/swagger/',
+'/redoc/' или '/swagger.json', а не при загрузке URLConf — это ускоряет старт воркеров.
+"""
+from functools import lru_cache
+
+from django.views.decorators.csrf import csrf_exempt
+
+
+@lru_cache(maxsize=None)
+def get_schema_view():
+    """
+    Создаёт (один раз на процесс) представление схемы API drf_yasg.
+
+    Возвращает:
+        type: Класс представления, построенный drf_yasg.views.get_schema_view.
+    """
+    from drf_yasg import openapi
+    from drf_yasg.views import get_schema_view as build_schema_view
+    from rest_framework import permissions
+
+    return build_schema_view(
+        openapi.Info(
+            title="Weather API",
+            default_version='v1',
+            description="Документация  API",
+            terms_of_service="https://www.google.com/policies/terms/",
+            contact=openapi.Contact(email="support@gmail.com"),
+            license=openapi.License(name="BSD License"),
+        ),
+        public=True,
+        permission_classes=(permissions.AllowAny,),
+    )
+
+
+def lazy_schema_view(method, *args, **kwargs):
+    """
+    Возвращает view-функцию, которая строит настоящее представление схемы при первом вызове.
+
+    Параметры:
+        method (str): Имя метода класса схемы: 'with_ui' или 'without_ui'.
+        *args, **kwargs: Аргументы, передаваемые в этот метод.
+
+    Возвращает:
+        function: View-функция для использования в urlpatterns.
+    """
+    @lru_cache(maxsize=None)
+    def build():
+        return getattr(get_schema_view(), method)(*args, **kwargs)
+
+    @csrf_exempt
+    def view(request, *view_args, **view_kwargs):
+        return build()(request, *view_args, **view_kwargs)
+
+    return view
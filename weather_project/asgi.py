@@ -1,11 +1,15 @@
 import os
 from django.core.asgi import get_asgi_application
-from channels.routing import ProtocolTypeRouter, URLRouter
-from channels.auth import AuthMiddlewareStack
-from weather.routing import websocket_urlpatterns
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'weather_project.settings')
 
+# Django настраивается до импорта модулей, которые обращаются к моделям и настройкам
+django_asgi_app = get_asgi_application()
+
+from channels.routing import ProtocolTypeRouter, URLRouter  # noqa: E402
+from channels.auth import AuthMiddlewareStack  # noqa: E402
+from weather.routing import websocket_urlpatterns  # noqa: E402
+
 application = ProtocolTypeRouter({
     """
     Основной ASGI-приложение для маршрутизации запросов.
@@ -15,10 +19,10 @@ application = ProtocolTypeRouter({
     - WebSocket-запросы обрабатываются с помощью AuthMiddlewareStack и URLRouter, которые перенаправляют их на маршруты, определенные в websocket_urlpatterns.
 
     Параметры:
-        - "http": Обрабатывает обычные HTTP-запросы с помощью get_asgi_application().
+        - "http": Обрабатывает обычные HTTP-запросы с помощью get_asgi_application(), созданного при импорте модуля.
         - "websocket": Обрабатывает WebSocket-запросы с помощью AuthMiddlewareStack и URLRouter, используя маршруты из websocket_urlpatterns.
     """
-    "http": get_asgi_application(),
+    "http": django_asgi_app,
     "websocket": AuthMiddlewareStack(
         URLRouter(
             websocket_urlpatterns
@@ -19,20 +19,27 @@ from dotenv import load_dotenv
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
+load_dotenv()
+
 # Quick-start development settings - unsuitable for production
 # See https://docs.djangoproject.com/en/5.1/howto/deployment/checklist/
 
 # SECURITY WARNING: keep the secret key used in production secret!
-load_dotenv()
-
 SECRET_KEY = os.getenv('DJANGO_SECRET_KEY', 'default_secret_key')
 
-# SECURITY WARNING: don't run with debug turned on in production!
-load_dotenv()
-
 # Получаем API-ключ
 WEATHER_API_KEY = os.getenv('WEATHER_API_KEY')
 
+# Погодные провайдеры: основной (weatherapi.com) и резервный (open-meteo.com, без ключа)
+WEATHER_PRIMARY_URL = os.getenv('WEATHER_PRIMARY_URL', 'http://api.weatherapi.com/v1')
+WEATHER_SECONDARY_URL = os.getenv('WEATHER_SECONDARY_URL', 'https://api.open-meteo.com/v1')
+WEATHER_UPSTREAM_TIMEOUT = float(os.getenv('WEATHER_UPSTREAM_TIMEOUT', '5'))
+# Хедж-запрос к резервному провайдеру отправляется, если основной не ответил за этот перцентиль задержки
+WEATHER_HEDGE_PERCENTILE = float(os.getenv('WEATHER_HEDGE_PERCENTILE', '95'))
+# Максимальная доля запросов, которые могут быть продублированы хеджем
+WEATHER_HEDGE_BUDGET = float(os.getenv('WEATHER_HEDGE_BUDGET', '0.1'))
+
+# SECURITY WARNING: don't run with debug turned on in production!
 DEBUG = True
 
 ALLOWED_HOSTS = ['*']
@@ -48,6 +55,15 @@ CHANNEL_LAYERS = {
     },
 }
 
+# Общий для всех воркеров кэш Django: счётчики неудачных входов, прогресс фоновых удалений
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.getenv('CACHE_URL', os.getenv('REDIS_URL', 'redis://127.0.0.1:6379')),
+        'KEY_PREFIX': 'weather',
+    },
+}
+
 # Application definition
 
 INSTALLED_APPS = [
@@ -72,10 +88,25 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
+    'weather.profiling.ProfilingMiddleware',
+    'weather.concurrency.ConcurrencyLimitMiddleware',
 ]
 
 ROOT_URLCONF = 'weather_project.urls'
 
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': [
+        'weather.api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_AUTHENTICATION_CLASSES': [
+        'rest_framework.authentication.SessionAuthentication',
+    ],
+    'DEFAULT_PERMISSION_CLASSES': [
+        'rest_framework.permissions.IsAuthenticated',
+    ],
+}
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -158,3 +189,86 @@ STATICFILES_STORAGE = 'whitenoise.storage.CompressedManifestStaticFilesStorage'
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+# Встроенный список городов для автодополнения и канонизации названий
+CITY_LIST_PATH = os.path.join(BASE_DIR, 'weather', 'data', 'cities.csv')
+
+# Целевое время холодного старта воркера (мс), проверяется командой profile_startup
+COLD_START_BUDGET_MS = int(os.getenv('COLD_START_BUDGET_MS', '1500'))
+
+# Локальный кэш иконок погоды (прокси для CDN weatherapi.com, см. weather/icons.py)
+ICON_CACHE_DIR = os.getenv('ICON_CACHE_DIR', os.path.join(BASE_DIR, 'var', 'icons'))
+ICON_UPSTREAM_BASE = os.getenv('ICON_UPSTREAM_BASE', 'https://cdn.weatherapi.com/weather/')
+
+# Шина инвалидаций кэшей в памяти воркеров (Redis pub/sub; 'memory://' — без Redis, для одного процесса)
+CACHE_BUS_URL = os.getenv('CACHE_BUS_URL', os.getenv('REDIS_URL', 'redis://127.0.0.1:6379'))
+NEAR_CACHE_MAXSIZE = int(os.getenv('NEAR_CACHE_MAXSIZE', '10000'))
+# Как часто воркер сверяет версии с шиной, чтобы восстановиться после пропущенных сообщений (с)
+NEAR_CACHE_CHECK_INTERVAL = float(os.getenv('NEAR_CACHE_CHECK_INTERVAL', '5'))
+# Сколько воркер хранит ответ погодного API в памяти (с)
+WEATHER_CACHE_TTL = float(os.getenv('WEATHER_CACHE_TTL', '120'))
+# Сколько воркер хранит избранные города пользователя (с): предел устаревания, если инвалидация не разослана
+FAVORITES_CACHE_TTL = float(os.getenv('FAVORITES_CACHE_TTL', '300'))
+# Поиск погоды по координатам: радиус, в котором подходят кэшированные данные ближайшего города (км),
+# и размер ячейки пространственного индекса (градусы)
+NEARBY_RADIUS_KM = float(os.getenv('NEARBY_RADIUS_KM', '10'))
+NEARBY_GRID_DEG = float(os.getenv('NEARBY_GRID_DEG', '0.5'))
+# Шаг сетки (градусы), к центру ячейки которой привязывается точка без известного города поблизости
+NEARBY_SNAP_DEG = float(os.getenv('NEARBY_SNAP_DEG', '0.1'))
+
+# Чат: события комнаты отправляются клиентам пакетами раз в тик (с)
+CHAT_BATCH_TICK = float(os.getenv('CHAT_BATCH_TICK', '0.05'))
+# Минимальный интервал между событиями «печатает…» одного пользователя (с)
+CHAT_TYPING_DEBOUNCE = float(os.getenv('CHAT_TYPING_DEBOUNCE', '2'))
+# Период повторного объявления пользователей онлайн между процессами (с)
+CHAT_PRESENCE_HEARTBEAT = float(os.getenv('CHAT_PRESENCE_HEARTBEAT', '30'))
+# Формат событий чата в channel layer: 'msgpack' (компактный) или 'json' (словари как есть)
+CHAT_WIRE_FORMAT = os.getenv('CHAT_WIRE_FORMAT', 'msgpack')
+# События и бинарные кадры не короче этого размера (байт) сжимаются; 0 — не сжимать
+CHAT_COMPRESS_THRESHOLD = int(os.getenv('CHAT_COMPRESS_THRESHOLD', '1024'))
+
+# Ограничение попыток входа (счётчики в кэше Django; для нескольких воркеров кэш должен быть общим)
+LOGIN_THROTTLE_ATTEMPTS = int(os.getenv('LOGIN_THROTTLE_ATTEMPTS', '5'))  # неудач на имя пользователя с одного IP
+LOGIN_THROTTLE_IP_ATTEMPTS = int(os.getenv('LOGIN_THROTTLE_IP_ATTEMPTS', '50'))  # неудач с одного IP
+LOGIN_THROTTLE_WINDOW = int(os.getenv('LOGIN_THROTTLE_WINDOW', '300'))  # длительность окна (с)
+# Количество доверенных прокси перед приложением (адрес клиента берётся из X-Forwarded-For); 0 — REMOTE_ADDR
+LOGIN_THROTTLE_PROXY_COUNT = int(os.getenv('LOGIN_THROTTLE_PROXY_COUNT', '0'))
+
+# Профилирование запросов (weather/profiling.py): включается явно (PROFILING_ENABLED=True), иначе
+# middleware отключается при старте и не замеряет фазы каждого запроса
+PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', 'False') == 'True'
+# Запросы дольше порога (с) сохраняются в кольцевой буфер процесса из PROFILING_BUFFER_SIZE записей
+PROFILING_SLOW_THRESHOLD = float(os.getenv('PROFILING_SLOW_THRESHOLD', '1.0'))
+PROFILING_BUFFER_SIZE = int(os.getenv('PROFILING_BUFFER_SIZE', '50'))
+# Доля запросов, профилируемых выборкой стеков (кроме запросов сотрудников с заголовком X-Profile: 1)
+PROFILING_SAMPLE_RATE = float(os.getenv('PROFILING_SAMPLE_RATE', '0'))
+# Период выборки стеков (с)
+PROFILING_INTERVAL = float(os.getenv('PROFILING_INTERVAL', '0.005'))
+
+# Адаптивное ограничение параллельных запросов (weather/concurrency.py); False — middleware отключается
+CONCURRENCY_LIMIT_ENABLED = os.getenv('CONCURRENCY_LIMIT_ENABLED', 'True') == 'True'
+# Ограничиваемые маршруты: имя -> (класс, вид данных в near-cache, при наличии которых запрос не ограничивается)
+CONCURRENCY_ROUTES = {
+    'weather': ('upstream', 'current'),
+    'forecast': ('upstream', 'forecast'),
+    'v1:weather': ('upstream', 'current'),
+    'v1:forecast': ('upstream', 'forecast'),
+    'v1:forecast-hourly': ('upstream', 'forecast'),
+    'history': ('db', None),
+    'statistics': ('db', None),
+    'v1:stats': ('db', None),
+    'v1:stats-cities': ('db', None),
+}
+# Лимиты классов на процесс: начальный, минимальный, максимальный и целевая задержка ответа (с).
+# Максимум меньше числа потоков воркера (Procfile: --threads 8), чтобы дешёвым страницам оставались потоки
+CONCURRENCY_CLASSES = {
+    'upstream': {'initial': 4, 'min': 1, 'max': 6, 'target': float(os.getenv('CONCURRENCY_UPSTREAM_TARGET', '1.5'))},
+    'db': {'initial': 4, 'min': 1, 'max': 6, 'target': float(os.getenv('CONCURRENCY_DB_TARGET', '0.5'))},
+}
+# Маршруты, для которых при перегрузке отдаётся последний удачный ответ не старше CONCURRENCY_STALE_TTL (с)
+CONCURRENCY_STALE_ROUTES = ('v1:weather', 'v1:forecast', 'v1:forecast-hourly')
+CONCURRENCY_STALE_TTL = float(os.getenv('CONCURRENCY_STALE_TTL', '900'))
+# Сколько таких ответов хранит воркер (отдельно от near-cache)
+CONCURRENCY_STALE_MAXSIZE = int(os.getenv('CONCURRENCY_STALE_MAXSIZE', '2000'))
+# Значение Retry-After (с) в ответах 503
+CONCURRENCY_RETRY_AFTER = int(os.getenv('CONCURRENCY_RETRY_AFTER', '2'))
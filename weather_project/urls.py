@@ -1,24 +1,9 @@
 from django.contrib import admin
-from django.urls import path, re_path
-from drf_yasg import openapi
-from drf_yasg.views import get_schema_view
-from rest_framework import permissions
+from django.urls import include, path, re_path
 
 from weather import views
+from weather_project.api_docs import lazy_schema_view
 
-# Создаем представление для отображения схемы API
-schema_view = get_schema_view(
-    openapi.Info(
-        title="Weather API",
-        default_version='v1',
-        description="Документация  API",
-        terms_of_service="https://www.google.com/policies/terms/",
-        contact=openapi.Contact(email="support@gmail.com"),
-        license=openapi.License(name="BSD License"),
-    ),
-    public=True,
-    permission_classes=(permissions.AllowAny,),
-)
 """
 Список маршрутов URL для приложения.
 
@@ -29,15 +14,23 @@ schema_view = get_schema_view(
 - Путь 'register' и 'login' обрабатывают страницы регистрации и авторизации пользователя.
 - Путь 'favorites' и 'add-favorite' обрабатывают действия с избранными городами.
 - Путь 'chat' обрабатывает сообщения чата.
+- Путь 'history' показывает историю погоды по сохранённым наблюдениям.
+- Путь 'admin/profiles/' показывает сотрудникам профили медленных запросов (стеки — в формате flamegraph).
+- Путь 'icons/<path>' отдаёт иконки погоды из локального кэша вместо CDN провайдера.
+- Путь 'api/v1/' содержит JSON REST API (погода, прогноз, избранное, чат, статистика).
 
 Пример документации API доступен по маршруту 'swagger/' и 'redoc/'.
+Представления документации создаются лениво, при первом обращении к этим маршрутам.
 """
 urlpatterns = [
     path('remove-favorite/<int:city_id>/', views.remove_favorite_city, name='remove_favorite'),
-    re_path(r'^swagger(?P<format>\.json|\.yaml)$', schema_view.without_ui(cache_timeout=0), name='schema-json'),
+    re_path(r'^swagger(?P<format>\.json|\.yaml)$', lazy_schema_view('without_ui', cache_timeout=0), name='schema-json'),
+    path('admin/profiles/', views.profiles_view, name='profiles'),
+    path('admin/profiles/<str:profile_id>/', views.profile_detail_view, name='profile_detail'),
+    path('admin/profiles/<str:profile_id>/folded/', views.profile_folded_view, name='profile_folded'),
     path('admin/', admin.site.urls),
-    path('swagger/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
-    path('redoc/', schema_view.with_ui('redoc', cache_timeout=0), name='schema-redoc'),
+    path('swagger/', lazy_schema_view('with_ui', 'swagger', cache_timeout=0), name='schema-swagger-ui'),
+    path('redoc/', lazy_schema_view('with_ui', 'redoc', cache_timeout=0), name='schema-redoc'),
     path('register/', views.register_view, name='register'),
     path('login/', views.login_view, name='login'),
     path('logout/', views.logout_view, name='logout'),
@@ -48,5 +41,8 @@ urlpatterns = [
     path('chat/', views.chat_view, name='chat'),
     path('index/', views.index_view, name='home'),
     path('statistics/', views.statistics_view, name='statistics'),
+    path('history/', views.history_view, name='history'),
+    path('icons/<path:path>', views.icon_view, name='icon'),
+    path('api/v1/', include('weather.api.urls', namespace='v1')),
 
 ]